@@ -15,13 +15,36 @@ naming_convention = {
 db = SQLAlchemy(metadata=MetaData(naming_convention=naming_convention))
 
 
-def create_app(config_name='default'):
+def create_app(config_name='default', create_all=False):
+    """
+    :param create_all: create the missing tables, they are otherwise created by the init-db and load_data commands
+    """
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     app.config['JSON_AS_ASCII'] = False
     db.init_app(app)
-    db.app = app
-    db.create_all()
+    # no global db.app, database access needs an app context, so many apps can live in one process
+    if create_all:
+        db.create_all(app=app)
+
+    from services.snapshot import railway_data_cache
+    railway_data_cache.max_size = app.config['RAILWAY_DATA_CACHE_SIZE']
+    if app.config['NETWORK_FILE']:
+        from services.network_file import NetworkFile
+        railway_data_cache.source = NetworkFile(app.config['NETWORK_FILE'])
+        railway_data_cache.invalidate()
+    elif railway_data_cache.source is not None:
+        railway_data_cache.source = None
+        railway_data_cache.invalidate()
+
+    from services.response_cache import search_result_cache
+    search_result_cache.max_size = app.config['SEARCH_CACHE_SIZE']
+    search_result_cache.ttl = app.config['SEARCH_CACHE_TTL']
+    search_result_cache.time_bucket = app.config['SEARCH_CACHE_TIME_BUCKET']
+
+    from services.matrix import matrix_pool
+    matrix_pool.workers = app.config['MATRIX_WORKERS']
+    matrix_pool.chunk_size = app.config['MATRIX_CHUNK_SIZE']
 
     from controllers import api
 
@@ -30,5 +53,14 @@ def create_app(config_name='default'):
 
 
 if __name__ == '__main__':
-    app = create_app()
+    import os
+
+    from services.snapshot import start_warm_up
+
+    # the development server creates the missing tables itself
+    app = create_app(create_all=True)
+    # the reloader serves from a child process, this one only watches the files and starts it again,
+    # the server doesn't fork workers, so the warm-up only builds the snapshots
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warm_up(app)
     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=True)
@@ -0,0 +1,319 @@
+import csv
+import gc
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from config import basedir
+from services.bfs import MetroLineSearch
+from services.matrix import MatrixPool, MatrixSearch
+from services.response_cache import search_result_cache
+from services.snapshot import get_railway_data
+
+STATION_MAP_FILE = os.path.join(basedir, 'StationMap.csv')
+
+# 2021-01-15 is a Friday, one departure in each time type, and one whose trips cross the closing of lines at 22:00
+DEPARTURE_TIMES = {
+    'peak': '2021-01-15 07:30',
+    'non-peak': '2021-01-15 13:00',
+    'night': '2021-01-15 22:30',
+    'evening': '2021-01-15 20:50'
+}
+
+ORDER_BY = ('distance', 'time')
+
+# matrix departures, the trips of the peak one cross the end of the peak, the night ones the lines opening at 06:00
+MATRIX_DEPARTURE_TIMES = {
+    'non-peak': '2021-01-15 13:00',
+    'peak': '2021-01-15 08:30',
+    'night': '2021-01-15 21:30'
+}
+# max number of origins, and of destinations, of the matrix scenarios
+MATRIX_SIZE = 200
+
+# queries traced for peak memory in each scenario, tracing slows searches down a lot
+MEMORY_SAMPLE_SIZE = 200
+
+# run in a new interpreter, so the imports are timed cold, prints the timings in ms as json,
+# and the heap a worker holds for one more snapshot of the same source, traced after the timings
+STARTUP_SCRIPT = '''
+import json, sys, time, tracemalloc
+started = time.perf_counter()
+from app import create_app
+from services.routes import RailwayData
+from services.snapshot import preload_railway_data, railway_data_cache
+imported = time.perf_counter()
+app = create_app(sys.argv[1], create_all=False)
+created = time.perf_counter()
+if sys.argv[2] != 'lazy':
+    preload_railway_data(app, [sys.argv[3][:10]])
+warmed = time.perf_counter()
+response = app.test_client().get('/api/search', query_string={'from': sys.argv[4], 'to': sys.argv[5],
+                                                              'time': sys.argv[3], 'order_by': 'time'})
+responded = time.perf_counter()
+with app.app_context():
+    tracemalloc.start()
+    railway_data = RailwayData(sys.argv[3][:10], railway_data_cache.source)
+    snapshot_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+print(json.dumps({'status': response.status_code, 'import_ms': (imported - started) * 1000,
+                  'create_app_ms': (created - imported) * 1000, 'warm_up_ms': (warmed - created) * 1000,
+                  'first_response_ms': (responded - warmed) * 1000, 'total_ms': (responded - started) * 1000,
+                  'snapshot_kb': snapshot_size / 1024}))
+'''
+
+# file is eager with the snapshot read from a network file, the network and distance table arrays are read in place
+STARTUP_MODES = ('lazy', 'eager', 'file')
+
+
+def load_station_names(path=STATION_MAP_FILE):
+    names = []
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        csv_data = csv.reader(file)
+        next(csv_data, None)
+        for row in csv_data:
+            name = row[1].strip()
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def percentile(values, percent):
+    """
+    nearest rank percentile of sorted values
+    """
+    if not values:
+        return 0.0
+    rank = max(int(math.ceil(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class SearchBenchmark(object):
+    """
+    Time route searches over every station pair of StationMap.csv,
+    for both order_by and a departure in peak, non-peak and night time, and one crossing the closing of lines
+
+    search is MetroLineSearch.run on a warm snapshot, it also counts the nodes expanded by each engine,
+    api is the full /api/search request through the flask test client.
+    matrix times one /api/matrix search of up to MATRIX_SIZE stations to the same stations, in the calling process
+    and by a pool of MATRIX_WORKERS processes.
+    the search result cache is disabled while running so every query is searched.
+    stride only keeps every stride-th station, to get a quicker run on the same shape of pairs.
+    with config_name, the time from a cold import to the first /api/search response is measured too,
+    lazy builds the snapshot in the first request, eager warms it up before, file warms it up from a network file
+    """
+
+    def __init__(self, app, engines=('bfs', 'dijkstra', 'bidirectional', 'patterns'), paths=('search', 'api', 'matrix'),
+                 stride=1, departure_times=None, config_name=None):
+        self.app = app
+        self.config_name = config_name
+        self.engines = engines
+        self.paths = paths
+        self.stride = max(stride, 1)
+        self.departure_times = departure_times or DEPARTURE_TIMES
+        self.station_names = load_station_names()[::self.stride]
+
+    def get_pairs(self):
+        return [(from_station, to_station) for from_station in self.station_names
+                for to_station in self.station_names if from_station != to_station]
+
+    def run(self):
+        pairs = self.get_pairs()
+        report = {
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': self._get_commit(),
+            'python': platform.python_version(),
+            'stride': self.stride,
+            'pairs': len(pairs),
+            'scenarios': []
+        }
+
+        cache_size = search_result_cache.max_size
+        search_result_cache.max_size = 0
+        try:
+            with self.app.app_context():
+                for path in self.paths:
+                    if path == 'matrix':
+                        report['matrix'] = [self._run_matrix(mode, window, departure_time)
+                                            for mode in ('process', 'pool')
+                                            for window, departure_time in MATRIX_DEPARTURE_TIMES.items()]
+                        continue
+                    for engine in self.engines:
+                        for order_by in ORDER_BY:
+                            if engine == 'bidirectional' and order_by == 'time':
+                                # searched by dijkstra
+                                continue
+                            for window, departure_time in self.departure_times.items():
+                                report['scenarios'].append(
+                                    self._run_scenario(path, engine, order_by, window, departure_time, pairs))
+        finally:
+            search_result_cache.max_size = cache_size
+        if self.config_name:
+            report['startup'] = [self._run_startup(mode, pairs[0]) for mode in STARTUP_MODES]
+        return report
+
+    def _run_startup(self, mode, pair):
+        departure_time = next(iter(self.departure_times.values()))
+        env = dict(os.environ)
+        env.pop('RAILWAY_NETWORK_FILE', None)
+        directory = None
+        if mode == 'file':
+            from services.network_file import compile_network_file
+
+            directory = tempfile.mkdtemp(prefix='railway-benchmark-')
+            env['RAILWAY_NETWORK_FILE'] = os.path.join(directory, 'railway.network')
+            with self.app.app_context():
+                compile_network_file(env['RAILWAY_NETWORK_FILE'], since=departure_time[:10])
+        try:
+            output = subprocess.check_output(
+                [sys.executable, '-c', STARTUP_SCRIPT, self.config_name, mode, departure_time, *pair], cwd=basedir,
+                env=env)
+        finally:
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+        timings = json.loads(output.decode().strip().splitlines()[-1])
+        startup = {'mode': mode, 'status': timings.pop('status')}
+        startup.update({key: round(value, 3) for key, value in timings.items()})
+        return startup
+
+    def _run_scenario(self, path, engine, order_by, window, departure_time, pairs):
+        query = self._get_query(path, engine, order_by, departure_time)
+        # warm up the snapshot and the precomputed tables
+        query(*pairs[0])
+
+        gc.collect()
+        latencies = []
+        expansions = []
+        started = time.perf_counter()
+        for from_station, to_station in pairs:
+            query_started = time.perf_counter()
+            expanded = query(from_station, to_station)
+            latencies.append((time.perf_counter() - query_started) * 1000)
+            if expanded is not None:
+                expansions.append(expanded)
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        for from_station, to_station in pairs[:MEMORY_SAMPLE_SIZE]:
+            query(from_station, to_station)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        latencies.sort()
+        expansions.sort()
+        return {
+            'path': path,
+            'engine': engine,
+            'order_by': order_by,
+            'window': window,
+            'time': departure_time,
+            'queries': len(latencies),
+            'p50_ms': round(percentile(latencies, 50), 4),
+            'p95_ms': round(percentile(latencies, 95), 4),
+            'p99_ms': round(percentile(latencies, 99), 4),
+            'max_ms': round(latencies[-1], 4) if latencies else 0,
+            'throughput_qps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+            'peak_memory_kb': round(peak_memory / 1024.0, 1),
+            'nodes_expanded_mean': round(sum(expansions) / len(expansions), 2) if expansions else None,
+            'nodes_expanded_p99': percentile(expansions, 99) if expansions else None
+        }
+
+    def _run_matrix(self, mode, window, departure_time):
+        stations = self.station_names[:MATRIX_SIZE]
+        workers = self.app.config['MATRIX_WORKERS'] if mode == 'pool' else 0
+        pool = MatrixPool(workers, self.app.config['MATRIX_CHUNK_SIZE'])
+        railway_data = get_railway_data(departure_time[:10])
+        try:
+            # warm up the snapshot and the pool processes
+            MatrixSearch(stations, stations, departure_time, railway_data, pool).generate_matrix()
+            started = time.perf_counter()
+            result = MatrixSearch(stations, stations, departure_time, railway_data, pool).generate_matrix()
+            elapsed = time.perf_counter() - started
+        finally:
+            pool.shutdown()
+        return {
+            'mode': mode,
+            'workers': workers,
+            'window': window,
+            'time': departure_time,
+            'size': len(stations),
+            'result': result['result'],
+            'elapsed_ms': round(elapsed * 1000, 3),
+            'origin_ms': round(elapsed * 1000 / len(stations), 4) if stations else 0
+        }
+
+    def _get_query(self, path, engine, order_by, departure_time):
+        if path == 'api':
+            client = self.app.test_client()
+
+            def query(from_station, to_station):
+                client.get('/api/search', query_string={'from': from_station, 'to': to_station,
+                                                        'time': departure_time, 'order_by': order_by,
+                                                        'engine': engine})
+            return query
+
+        railway_data = get_railway_data(departure_time[:10])
+
+        def query(from_station, to_station):
+            context = MetroLineSearch(from_station, to_station, departure_time, order_by, railway_data, engine).run()
+            return context.stats.counters.get('nodes_expanded', 0)
+        return query
+
+    @staticmethod
+    def _get_commit():
+        try:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=basedir,
+                                           stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ''
+
+
+def save_report(report, path):
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+
+
+def compare_reports(old_report, new_report):
+    """
+    :return: list of lines, p50/p99 and throughput change of every scenario in both reports
+    """
+    def key(scenario):
+        return scenario['path'], scenario['engine'], scenario['order_by'], scenario['window']
+
+    old_scenarios = {key(scenario): scenario for scenario in old_report['scenarios']}
+    lines = []
+    for scenario in new_report['scenarios']:
+        old = old_scenarios.get(key(scenario))
+        if old is None:
+            continue
+        lines.append('{:<6} {:<8} {:<8} {:<8} p50 {:>9.3f} -> {:>9.3f} ms  p99 {:>9.3f} -> {:>9.3f} ms  '
+                     '{:>9.1f} -> {:>9.1f} qps'.format(*key(scenario), old['p50_ms'], scenario['p50_ms'],
+                                                       old['p99_ms'], scenario['p99_ms'],
+                                                       old['throughput_qps'], scenario['throughput_qps']))
+
+    old_matrices = {(matrix['mode'], matrix['window']): matrix for matrix in old_report.get('matrix', [])}
+    for matrix in new_report.get('matrix', []):
+        old = old_matrices.get((matrix['mode'], matrix['window']))
+        if old is None:
+            continue
+        lines.append('matrix {:<7} {:<8} {:>3} x {:<3} {:>11.3f} -> {:>11.3f} ms'.format(
+            matrix['mode'], matrix['window'], matrix['size'], matrix['size'], old['elapsed_ms'], matrix['elapsed_ms']))
+
+    old_startups = {startup['mode']: startup for startup in old_report.get('startup', [])}
+    for startup in new_report.get('startup', []):
+        old = old_startups.get(startup['mode'])
+        if old is None:
+            continue
+        lines.append('startup {:<6} import {:>9.3f} -> {:>9.3f} ms  first response {:>9.3f} -> {:>9.3f} ms  '
+                     'total {:>9.3f} -> {:>9.3f} ms'.format(startup['mode'], old['import_ms'], startup['import_ms'],
+                                                          old['first_response_ms'], startup['first_response_ms'],
+                                                          old['total_ms'], startup['total_ms']))
+    return lines
@@ -1,11 +1,82 @@
-from collections import Iterable
+from collections.abc import Iterable
+
+PRIMARY_TYPES = (str, int, float)
+
+# class -> compiled serialize function, filled on first use
+_serializers = {}
+
+
+def serialize_value(field):
+    """
+    serialize one field value, same rules as Serializable._serialize_complex_field
+    """
+    cls = field.__class__
+    if cls in PRIMARY_TYPES:
+        return field
+
+    # plain lists and dicts of primary values are the bulk of a route, keep them off the recursion
+    if cls is list:
+        return [item if item.__class__ in PRIMARY_TYPES else serialize_value(item) for item in field]
+    if cls is dict:
+        return {key if key.__class__ in PRIMARY_TYPES else serialize_value(key):
+                value if value.__class__ in PRIMARY_TYPES else serialize_value(value)
+                for key, value in field.items()}
+
+    if isinstance(field, PRIMARY_TYPES):
+        return field
+
+    if hasattr(field, 'serialize'):
+        return field.serialize()
+
+    if isinstance(field, dict):
+        return {serialize_value(key): serialize_value(value) for key, value in field.items()}
+
+    if isinstance(field, (list, tuple)):
+        return [serialize_value(item) for item in field]
+
+    return None
+
+
+def _field_names(cls):
+    names = []
+    for klass in reversed(cls.__mro__):
+        for name in klass.__dict__.get('__slots__', ()):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def compile_serializer(cls):
+    """
+    generate the serialize function of a class with __slots__,
+    a field is formatted by its get_<field> method if the class has one, otherwise serialized by its value
+    """
+    lines = ['def serialize(self):', '    return {']
+    for name in _field_names(cls):
+        if hasattr(cls, 'get_{}'.format(name)):
+            lines.append('        {0!r}: self.get_{0}(),'.format(name))
+        else:
+            lines.append('        {0!r}: _value(self.{0}),'.format(name))
+    lines.append('    }')
+
+    namespace = {'_value': serialize_value}
+    exec('\n'.join(lines), namespace)
+    serializer = namespace['serialize']
+    _serializers[cls] = serializer
+    return serializer
 
 
 class Serializable(object):
+    __slots__ = ()
+
     def serialize(self):
+        if not hasattr(self, '__dict__'):
+            cls = self.__class__
+            serializer = _serializers.get(cls) or compile_serializer(cls)
+            return serializer(self)
+
         data = {}
-        field_list = self.__slots__ if hasattr(self, '__slots__') else self.__dict__
-        for field_name in field_list:
+        for field_name in self.__dict__:
             format_method = getattr(self, 'get_{}'.format(
                 field_name
             ), None)
@@ -1,7 +1,6 @@
 import os
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-print(basedir)
 
 
 class Config:
@@ -11,6 +10,32 @@ class Config:
     SQLALCHEMY_RECORD_QUERIES = True
     PER_PAGE = 20
     SLOW_DB_QUERY_TIME = 0.5
+    # max number of opening epochs kept in the network snapshot cache, the dates of one epoch share its snapshot
+    RAILWAY_DATA_CACHE_SIZE = 8
+    # network file compiled by manage.py compile-network, snapshots are read from it instead of the database
+    NETWORK_FILE = os.environ.get('RAILWAY_NETWORK_FILE')
+    # route search engine used when the request doesn't choose one, bfs, dijkstra, bidirectional or patterns
+    SEARCH_ENGINE = 'bfs'
+    # max number of routes asked by the alternatives argument of /api/search
+    SEARCH_MAX_ALTERNATIVES = 10
+    # max number of minutes between depart_from and depart_to of a profile search
+    SEARCH_PROFILE_MAX_WINDOW = 1440
+    # max number of queries in one /api/search/batch request
+    SEARCH_BATCH_MAX_SIZE = 1000
+    # search result cache, size 0 disables it, ttl is in seconds and time bucket in minutes
+    SEARCH_CACHE_SIZE = 10000
+    SEARCH_CACHE_TTL = 3600
+    SEARCH_CACHE_TIME_BUCKET = 60
+    # add the Server-Timing header with the search phase timings to /api/search responses
+    SEARCH_SERVER_TIMING = False
+    # processes of the /api/matrix searches, 0 or 1 searches in the serving process,
+    # matrices with at most MATRIX_CHUNK_SIZE origins are always searched in the serving process
+    MATRIX_WORKERS = os.cpu_count() or 1
+    MATRIX_CHUNK_SIZE = 25
+    # max number of origins and of destinations in one /api/matrix request
+    MATRIX_MAX_SIZE = 500
+    # rows written per statement when loading station map feeds
+    INGEST_BATCH_SIZE = 1000
     FLASK_APP = os.path.join(basedir, 'app.py')
 
     @staticmethod
@@ -1,15 +1,18 @@
-import csv
 import logging
-import os
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from flask import jsonify, request
+from flask import current_app, jsonify, request
 
-from app import db
-from config import basedir
 from controllers import api
-from models.models import Line, Station, StationBelong
+from services.batch import BatchSearch
 from services.bfs import MetroLineSearch
+from services.ingest import StationMapLoader
+from services.matrix import MatrixSearch
+from services.metrics import search_metrics
+from services.profile import ProfileSearch
+from services.reachable import ReachableSearch
+from services.response_cache import search_result_cache
+from services.snapshot import warm_up_status
 
 
 @api.route("/search")
@@ -18,69 +21,185 @@ def search():
     from: from station name, case-insensitive
     to: to station name, case-insensitive
     time: the time start to take rail way
-    order_by: distance or time, distance is shortest distance route without time consideration
-    time is shortest distance route with time cost, case-insensitive
+    order_by: distance, time or pareto, distance is shortest distance route without time consideration
+    time is shortest distance route with time cost, pareto is every route no other route beats
+    on time, interchanges and stations together, engine and alternatives are ignored with it, case-insensitive
+    engine: bfs, dijkstra, bidirectional or patterns, the search engine to use, default is the SEARCH_ENGINE config,
+    bidirectional only searches order_by distance, order_by time is searched by dijkstra
+    revisit_lines: optional, true lets the dijkstra engine (and the distance routes of patterns) board again a line
+    the route left, default is false, a line is boarded once at most like with bfs
+    alternatives: optional, return up to this number of loopless routes ranked from the best one
+    max_detour: optional, with alternatives, max number of stations over the best route
+    depart_from, depart_to: optional with order_by time, HH:MM on the date of time, or full times,
+    return the best departures of this window instead, see profile_search
     :return: json format route information
     """
     from_station = request.args.get('from', '').title()
     to_station = request.args.get('to', '').title()
     time = request.args.get('time', datetime.now().strftime('%Y-%m-%d %H:%M'))
     order_by = request.args.get('order_by', 'distance').lower()
+    engine = request.args.get('engine', current_app.config['SEARCH_ENGINE']).lower()
+    revisit_lines = _get_flag('revisit_lines')
+    alternatives = min(max(request.args.get('alternatives', 0, type=int), 0),
+                       current_app.config['SEARCH_MAX_ALTERNATIVES'])
+    max_detour = request.args.get('max_detour', None, type=int)
 
-    search_func = MetroLineSearch(from_station, to_station, time, order_by)
+    if order_by == 'time' and 'depart_from' in request.args:
+        return profile_search(from_station, to_station, time, engine, revisit_lines)
 
-    result = search_func.generate_railway_routes()
+    search_func = MetroLineSearch(from_station, to_station, time, order_by, engine=engine,
+                                  result_cache=search_result_cache, alternatives=alternatives,
+                                  max_detour=max_detour, revisit_lines=revisit_lines)
+
+    context = search_func.run()
+    result = context.result
     logging.info(result)
 
-    return jsonify(result)
+    stats = context.stats
+    with stats.phase('jsonify'):
+        response = jsonify(result)
+
+    search_metrics.observe(stats, path='search', engine=search_func.engine, order_by=search_func.order_by,
+                           result=result['result'])
+    if current_app.config['SEARCH_SERVER_TIMING']:
+        response.headers['Server-Timing'] = stats.server_timing()
+    return response
+
+
+def _get_flag(name):
+    return request.args.get(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def profile_search(from_station, to_station, time, engine, revisit_lines):
+    """
+    :return: json format departure options of the window, dominated departures (a later one arrives no later)
+    are dropped, each option is a run of departures taking the same route in the same time
+    """
+    service_date = time[:10]
+    window = []
+    for name in ('depart_from', 'depart_to'):
+        value = request.args.get(name, request.args['depart_from']).strip()
+        window.append(value if len(value) > 5 else '{} {}'.format(service_date, value))
+
+    try:
+        profile = ProfileSearch(from_station, to_station, window[0], window[1], engine, revisit_lines)
+    except ValueError:
+        return jsonify(ProfileSearch.generate_failed_result('depart_from and depart_to should be HH:MM'))
+    max_window = current_app.config['SEARCH_PROFILE_MAX_WINDOW']
+    if profile.depart_to - profile.depart_from > timedelta(minutes=max_window):
+        return jsonify(ProfileSearch.generate_failed_result('at most {} minutes of departures'.format(max_window)))
+    return jsonify(profile.generate_profile())
+
+
+@api.route("/search/batch", methods=['POST'])
+def search_batch():
+    """
+    json body: {"queries": [{"from": ..., "to": ..., "time": ..., "order_by": ...}, ...]}
+    every query takes the same arguments as /search, a plain list of queries is accepted too
+    engine: bfs, dijkstra, bidirectional or patterns, query string argument, default is the SEARCH_ENGINE config
+    revisit_lines: query string argument, same as for /search
+    :return: json format {"results": [route information of each query, in query order]}
+    """
+    data = request.get_json(silent=True)
+    queries = data.get('queries') if isinstance(data, dict) else data
+    if not isinstance(queries, list):
+        return jsonify({'result': 'failed', 'description': 'queries should be a list', 'results': []})
+
+    max_size = current_app.config['SEARCH_BATCH_MAX_SIZE']
+    if len(queries) > max_size:
+        return jsonify({'result': 'failed', 'description': 'at most {} queries in a batch'.format(max_size),
+                        'results': []})
+
+    engine = request.args.get('engine', current_app.config['SEARCH_ENGINE']).lower()
+    results = BatchSearch(queries, engine, search_result_cache,
+                          _get_flag('revisit_lines')).generate_railway_routes()
+
+    return jsonify({'result': 'success', 'description': '{} query(s) answered'.format(len(results)),
+                    'results': results})
+
+
+@api.route("/reachable")
+def reachable():
+    """
+    from: from station name, case-insensitive
+    time: the time start to take rail way
+    within: number of minutes, default is 30
+    :return: json format every station reachable within the minutes,
+    with its earliest arrival time, time cost, station number and interchange number
+    """
+    from_station = request.args.get('from', '').title()
+    time = request.args.get('time', datetime.now().strftime('%Y-%m-%d %H:%M'))
+    within = max(request.args.get('within', 30, type=int), 0)
+
+    return jsonify(ReachableSearch(from_station, time, within).generate_reachable_stations())
+
+
+@api.route("/matrix", methods=['GET', 'POST'])
+def matrix():
+    """
+    origins: station names, json list in the POST body or comma separated in the query string
+    destinations: station names, same as origins, default is the origins
+    time: the time start to take rail way
+    :return: json format earliest arrival time costs and station numbers,
+    one row per origin indexed like destinations, null when not reachable
+    """
+    data = request.get_json(silent=True) if request.method == 'POST' else None
+    if isinstance(data, dict):
+        origins = data.get('origins')
+        destinations = data.get('destinations') or origins
+        time = data.get('time')
+    else:
+        origins = [name for name in request.args.get('origins', '').split(',') if name]
+        destinations = [name for name in request.args.get('destinations', '').split(',') if name] or origins
+        time = request.args.get('time')
+    time = time or datetime.now().strftime('%Y-%m-%d %H:%M')
+
+    if not isinstance(origins, list) or not isinstance(destinations, list):
+        return jsonify(MatrixSearch.generate_failed_result('origins and destinations should be lists'))
+    max_size = current_app.config['MATRIX_MAX_SIZE']
+    if len(origins) > max_size or len(destinations) > max_size:
+        return jsonify(MatrixSearch.generate_failed_result('at most {} origins and destinations'.format(max_size)))
+
+    return jsonify(MatrixSearch(origins, destinations, time).generate_matrix())
+
+
+@api.route("/search/cache")
+def search_cache_stats():
+    """
+    :return: json format hit, miss and eviction counters of the search result cache
+    """
+    return jsonify(search_result_cache.stats())
+
+
+@api.route("/metrics")
+def metrics():
+    """
+    :return: json format latency histograms of each search phase and the search counters of this process
+    """
+    return jsonify(search_metrics.serialize())
+
+
+@api.route("/ready")
+def ready():
+    """
+    readiness of this process, 200 once the network snapshot is warmed up, 503 before
+    :return: json format warm-up state, service dates and duration
+    """
+    return jsonify(warm_up_status.serialize()), 200 if warm_up_status.ready else 503
 
 
 @api.route("/data")
 def gen_data():
     """
-    load csv file's data to database
+    load csv file's data to database, rows already loaded are skipped or updated
     :return:
     """
-    data_file_path = os.path.join(basedir, 'StationMap.csv')
-    with open(data_file_path) as file:
-        csv_data = csv.reader(file)
-        cnt = 0
-        lines = {}
-        stations = {}
-        for row in csv_data:
-            if not cnt:
-                cnt += 1
-                continue
-
-            station_code = row[0].strip()
-
-            line_code = station_code[:2]
-            line = lines.get(line_code, '')
-            if not line:
-                line = Line(code=line_code)
-                db.session.add_all([line])
-                db.session.commit()
-                lines[line_code] = line
-
-            station_name = row[1].strip()
-            station = stations.get(station_name, '')
-            if not station:
-                station = Station(name=station_name)
-                db.session.add_all([station])
-                db.session.commit()
-                stations[station_name] = station
-
-            station_seq = int(str(station_code[2:]))
-            opened_at = row[2].strip()
-
-            station_belong = StationBelong(station_id=station.id, line_id=line.id, seq=station_seq, opened_at=opened_at)
-
-            db.session.add_all([station_belong])
-            db.session.commit()
+    stats = StationMapLoader(current_app.config['INGEST_BATCH_SIZE']).load()
 
     return jsonify({
         'status': 200,
         'data': {
-            'info': 'successful'
+            'info': 'successful',
+            'stats': stats
         }
     })
@@ -2,6 +2,8 @@ from common.serializable import Serializable
 
 
 class Station(Serializable):
+    __slots__ = ('name', 'codes', 'opened_at', 'sequence', 'lines')
+
     def __init__(self, name='', line=None):
         self.name = name
         self.codes = {}
@@ -11,16 +13,22 @@ class Station(Serializable):
 
 
 class Line(Serializable):
+    __slots__ = ('line_id', 'name', 'stations', 'station_index', 'transform_stations', 'cost_info', 'is_round_line')
+
     def __init__(self, name, line_id):
         self.line_id = line_id
         self.name = name
         self.stations = []
+        # station -> position in stations
+        self.station_index = {}
         self.transform_stations = []
         self.cost_info = {}
         self.is_round_line = False
 
 
 class LineTimeCost(Serializable):
+    __slots__ = ('type_id', 'time_type', 'weekdays', 'time_intervals', 'take_cost', 'change_cost', 'is_open')
+
     def __init__(self, time_type, type_id):
         self.type_id = type_id
         self.time_type = time_type
@@ -32,6 +40,8 @@ class LineTimeCost(Serializable):
 
 
 class Station2Station(Serializable):
+    __slots__ = ('from_station', 'to_station', 'line', 'time_cost', 'start_time', 'end_time')
+
     def __init__(self, from_station, line, to_station):
         self.from_station = from_station
         self.to_station = to_station
@@ -42,6 +52,8 @@ class Station2Station(Serializable):
 
 
 class Route(Serializable):
+    __slots__ = ('line', 'direction', 'from_station', 'to_station', 'take_stations', 'time_cost')
+
     def __init__(self):
         self.line = ''
 
@@ -58,6 +70,8 @@ class Route(Serializable):
 
 
 class SuggestRoute(Serializable):
+    __slots__ = ('summary', 'take_stations', 'total_station', 'total_cost', 'total_interchange', 'routes')
+
     def __init__(self):
         # eg. CC->DT->NS
         self.summary = ''
@@ -1,19 +1,49 @@
-# flask migrations
-from flask_migrate import Migrate, MigrateCommand
-from flask_script import Manager
+import sys
 
 from app import create_app, db
 
+# the tables are only created by the init-db and load_data commands, the others start on the existing database
 app = create_app()
-manager = Manager(app)
 
-# migrate app and db
-Migrate(app, db)
-# add data management commands
-manager.add_command('db', MigrateCommand)
+
+def init_db():
+    """Create the missing tables of the database"""
+    import models.models  # registers the tables of the models
+    db.create_all()
+
+
+def load_data(path=None, prune=False):
+    """Load a station map csv file into the database"""
+    from services.ingest import StationMapLoader, STATION_MAP_FILE
+    db.create_all()
+    loader = StationMapLoader(app.config['INGEST_BATCH_SIZE'], prune)
+    print(loader.load(path or STATION_MAP_FILE))
+
+
+def compile_network(output=None, since=None):
+    """Compile the railway tables into a network file, served with RAILWAY_NETWORK_FILE"""
+    from services.network_file import compile_network_file
+    print(compile_network_file(output, since=since))
+
+
+def benchmark(output, engines, paths, stride, compare):
+    """Benchmark route search over every station pair"""
+    import json
+    from benchmarks.search import SearchBenchmark, save_report, compare_reports
+
+    report = SearchBenchmark(app, engines.split(','), paths.split(','), stride, config_name='default').run()
+    save_report(report, output)
+    for scenario in report['scenarios']:
+        print(scenario)
+    for matrix in report.get('matrix', []):
+        print(matrix)
+    for startup in report['startup']:
+        print(startup)
+    if compare:
+        with open(compare) as file:
+            print('\n'.join(compare_reports(json.load(file), report)))
 
 
-@manager.command
 def test():
     """Run the unit tests"""
     import unittest
@@ -21,7 +51,83 @@ def test():
     unittest.TextTestRunner(verbosity=2).run(tests)
 
 
+def run_lean_command(args):
+    """
+    run test, init-db and compile-network without loading flask-script
+    :param args: command line arguments, program name excluded
+    :return: False when args are not one of these commands
+    """
+    if not args or args[0] not in ('test', 'init-db', 'compile-network'):
+        return False
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=sys.argv[0] + ' ' + args[0])
+    if args[0] == 'compile-network':
+        parser.add_argument('-o', '--output', dest='output', default=None)
+        parser.add_argument('-s', '--since', dest='since', default=None)
+    options = vars(parser.parse_args(args[1:]))
+    # flask-script runs its commands in a context of the app too
+    with app.app_context():
+        if args[0] == 'compile-network':
+            compile_network(**options)
+        elif args[0] == 'init-db':
+            init_db()
+        else:
+            test()
+    return True
+
+
+def get_manager():
+    """
+    flask-script manager of every command, only built for the commands run_lean_command doesn't run
+    """
+    from flask_script import Command, Manager
+
+    class MigrateDatabase(Command):
+        """Database migrations of flask-migrate, see db --help"""
+
+        # flask migrations are only imported when run, the other commands start without them,
+        # the db arguments, help included, are all passed on to their commands
+        capture_all_args = True
+        help_args = ()
+
+        def run(self, args):
+            from flask_migrate import Migrate, MigrateCommand
+
+            # migrate app and db
+            Migrate(app, db)
+            MigrateCommand.app = app
+            MigrateCommand.with_default_commands = False
+            return MigrateCommand.handle(sys.argv[0] + ' db', args)
+
+    manager = Manager(app)
+    # add data management commands
+    manager.add_command('db', MigrateDatabase())
+
+    manager.option('--prune', dest='prune', action='store_true', help='delete station belongs not in the file')(
+        load_data)
+    manager.option('-f', '--file', dest='path', default=None, help='station map csv, default is StationMap.csv')(
+        load_data)
+
+    manager.add_command('init-db', Command(init_db))
+    manager.add_command('compile-network', Command(compile_network))
+
+    manager.option('-c', '--compare', dest='compare', default=None, help='report json file to compare with')(
+        benchmark)
+    manager.option('-s', '--stride', dest='stride', type=int, default=1, help='only use every stride-th station')(
+        benchmark)
+    manager.option('-p', '--path', dest='paths', default='search,api,matrix', help='comma separated search,api,matrix')(
+        benchmark)
+    manager.option('-e', '--engine', dest='engines', default='bfs,dijkstra,bidirectional,patterns',
+                   help='comma separated search engines')(benchmark)
+    manager.option('-o', '--output', dest='output', default='benchmark.json', help='report json file')(benchmark)
+
+    manager.command(test)
+    return manager
+
+
 if __name__ == '__main__':
-    from models.models import *
+    if not run_lean_command(sys.argv[1:]):
+        from models.models import *
 
-    manager.run()
+        get_manager().run()
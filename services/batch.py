@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from services.bfs import MetroLineSearch
+from services.metrics import search_metrics
+from services.snapshot import get_railway_data
+
+
+class BatchSearch(object):
+    """
+    Answer many route searches in one go
+
+    searches of the same service date share one network snapshot,
+    identical queries are only searched once
+    and the dijkstra engine searches each origin once per departure time and order_by
+    """
+
+    def __init__(self, queries, engine='bfs', result_cache=None, revisit_lines=False):
+        """
+        :param queries: list of dict with from, to, time and order_by, same as the search api arguments
+        :param result_cache: optional SearchResultCache
+        :param revisit_lines: see MetroLineSearch
+        """
+        self.queries = queries
+        self.engine = engine
+        self.revisit_lines = revisit_lines
+        self.result_cache = result_cache
+        self._snapshots = {}
+        self._origin_searches = {}
+
+    def generate_railway_routes(self):
+        results = []
+        answered = {}
+        default_time = datetime.now().strftime('%Y-%m-%d %H:%M')
+        for query in self.queries:
+            if not isinstance(query, dict):
+                results.append(self._generate_failed_result('query should be an object'))
+                continue
+
+            from_station = str(query.get('from', '')).title()
+            to_station = str(query.get('to', '')).title()
+            time = query.get('time') or default_time
+            order_by = str(query.get('order_by') or 'distance').lower()
+
+            key = (from_station, to_station, time, order_by)
+            if key not in answered:
+                answered[key] = self._search(from_station, to_station, time, order_by)
+            results.append(answered[key])
+        return results
+
+    def _search(self, from_station, to_station, time, order_by):
+        try:
+            service_date = datetime.strptime(time, '%Y-%m-%d %H:%M').strftime('%Y-%m-%d')
+        except (TypeError, ValueError):
+            return self._generate_failed_result('{} is not a valid time'.format(time))
+
+        railway_data = self._snapshots.get(service_date)
+        if railway_data is None:
+            railway_data = get_railway_data(service_date)
+            self._snapshots[service_date] = railway_data
+
+        search_func = MetroLineSearch(from_station, to_station, time, order_by, railway_data, self.engine,
+                                      self._origin_searches, self.result_cache, revisit_lines=self.revisit_lines)
+        context = search_func.run()
+        search_metrics.observe(context.stats, path='batch', engine=search_func.engine,
+                               order_by=search_func.order_by, result=context.result['result'])
+        return context.result
+
+    @staticmethod
+    def _generate_failed_result(error_info):
+        return {
+            'result': 'failed',
+            'description': error_info,
+            'suggest_routes': []
+        }
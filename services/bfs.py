@@ -1,7 +1,16 @@
-from datetime import datetime, timedelta
+from datetime import datetime
+from time import perf_counter
 
 from domains.domains import Station2Station, SuggestRoute, Route
-from services.routes import RailwayData
+from services.bidirectional import BidirectionalSearch
+from services.dijkstra import StationGraphSearch
+from services.distance_table import distance_table_cache
+from services.context import SearchContext
+from services.k_shortest import KShortestSearch
+from services.pareto import ParetoSearch
+from services.snapshot import get_railway_data
+from services.transfer_patterns import TransferPatternSearch, transfer_patterns_cache
+from services.time_types import minute_of_week, read_time_type
 
 
 class MetroLineSearch(object):
@@ -17,75 +26,229 @@ class MetroLineSearch(object):
     shortest distance with time cost algorithm has filter the lines and stations which not operate in Night Hours
     when calculate route time cost also we considered the situation of crossing two hours manner
     such as from Peak Hours to Non-Peak Hours
+
+    engine is bfs (the line based search above), dijkstra (StationGraphSearch on the CompactNetwork)
+    or bidirectional (BidirectionalSearch, from both stations on the CompactNetwork, without precomputed tables,
+    order_by time is searched by dijkstra instead, engine tells which engine searched)
+    or patterns (time routes from the precomputed TransferPatterns, distance routes like dijkstra)
+    revisit_lines lets the dijkstra routes (and the patterns distance routes) board again a line they left,
+    without it they board a line once at most like bfs, the other engines always may
+    order_by pareto returns the Pareto front over time, interchanges and stations
+    (ParetoSearch on the CompactNetwork, whatever the engine and alternatives)
+    origin_searches is an optional dict shared by searches of a batch,
+    so the dijkstra engine runs once per origin, departure time and order_by
+    result_cache is an optional SearchResultCache
+    alternatives asks for up to k loopless routes ranked from the best (KShortestSearch on the CompactNetwork,
+    whatever the engine), max_detour drops the ones with more than max_detour stations over the best route
+
+    a search only holds the query and the read only network snapshot,
+    each run keeps its routes, counters and stats in its own SearchContext
     """
 
-    def __init__(self, from_station, to_station, time, order_by):
+    ENGINES = ('bfs', 'dijkstra', 'bidirectional', 'patterns')
+
+    def __init__(self, from_station, to_station, time, order_by, railway_data=None, engine='bfs',
+                 origin_searches=None, result_cache=None, alternatives=0, max_detour=None, revisit_lines=False):
         self.stations = {}
         self.lines = []
-        self._min_distance = 0
-        self._shortest_routes = []
 
         self.from_station = from_station
         self.to_station = to_station
         self.time = datetime.strptime(time, '%Y-%m-%d %H:%M')
+        # search times are integer minutes from the Monday 00:00 of the departure week
+        self.start_minute = minute_of_week(self.time)
 
         self.order_by = order_by if order_by else 'distance'
-        self.result = {}
-
-        self._init_data()
-
-    def _init_data(self):
-        railway_data = RailwayData(self.time.strftime('%Y-%m-%d'))
+        self.engine = engine if engine in self.ENGINES else 'bfs'
+        if self.engine == 'bidirectional' and self.order_by == 'time':
+            # arrival times depend on the departure, they aren't searched back from the end
+            self.engine = 'dijkstra'
+        self.origin_searches = origin_searches
+        self.result_cache = result_cache
+        self.alternatives = alternatives
+        self.max_detour = max_detour
+        self.revisit_lines = revisit_lines
+
+        started = perf_counter()
+        self._init_data(railway_data)
+        self._load_time = (perf_counter() - started) * 1000
+
+    def _init_data(self, railway_data=None):
+        # the network snapshot is shared between searches, never modify it here
+        if railway_data is None:
+            railway_data = get_railway_data(self.time.strftime('%Y-%m-%d'))
+        self.railway_data = railway_data
         self.stations = railway_data.station_name_dict
         self.lines = railway_data.lines
         self.time_types = railway_data.time_type_name_dict
+        self.time_type_table = railway_data.time_type_table
 
     def generate_railway_routes(self):
+        return self.run().result
+
+    def run(self, read_minutes=None):
+        """
+        :param read_minutes: optional set, filled with every minute whose time type the search looked at,
+        the result cache is not used then
+        :return: SearchContext of this run, with the result and the stats
+        """
+        context = SearchContext(self.start_minute, read_minutes)
+        context.stats.phases['load'] = self._load_time
+        if self.result_cache is None or read_minutes is not None:
+            context.result = self._generate_railway_routes(context)
+            return context
+
+        result = self.result_cache.get(self)
+        if result is None:
+            result = self._generate_railway_routes(context)
+            self.result_cache.put(self, result, context.latest_minute)
+        else:
+            context.stats.count('cache_hit')
+        context.result = result
+        return context
+
+    def _generate_railway_routes(self, context):
 
         # confirm station is in station list
         if not self.stations.__contains__(self.from_station):
-            return self._generate_failed_result(self.from_station + "  is not contain")
+            return self._generate_failed_result(context, self.from_station + "  is not contain")
         if not self.stations.__contains__(self.to_station):
-            return self._generate_failed_result(self.to_station + "  is not contain")
+            return self._generate_failed_result(context, self.to_station + "  is not contain")
 
         if self.from_station == self.to_station:
-            return self._generate_failed_result(self.from_station + " and " + self.to_station + ' is the same station')
+            return self._generate_failed_result(context, self.from_station + " and " + self.to_station + ' is the same station')
 
         start = self.stations[self.from_station]
         end = self.stations[self.to_station]
 
-        # confirm station is running and in operation
-        if not self._is_opened_station(self.time, start):
-            return self._generate_failed_result(self.from_station + " is not in operation or opened")
-
-        if not self._is_opened_station(self.time, end):
-            return self._generate_failed_result(self.to_station + " is not in operation or opened")
-
-        # reset min cost
-        self._min_distance = 1000
-
-        # shortest route without time consideration
-        line_his = []
-        for line in start.lines:
-            station_list = []
-            line_his.append(line)
-            self._search_routes(0, start, line, end, station_list, line_his, self.time)
+        # confirm station is opened (the snapshot only has the codes opened before the search date),
+        # and with time cost, operated at the departure
+        by_time = self.order_by in ('time', 'pareto')
+        if not start.codes or by_time and not self._is_operated_station(context, self.start_minute, start):
+            return self._generate_failed_result(context, self.from_station + " is not in operation or opened")
+
+        if not end.codes or by_time and not self._is_operated_station(context, self.start_minute, end):
+            return self._generate_failed_result(context, self.to_station + " is not in operation or opened")
+
+        stats = context.stats
+        with stats.phase('search'):
+            if self.order_by == 'pareto':
+                network = self.railway_data.network
+                pareto_search = ParetoSearch(network, context.read_minutes)
+                front = pareto_search.search(network.get_station_id(start), network.get_station_id(end),
+                                             self.start_minute)
+                context.shortest_routes = [network.to_station2station(self.railway_data, legs)
+                                           for _, _, _, legs in front]
+                context.latest_minute = max(context.latest_minute, pareto_search.latest_minute)
+                context.expanded += pareto_search.expanded
+                context.pruned += pareto_search.pruned
+                context.tied = len(front)
+            elif self.alternatives:
+                network = self.railway_data.network
+                k_search = KShortestSearch(network)
+                legs_list = k_search.search(network.get_station_id(start), network.get_station_id(end),
+                                            self.start_minute, self.order_by, self.alternatives, self.max_detour)
+                context.shortest_routes = [network.to_station2station(self.railway_data, legs)
+                                           for legs in legs_list]
+                context.latest_minute = max(context.latest_minute, k_search.latest_minute)
+                context.expanded += k_search.expanded
+            elif self.engine == 'patterns' and self.order_by == 'time':
+                network = self.railway_data.network
+                pattern_search = TransferPatternSearch(transfer_patterns_cache.get(self.railway_data), network,
+                                                       self.time_type_table, context.read_minutes)
+                legs_list = pattern_search.search(network.get_station_id(start), network.get_station_id(end),
+                                                  self.start_minute)
+                context.shortest_routes = [network.to_station2station(self.railway_data, legs)
+                                           for legs in legs_list]
+                context.latest_minute = max(context.latest_minute, pattern_search.latest_minute)
+                context.expanded += pattern_search.expanded
+                context.pruned += pattern_search.pruned
+                context.tied = len(legs_list)
+                if pattern_search.fallback:
+                    context.stats.count('patterns_fallback')
+            elif self.engine in ('dijkstra', 'patterns'):
+                network = self.railway_data.network
+                legs_list = self._search_station_graph(context, network.get_station_id(start),
+                                                       network.get_station_id(end))
+                context.shortest_routes = [network.to_station2station(self.railway_data, legs)
+                                           for legs in legs_list]
+                context.tied = len(legs_list)
+            elif self.engine == 'bidirectional':
+                network = self.railway_data.network
+                graph_search = BidirectionalSearch(network, context.read_minutes)
+                legs_list = graph_search.search(network.get_station_id(start), network.get_station_id(end),
+                                                self.start_minute, self.order_by)
+                context.shortest_routes = [network.to_station2station(self.railway_data, legs)
+                                           for legs in legs_list]
+                context.latest_minute = max(context.latest_minute, graph_search.latest_minute)
+                context.expanded += graph_search.expanded
+                context.pruned += graph_search.pruned
+                context.tied = len(legs_list)
+            else:
+                # reset min cost
+                context.min_distance = 1000
+
+                # shortest route without time consideration
+                line_his = []
+                for line in start.lines:
+                    station_list = []
+                    line_his.append(line)
+                    self._search_routes(context, 0, start, line, end, station_list, line_his, self.start_minute)
+
+        stats.count('nodes_expanded', context.expanded)
+        stats.count('branches_pruned', context.pruned)
+        stats.count('routes_tied', context.tied)
 
         # generate route information
-        result = self._render_route_info()
-
-        # clear temp list data
-        self._shortest_routes.clear()
-        return result
-
-    def _search_routes(self, distance, current_station, current_line, end_station, station_list, line_his,
+        with stats.phase('render'):
+            return self._render_route_info(context)
+
+    def _search_station_graph(self, context, start, end):
+        """
+        :param start: station id of the network
+        :param end: station id of the network
+        :return: list of routes, each route is a list of (from node, to node) legs
+        """
+        if self.order_by == 'distance' and self.revisit_lines:
+            # route by station number only depends on the topology, look up the precomputed table
+            return distance_table_cache.get(self.railway_data).get_routes(start, end)
+
+        network = self.railway_data.network
+        if self.origin_searches is None:
+            graph_search = StationGraphSearch(network, context.read_minutes, self.revisit_lines)
+            routes = graph_search.search(start, end, self.start_minute, self.order_by)
+            context.latest_minute = max(context.latest_minute, graph_search.latest_minute)
+            context.expanded += graph_search.expanded
+            context.pruned += graph_search.pruned
+            return routes
+
+        # one to all search from the origin, reused by the other searches of the batch
+        key = (self.railway_data.opening_epoch, start, self.start_minute, self.order_by, self.revisit_lines)
+        origin_search = self.origin_searches.get(key)
+        if origin_search is None:
+            graph_search = StationGraphSearch(network, revisit_lines=self.revisit_lines)
+            origin_search = (graph_search, graph_search.run(start, self.start_minute, self.order_by))
+            self.origin_searches[key] = origin_search
+            # only the search which ran the origin is charged for it
+            context.expanded += graph_search.expanded
+            context.pruned += graph_search.pruned
+
+        graph_search, goals = origin_search
+        context.latest_minute = max(context.latest_minute, graph_search.latest_minute)
+        if end not in goals:
+            return []
+        return graph_search.collect_routes(goals[end][1])
+
+    def _search_routes(self, context, distance, current_station, current_line, end_station, station_list, line_his,
                        current_time):
         # if current distance larger than min distance just return
-        if distance > self._min_distance:
+        if distance > context.min_distance:
+            context.pruned += 1
             return
+        context.expanded += 1
 
         # if current line is not in operation just return
-        if not self._is_operated_line(current_time, current_line):
+        if not self._is_operated_line(context, current_time, current_line):
             return
 
         # successful when current station and end station is belong to line
@@ -96,10 +259,14 @@ class MetroLineSearch(object):
 
             added_distance = self._calculate_distance(s2s)
             # clear shortest routes when min distance larger than current
-            if self._min_distance > distance + added_distance:
-                self._min_distance = distance + added_distance
-                self._shortest_routes.clear()
-                self._shortest_routes.append(station_list.copy())
+            if context.min_distance > distance + added_distance:
+                context.min_distance = distance + added_distance
+                context.shortest_routes.clear()
+                context.shortest_routes.append(station_list.copy())
+                context.tied = 1
+            elif context.min_distance == distance + added_distance:
+                # only the first route is kept, count the others with the same distance
+                context.tied += 1
 
             station_list.remove(s2s)
             return
@@ -117,125 +284,99 @@ class MetroLineSearch(object):
                 continue
 
             # skip those lines which not running
-            if not self._is_operated_line(current_time, line):
+            if not self._is_operated_line(context, current_time, line):
                 continue
 
             line_his.append(line)
             s2s = Station2Station(current_station, current_line, station)
             station_list.append(s2s)
             added_distance = self._calculate_distance(s2s)
-            self._calculate_take_cost(station_list)
-            interchange_cost = self._get_interchange_cost(s2s.end_time)
-            time_cost = s2s.time_cost + interchange_cost
+
+            # carry the arrival time forward, only the new leg is costed from the time we boarded current line
+            next_time = current_time
+            if self.order_by == 'time':
+                self._calculate_leg_cost(context, s2s, current_time)
+                next_time = s2s.end_time + self._get_interchange_cost(context, s2s.end_time)
+
             # reverse call
-            current_time += timedelta(minutes=time_cost)
-            self._search_routes(distance + added_distance, station, line, end_station, station_list, line_his,
-                                current_time)
-            current_time -= timedelta(minutes=time_cost)
+            self._search_routes(context, distance + added_distance, station, line, end_station, station_list, line_his,
+                                next_time)
 
             # clear the list for sufficient
             line_his.remove(line)
             station_list.remove(s2s)
 
-    def _calculate_take_cost(self, station_list):
-        current_time = self.time
+    def _calculate_take_cost(self, context, station_list):
+        current_time = self.start_minute
         interchange_costs = []
         change_number = len(station_list) - 1
         for idx, item in enumerate(station_list):
-            time_cost = 0
-            line = item.line
-            line_cost = line.cost_info
-            item.start_time = current_time
-            distance = self._calculate_distance(item)
-            take_cost = 0
-            for i in range(distance):
-                time_type = self._get_time_type(current_time)
-                cost_info = line_cost[time_type]
-                take_cost = cost_info.take_cost
-                time_cost += take_cost
-                current_time += timedelta(minutes=take_cost)
-
-            item.time_cost = time_cost
-            item.end_time = current_time
-
-            time_type = self._get_time_type(current_time)
-            cost_info = line_cost[time_type]
-            change_cost = cost_info.change_cost
+            current_time = self._calculate_leg_cost(context, item, current_time)
             if idx < change_number:
+                change_cost = self._get_interchange_cost(context, current_time)
                 interchange_costs.append(change_cost)
-                current_time += timedelta(minutes=change_cost)
+                current_time += change_cost
 
         return interchange_costs
 
-    def _get_interchange_cost(self, current_time):
-        return self.time_types[self._get_time_type(current_time)].change_cost
-
-    def _get_time_type(self, time: datetime):
-        weekday = time.weekday()
-        time_h_m = time.strftime('%H:%M')
-        for cost in self.time_types.values():
-            for interval in cost.time_intervals:
-                if interval[0] <= time_h_m < interval[1] and self._is_in_weekday(weekday, cost.weekdays):
-                    return cost.time_type
-
-        return self.time_types['Non-Peak'].time_type
-
-    @staticmethod
-    def _is_in_weekday(w, weekdays):
-        for idx, _ in enumerate(weekdays):
-            if idx == w:
-                return True
-        return False
-
-    def _is_operated_line(self, current_time, line):
+    def _calculate_leg_cost(self, context, s2s, start_time):
+        """
+        cost one leg station by station from start_time, each station takes the cost of the time type it starts in
+        :return: the arrival time of the leg
+        """
+        line_cost = s2s.line.cost_info
+        current_time = start_time
+        for i in range(self._calculate_distance(s2s)):
+            # a line without cost of a time type is not operated in it, it costs nothing as in CompactNetwork
+            cost = line_cost.get(self._get_time_type(context, current_time))
+            if cost is not None:
+                current_time += cost.take_cost
+
+        s2s.start_time = start_time
+        s2s.end_time = current_time
+        s2s.time_cost = current_time - start_time
+        return current_time
+
+    def _get_interchange_cost(self, context, current_time):
+        return self.time_types[self._get_time_type(context, current_time)].change_cost
+
+    def _get_time_type(self, context, minute):
+        time_type_table = self.time_type_table
+        return time_type_table.names[read_time_type(context, time_type_table.table, minute)]
+
+    def _is_operated_line(self, context, current_time, line):
         if self.order_by == 'distance':
             return True
-        time_type = self._get_time_type(current_time)
-        cost = line.cost_info[time_type]
-        return True and cost.is_open
-
-    def _is_operated_station(self, current_time, station):
+        time_type = self._get_time_type(context, current_time)
+        # lines added by a station map feed have no cost until one is set, they are not operated
+        cost = line.cost_info.get(time_type)
+        return cost is not None and cost.is_open
 
-        time_type = self._get_time_type(current_time)
+    def _is_operated_station(self, context, current_time, station):
+        # the time type is read per line by _is_operated_line, a station without lines doesn't depend on it
         is_operated = False
         for line in station.lines:
-            is_operated = is_operated or self._is_operated_line(current_time, line)
+            is_operated = is_operated or self._is_operated_line(context, current_time, line)
         return is_operated
 
-    def _is_opened_station(self, current_time, station):
-        current_date = datetime.strftime(current_time, '%Y-%m-%d')
-        is_opened = False
-        for code in station.codes.values():
-            opened_at = code['opened_at']
-            is_opened = is_opened or opened_at < current_date
-
-        if not is_opened:
-            return is_opened
-
-        # consider time cost
-        if self.order_by == 'time':
-            is_opened = is_opened and self._is_operated_station(current_time, station)
-        return is_opened
-
     @staticmethod
     def _calculate_distance(s2s: Station2Station):
-        stations = s2s.line.stations
-        from_index = stations.index(s2s.from_station)
-        to_index = stations.index(s2s.to_station)
-        return abs(from_index - to_index)
+        station_index = s2s.line.station_index
+        return abs(station_index[s2s.from_station] - station_index[s2s.to_station])
 
-    def _render_route_info(self):
+    def _render_route_info(self, context):
 
-        route_number = len(self._shortest_routes)
+        route_number = len(context.shortest_routes)
         if not route_number:
-            return self._generate_failed_result('Sorry, no route found !')
+            return self._generate_failed_result(context, 'Sorry, no route found !')
 
-        self.result['result'] = 'success'
-        self.result['description'] = '{} route(s) found'.format(route_number)
-        self.result['suggest_routes'] = []
+        result = context.result
+        result['result'] = 'success'
+        result['description'] = '{} route(s) found'.format(route_number)
+        result['suggest_routes'] = []
 
-        for innerList in self._shortest_routes:
-            interchange_costs = self._calculate_take_cost(innerList)
+        for innerList in context.shortest_routes:
+            interchange_costs = self._calculate_take_cost(context, innerList)
             suggest_route = SuggestRoute()
             total_interchange = len(interchange_costs)
             suggest_route.total_interchange += total_interchange
@@ -246,8 +387,8 @@ class MetroLineSearch(object):
                 route.line = line.name
                 line_stations = line.stations
 
-                from_seq = line_stations.index(sts.from_station)
-                to_seq = line_stations.index(sts.to_station)
+                from_seq = line.station_index[sts.from_station]
+                to_seq = line.station_index[sts.to_station]
 
                 if from_seq < to_seq:
                     direction = line_stations[0].name + '->' + line_stations[-1].name
@@ -274,17 +415,17 @@ class MetroLineSearch(object):
                 if idx < total_interchange:
                     suggest_route.total_cost += interchange_costs[idx]
                 suggest_route.routes.append(route)
-                suggest_route.summary = self._generate_route_summary(suggest_route)
 
-            self.result['suggest_routes'].append(suggest_route.serialize())
+            suggest_route.summary = self._generate_route_summary(context, suggest_route)
+            result['suggest_routes'].append(suggest_route.serialize())
 
-        return self.result
+        return result
 
     @staticmethod
     def _is_same_line(station1, station2, line):
-        return line.stations.__contains__(station1) and line.stations.__contains__(station2)
+        return station1 in line.station_index and station2 in line.station_index
 
-    def _generate_route_summary(self, suggest_route):
+    def _generate_route_summary(self, context, suggest_route):
         stations = suggest_route.take_stations
 
         from_station = stations[0]['name']
@@ -293,16 +434,23 @@ class MetroLineSearch(object):
         route = ','.join(station_list)
 
         if self.order_by == 'time':
-            time_type = self._get_time_type(self.time).lower()
+            time_type = self._get_time_type(context, self.start_minute).lower()
             summary = '''Travel from {} to {} during {} Time: {} minutes Route: ({})''' \
                 .format(from_station, end_station, time_type, suggest_route.total_cost, route)
+        elif self.order_by == 'pareto':
+            time_type = self._get_time_type(context, self.start_minute).lower()
+            summary = '''Travel from {} to {} during {} Time: {} minutes Interchanges: {} Stations travelled: {} ''' \
+                      '''Route: ({})'''.format(from_station, end_station, time_type, suggest_route.total_cost,
+                                               suggest_route.total_interchange, suggest_route.total_station, route)
         else:
             summary = '''Travel from {} to {} Stations travelled: {} Route: ({})''' \
                 .format(from_station, end_station, len(station_list), route)
         return summary
 
-    def _generate_failed_result(self, error_info):
-        self.result['result'] = 'failed'
-        self.result['description'] = error_info
-        self.result['suggest_routes'] = []
-        return self.result
+    @staticmethod
+    def _generate_failed_result(context, error_info):
+        result = context.result
+        result['result'] = 'failed'
+        result['description'] = error_info
+        result['suggest_routes'] = []
+        return result
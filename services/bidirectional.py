@@ -0,0 +1,123 @@
+from services.dijkstra import BOARDED, RIDING, StationGraphSearch
+
+
+class BidirectionalSearch(StationGraphSearch):
+    """
+    Point to point shortest route search from both the start and the end station of a CompactNetwork
+
+    distance is searched breadth first from the start states and back from the end states, a layer is the states of
+    one more station (with the interchanges of its stations, which cost no station), the smaller frontier is
+    expanded first and the search stops at the first layer where the frontiers meet
+
+    time is not searched, the arrival time depends on the departure time so the routes can't be searched back from
+    the end, MetroLineSearch answers it with StationGraphSearch
+
+    routes are the same (maybe in another order) as StationGraphSearch.search
+    """
+
+    def search(self, start, end, start_time, order_by):
+        if order_by != 'distance':
+            raise ValueError('bidirectional search only orders by distance')
+
+        network = self.network
+        # state -> states before it, from the start, and state -> states after it, to the end
+        forward = {node * 2 + BOARDED: [] for node in network.get_nodes(start)}
+        backward = {node * 2 + RIDING: [] for node in network.get_nodes(end)}
+        forward_layer = list(forward)
+        backward_layer = list(backward)
+        meeting = []
+        expanded = 0
+        while forward_layer and backward_layer:
+            if len(forward_layer) <= len(backward_layer):
+                expanded += len(forward_layer)
+                forward_layer = self._expand_forward(forward_layer, forward, end)
+                meeting = [state for state in forward_layer if state in backward]
+            else:
+                expanded += len(backward_layer)
+                backward_layer = self._expand_backward(backward_layer, backward, end)
+                meeting = [state for state in backward_layer if state in forward]
+            if meeting:
+                break
+        self.expanded = expanded
+
+        # every tied route crosses the meeting states, they are joined from both sides
+        routes = []
+        seen = set()
+        for state in meeting:
+            for head in self._iter_paths(forward, state):
+                for tail in self._iter_paths(backward, state):
+                    legs = self._to_legs(head + tail[-2::-1])
+                    if legs not in seen:
+                        seen.add(legs)
+                        routes.append(legs)
+        return routes
+
+    def _expand_forward(self, layer, preds, end):
+        network = self.network
+        node_station = network.node_station
+        ride_offsets = network.ride_offsets
+        ride_targets = network.ride_targets
+        interchange_offsets = network.interchange_offsets
+        interchange_targets = network.interchange_targets
+
+        next_layer = []
+        next_states = set()
+        for state in layer:
+            node = state >> 1
+            # the routes stop at the end station
+            if not state & 1 and node_station[node] == end:
+                continue
+            for idx in range(ride_offsets[node], ride_offsets[node + 1]):
+                self._visit(preds, next_layer, next_states, state, ride_targets[idx] * 2 + RIDING)
+
+        # interchanges cost no station, the lines boarded are in the same layer
+        for state in next_layer[:]:
+            node = state >> 1
+            if node_station[node] == end:
+                continue
+            for idx in range(interchange_offsets[node], interchange_offsets[node + 1]):
+                self._visit(preds, next_layer, next_states, state, interchange_targets[idx] * 2 + BOARDED)
+        return next_layer
+
+    def _expand_backward(self, layer, succs, end):
+        network = self.network
+        node_station = network.node_station
+        ride_offsets = network.ride_offsets
+        ride_targets = network.ride_targets
+        interchange_offsets = network.interchange_offsets
+        interchange_targets = network.interchange_targets
+
+        next_layer = []
+        next_states = set()
+        for state in layer:
+            # a boarded state only comes from an interchange, it is already in its layer
+            if state & 1:
+                continue
+            node = state >> 1
+            # ride edges go both ways along the line, a ride comes from a riding or a boarded state
+            for idx in range(ride_offsets[node], ride_offsets[node + 1]):
+                prev_node = ride_targets[idx]
+                if node_station[prev_node] != end:
+                    self._visit(succs, next_layer, next_states, state, prev_node * 2 + RIDING)
+                self._visit(succs, next_layer, next_states, state, prev_node * 2 + BOARDED)
+
+        # a boarded state comes from riding the other lines of the station, in the same layer
+        for state in next_layer[:]:
+            if not state & 1:
+                continue
+            node = state >> 1
+            if node_station[node] == end:
+                continue
+            for idx in range(interchange_offsets[node], interchange_offsets[node + 1]):
+                self._visit(succs, next_layer, next_states, state, interchange_targets[idx] * 2 + RIDING)
+        return next_layer
+
+    @staticmethod
+    def _visit(links, next_layer, next_states, state, next_state):
+        if next_state not in links:
+            links[next_state] = [state]
+            next_layer.append(next_state)
+            next_states.add(next_state)
+        elif next_state in next_states:
+            # tied, reached by another state of the same layer
+            links[next_state].append(state)
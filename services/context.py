@@ -0,0 +1,27 @@
+from services.metrics import SearchStats
+
+
+class SearchContext(object):
+    """
+    Mutable state of one run of a search
+
+    the network snapshot and the search query are read only, everything a run writes lives here,
+    so a search can be answered by many threads at the same time without locks
+    """
+
+    __slots__ = ('shortest_routes', 'min_distance', 'latest_minute', 'read_minutes', 'expanded', 'pruned', 'tied',
+                 'stats', 'result')
+
+    def __init__(self, start_minute, read_minutes=None):
+        self.shortest_routes = []
+        self.min_distance = 0
+        # latest minute whose time type was looked at, results only depend on time types up to it
+        self.latest_minute = start_minute
+        # optional set collecting every minute whose time type was looked at
+        self.read_minutes = read_minutes
+        # bfs counters, kept as plain attributes while searching
+        self.expanded = 0
+        self.pruned = 0
+        self.tied = 0
+        self.stats = SearchStats()
+        self.result = {}
@@ -0,0 +1,745 @@
+import heapq
+from array import array
+from itertools import count
+
+from services.time_types import MINUTES_PER_WEEK, read_time_type
+
+# a state is node * 2 + boarded, boarded is 1 when the rail was just boarded at this station
+# (start station or interchange), so we never interchange twice in the same station
+RIDING = 0
+BOARDED = 1
+# states of a node in the time expanded search, a ride keeps its direction
+EXPANDED_BOARDED = 0
+EXPANDED_FORWARD = 1
+EXPANDED_BACKWARD = 2
+
+# a label key is station number << TIME_BITS | minutes since departure
+TIME_BITS = 32
+TIME_MASK = (1 << TIME_BITS) - 1
+# layout of a label key, (minute shift, station weight, interchange weight)
+STATION_KEY = (0, 1 << TIME_BITS, 0)
+
+# what a settle callback of NetworkSearch does with the label popped from the heap
+EXPAND = 0
+SKIP = 1
+DONE = 2
+STOP = 3
+
+
+class NetworkSearch(object):
+    """
+    Base of the searches on a CompactNetwork
+
+    it keeps the minutes whose time type was looked at, the result of a search only depends on their time types,
+    and runs the Dijkstra loops of the engines, on the station graph (the best key of a state, or of a state in each
+    time type) or on the time expanded graph (the best key of a state at each minute).
+    the engines differ in their keys and in when they stop, the settle callback settle(label, key, priority) is called
+    with every label popped before it is settled and returns EXPAND (settle it and relax its edges),
+    SKIP (settle it only), DONE (settle it and stop) or STOP (stop without settling it)
+    """
+
+    def __init__(self, network, read_minutes=None):
+        """
+        :param read_minutes: optional set, filled with every minute whose time type was looked at
+        """
+        self.network = network
+        self.read_minutes = read_minutes
+        # latest minute whose time type was looked at
+        self.latest_minute = 0
+        # labels settled and heap entries dropped (already settled or past the end)
+        self.expanded = 0
+        self.pruned = 0
+        # edges of the time expanded graph by state and time types, see _get_expanded_edges
+        self._expanded_edges = {}
+
+    def _settle_by_time_type(self, start_labels, start_time, settle, by_time=True, key_layout=STATION_KEY,
+                             label_types=1, bounds=None, preds=None, banned_stations=None, banned_edges=None,
+                             line_sets=False):
+        """
+        Dijkstra on the station graph, a label is state * label_types + the time type it is reached in,
+        with label_types 1 the time type is always 0 and a state is settled once.
+        without by_time, keys only count stations and interchanges and every line is operated,
+        with it, as on the time expanded graph, a line closed since the departure is not boarded again
+        with line_sets, a label is shifted by _get_line_shift and keeps the bit set of the lines its route boarded,
+        a line is never boarded twice, the start labels have the bits of their lines.
+        a label is dropped when one settled before it with the same state and time type, a subset of its lines
+        and a smaller key is there, a route going on from it goes on from the other one too
+        :param start_labels: list of (label, key)
+        :param key_layout: (minute shift, station weight, interchange weight) of the keys
+        :param bounds: optional array of node -> lower bound of the key to the end, labels are settled by
+        key + bound (A*)
+        :param preds: optional dict, filled with label -> the labels before it with its key
+        :param banned_stations: optional set of station ids never ridden into
+        :param banned_edges: optional set of (state, next state) never taken
+        :return: list of label -> best key, -1 when not reached
+        """
+        network = self.network
+        node_station = network.node_station
+        type_number = network.type_number
+        line_shift = self._get_line_shift(line_sets)
+        line_mask = (1 << line_shift) - 1
+        take_costs = network.take_costs
+        line_open = network.line_open
+        change_costs = network.change_costs
+        node_line = network.node_line
+        ride_offsets = network.ride_offsets
+        ride_targets = network.ride_targets
+        interchange_offsets = network.interchange_offsets
+        interchange_targets = network.interchange_targets
+        minute_shift, station_weight, interchange_weight = key_layout
+
+        label_number = network.node_number * 2 * label_types << line_shift
+        keys = [-1] * label_number
+        # state * label_types + time type -> list of (lines, key) of the labels settled, with line_sets
+        settled_lines = {}
+        settled = bytearray(label_number)
+        heap = []
+        # equal priorities pop in push order
+        counter = count()
+        for label, key in start_labels:
+            keys[label] = key
+            if preds is not None:
+                preds[label] = []
+            heapq.heappush(heap, (key if bounds is None else key + bounds[(label >> line_shift) // label_types >> 1],
+                                  next(counter), label))
+
+        ride_type = change_type = 0
+        while heap:
+            priority, _, label = heapq.heappop(heap)
+            if settled[label]:
+                self.pruned += 1
+                continue
+            key = keys[label]
+            lines = label & line_mask
+            if line_sets:
+                others = settled_lines.setdefault(label >> line_shift, [])
+                if any(not other_lines & ~lines and other_key < key for other_lines, other_key in others):
+                    self.pruned += 1
+                    continue
+            action = settle(label, key, priority)
+            if action == STOP:
+                self.pruned += len(heap) + 1
+                break
+            settled[label] = 1
+            self.expanded += 1
+            if line_sets:
+                others.append((lines, key))
+            if action == DONE:
+                break
+            if action == SKIP:
+                continue
+
+            state = (label >> line_shift) // label_types
+            node = state >> 1
+            ride_key = key + station_weight
+            change_key = key + interchange_weight
+            if by_time:
+                current_time = start_time + ((key >> minute_shift) & TIME_MASK)
+                time_type = self._read_minute(current_time)
+                take_cost = take_costs[node_line[node] * type_number + time_type]
+                change_cost = change_costs[time_type]
+                ride_key += take_cost << minute_shift
+                change_key += change_cost << minute_shift
+                if label_types > 1:
+                    ride_type = self._read_minute(current_time + take_cost)
+
+            for idx in range(ride_offsets[node], ride_offsets[node + 1]):
+                next_node = ride_targets[idx]
+                if banned_stations and node_station[next_node] in banned_stations or \
+                        banned_edges and (state, next_node * 2 + RIDING) in banned_edges:
+                    continue
+                self._relax(heap, counter, keys, preds, label,
+                            ((next_node * 2 + RIDING) * label_types + ride_type) << line_shift | lines,
+                            ride_key, 0 if bounds is None else bounds[next_node])
+
+            if state & 1 == BOARDED:
+                continue
+
+            if by_time:
+                board_type = self._read_minute(current_time + change_cost)
+                if label_types > 1:
+                    change_type = board_type
+            for idx in range(interchange_offsets[node], interchange_offsets[node + 1]):
+                next_node = interchange_targets[idx]
+                if by_time and (not line_open[node_line[next_node] * type_number + board_type] or
+                                network.closes_line(node_line[next_node], start_time, current_time + change_cost)):
+                    continue
+                if banned_edges and (state, next_node * 2 + BOARDED) in banned_edges:
+                    continue
+                next_lines = lines
+                if line_sets:
+                    line_bit = 1 << node_line[next_node]
+                    if lines & line_bit:
+                        continue
+                    next_lines |= line_bit
+                self._relax(heap, counter, keys, preds, label,
+                            ((next_node * 2 + BOARDED) * label_types + change_type) << line_shift | next_lines,
+                            change_key, 0 if bounds is None else bounds[next_node])
+        return keys
+
+    def _settle_time_expanded(self, start_labels, start_time, settle, key_layout=STATION_KEY, bounds=None,
+                              preds=None, banned_stations=None, banned_edges=None, horizon=None, line_sets=False):
+        """
+        Dijkstra on the time expanded graph, a label is minutes since departure * state_number + node * 3 + mode,
+        mode is one of EXPANDED_*, a state reached at another minute is another label.
+        a route never rides into a station it passed nor boards a line closed since the departure
+        (CompactNetwork.closes_line), it would only be waiting for the line to open again.
+        with line_sets, a label is shifted and keeps the lines of its route as in _settle_by_time_type.
+        the stations of a label are the ones of the first route setting its key, its ties may have passed others.
+        the labels a week after the departure are settled but not expanded
+        :param start_labels: list of (label, key)
+        :param key_layout: (minute shift, station weight, interchange weight) of the keys
+        :param bounds: optional array of node -> lower bound of the key to the end, labels are settled by
+        key + bound (A*)
+        :param preds: optional dict, filled with label -> the labels before it with its key
+        :param banned_stations: optional set of station ids never ridden into
+        :param banned_edges: optional set of (state, next state) never taken, between the states of the labels
+        :param horizon: optional latest minute of the routes searched, a label is then dropped when a label of its
+        state expanded before it stays better until then (_is_dominated), the routes arriving later are not exact
+        :return: dict of label -> best key
+        """
+        network = self.network
+        node_station = network.node_station
+        node_line = network.node_line
+        minute_shift, station_weight, interchange_weight = key_layout
+        state_number = network.node_number * 3
+        line_shift = self._get_line_shift(line_sets)
+        line_mask = (1 << line_shift) - 1
+        # the lines of a label are compared after its stations by _is_dominated
+        line_offset = len(network.station_names)
+
+        # state -> list of (key without its minutes, arrival minute, early stations) of the labels expanded
+        expanded = None
+        # label -> bit set of the stations of its route passed before the last line opening
+        early = None
+        last_opening = start_time
+        if horizon is not None:
+            expanded = {}
+            early = {}
+            events = network.get_catch_up_events(start_time, horizon)
+            last_opening = events[0]
+        keys = {}
+        # label -> bit set of the stations of its route
+        passed = {}
+        settled = set()
+        heap = []
+        counter = count()
+        for label, key in start_labels:
+            keys[label] = key
+            minutes, state = divmod(label >> line_shift, state_number)
+            passed[label] = 1 << node_station[state // 3]
+            if early is not None:
+                early[label] = passed[label] if start_time + minutes < last_opening else 0
+                early[label] |= (label & line_mask) << line_offset
+            if preds is not None:
+                preds[label] = []
+            heapq.heappush(heap, (key if bounds is None else key + bounds[state // 3], next(counter), label))
+
+        while heap:
+            priority, _, label = heapq.heappop(heap)
+            if label in settled:
+                self.pruned += 1
+                continue
+            key = keys[label]
+            minutes, state = divmod(label >> line_shift, state_number)
+            lines = label & line_mask
+            if expanded is not None:
+                others = expanded.get(state)
+                rest = key - (minutes << minute_shift)
+                if others is not None and \
+                        self._is_dominated(others, rest, start_time + minutes, passed[label] | lines << line_offset,
+                                           minute_shift > 0, events):
+                    self.pruned += 1
+                    continue
+            action = settle(label, key, priority)
+            if action == STOP:
+                self.pruned += len(heap) + 1
+                break
+            settled.add(label)
+            self.expanded += 1
+            if action == DONE:
+                break
+            if action == SKIP:
+                continue
+
+            if minutes >= MINUTES_PER_WEEK:
+                continue
+            if expanded is not None:
+                expanded.setdefault(state, []).append((rest, start_time + minutes, early[label]))
+            node, mode = divmod(state, 3)
+            graph_state = node * 2 + (BOARDED if mode == EXPANDED_BOARDED else RIDING)
+            stations = passed[label]
+            early_stations = 0 if early is None else early[label]
+            for next_node, next_mode, cost in self._get_expanded_edges(node, mode, start_time + minutes):
+                next_stations = stations
+                next_early = early_stations
+                next_lines = lines
+                if next_mode == EXPANDED_BOARDED:
+                    if banned_edges and (graph_state, next_node * 2 + BOARDED) in banned_edges or \
+                            network.closes_line(node_line[next_node], start_time, start_time + minutes + cost):
+                        continue
+                    if line_sets:
+                        line_bit = 1 << node_line[next_node]
+                        if lines & line_bit:
+                            continue
+                        next_lines |= line_bit
+                        next_early |= line_bit << line_offset
+                else:
+                    next_station = node_station[next_node]
+                    if stations >> next_station & 1 or banned_stations and next_station in banned_stations or \
+                            banned_edges and (graph_state, next_node * 2 + RIDING) in banned_edges:
+                        continue
+                    next_stations |= 1 << next_station
+                    if start_time + minutes + cost < last_opening:
+                        next_early |= 1 << next_station
+                next_key = key + (cost << minute_shift)
+                next_key += interchange_weight if next_mode == EXPANDED_BOARDED else station_weight
+                next_label = ((minutes + cost) * state_number + next_node * 3 + next_mode) << line_shift | next_lines
+                if self._relax_label(heap, counter, keys, preds, label, next_label, next_key,
+                                     0 if bounds is None else bounds[next_node]):
+                    passed[next_label] = next_stations
+                    if early is not None:
+                        early[next_label] = next_early
+        return keys
+
+    @staticmethod
+    def _is_dominated(others, rest, current_time, stations, time_first, events):
+        """
+        a label is dominated by another one of its state when any route going on from it is worse than the same route
+        going on from the other one, until the horizon of the events (CompactNetwork.get_catch_up_events):
+        the other one arrived earlier with a smaller or equal key, no line opens after it which this one could board,
+        and it stays ahead across the cost drops, or with fewer stations it boards the lines before they close.
+        keyed by stations first, a label with fewer stations arriving later dominates one arriving before
+        when no line opens or closes in between.
+        the other one must not have passed a station this one didn't before the last opening, after it the route
+        going on through that station is only worse than going on from the other one when it passed it
+        :param others: list of (key without its minutes, arrival minute, bit set of the stations passed before the
+        last opening) of the labels of the state expanded
+        :param rest: key of the label without its minutes
+        :param stations: bit set of the stations passed by the label, then of its lines with line_sets,
+        the lines of the others must be in it too
+        :param time_first: whether the keys are ordered by minutes first
+        :return: whether the label is dominated
+        """
+        last_opening, last_closing, min_gap = events
+        for other_rest, other_time, other_stations in others:
+            if other_stations & ~stations:
+                continue
+            if other_time <= current_time:
+                if other_time < last_opening:
+                    continue
+                if time_first or other_rest == rest:
+                    if current_time - other_time >= min_gap:
+                        return True
+                elif other_rest < rest and (current_time - other_time >= min_gap or other_time >= last_closing):
+                    return True
+            elif not time_first and other_rest < rest and current_time >= max(last_opening, last_closing):
+                return True
+        return False
+
+    def _get_expanded_start_labels(self, start, start_time, line_sets=False):
+        """
+        :return: list of (label, key) of the time expanded search, boarding the lines of start operated at start_time
+        """
+        network = self.network
+        start_type = self._read_minute(start_time)
+        line_shift = self._get_line_shift(line_sets)
+        return [((node * 3 + EXPANDED_BOARDED) << line_shift | (1 << network.node_line[node] if line_sets else 0), 0)
+                for node in network.get_nodes(start)
+                if network.line_open[network.node_line[node] * network.type_number + start_type]]
+
+    def _get_expanded_edges(self, node, mode, current_time):
+        """
+        edges of a label of the time expanded graph at current_time, a ride keeps its direction
+        (riding back the same line would only be waiting on the train),
+        an interchange only boards the lines operated at boarding time.
+        they only depend on the state and the time types of the ride and of the boarding, and are kept by them
+        :return: list of (next node, next mode, minutes)
+        """
+        network = self.network
+        type_number = network.type_number
+        time_type = self._read_minute(current_time)
+        board_type = 0
+        if mode != EXPANDED_BOARDED:
+            board_type = self._read_minute(current_time + network.change_costs[time_type])
+        edges_key = ((node * 3 + mode) * type_number + time_type) * type_number + board_type
+        edges = self._expanded_edges.get(edges_key)
+        if edges is not None:
+            return edges
+
+        node_line = network.node_line
+        take_cost = network.take_costs[node_line[node] * type_number + time_type]
+        edges = []
+        for idx in range(network.ride_offsets[node], network.ride_offsets[node + 1]):
+            next_node = network.ride_targets[idx]
+            next_mode = EXPANDED_FORWARD if next_node > node else EXPANDED_BACKWARD
+            if mode == EXPANDED_BOARDED or mode == next_mode:
+                edges.append((next_node, next_mode, take_cost))
+        if mode != EXPANDED_BOARDED:
+            change_cost = network.change_costs[time_type]
+            for idx in range(network.interchange_offsets[node], network.interchange_offsets[node + 1]):
+                next_node = network.interchange_targets[idx]
+                if network.line_open[node_line[next_node] * type_number + board_type]:
+                    edges.append((next_node, EXPANDED_BOARDED, change_cost))
+        self._expanded_edges[edges_key] = edges
+        return edges
+
+    def _get_bounds(self, start, end):
+        """
+        breadth first search of the station number to end, back from end whatever the time, until start is reached,
+        the stations not reached are at least one station further than the last layer
+        :return: array of node -> station number to end << TIME_BITS, None when start can't reach end
+        """
+        network = self.network
+        node_station = network.node_station
+        ride_offsets = network.ride_offsets
+        ride_targets = network.ride_targets
+
+        distances = array('i', [-1]) * len(network.station_names)
+        distances[end] = 0
+        layer = [end]
+        depth = 0
+        while distances[start] == -1:
+            if not layer:
+                return None
+            self.expanded += len(layer)
+            depth += 1
+            next_layer = []
+            for station in layer:
+                for node in network.get_nodes(station):
+                    for idx in range(ride_offsets[node], ride_offsets[node + 1]):
+                        next_station = node_station[ride_targets[idx]]
+                        if distances[next_station] == -1:
+                            distances[next_station] = depth
+                            next_layer.append(next_station)
+            layer = next_layer
+
+        bounds = array('q', [(depth + 1) << TIME_BITS]) * network.node_number
+        for node in range(network.node_number):
+            distance = distances[node_station[node]]
+            if distance >= 0:
+                bounds[node] = distance << TIME_BITS
+        return bounds
+
+    def _to_states(self, labels, line_sets=False):
+        """
+        :return: the states of the labels of the time expanded search
+        """
+        state_number = self.network.node_number * 3
+        line_shift = self._get_line_shift(line_sets)
+        states = []
+        for label in labels:
+            node, mode = divmod((label >> line_shift) % state_number, 3)
+            states.append(node * 2 + (BOARDED if mode == EXPANDED_BOARDED else RIDING))
+        return states
+
+    def _is_loopless(self, states):
+        """
+        :return: whether the route of states passes every station once, except for the interchange inside a station
+        """
+        node_station = self.network.node_station
+        stations = [node_station[state >> 1] for idx, state in enumerate(states) if state & 1 == RIDING or not idx]
+        return len(stations) == len(set(stations))
+
+    def _get_line_shift(self, line_sets):
+        """
+        :return: bits of the line set of a label with line_sets, one per line, 0 without
+        """
+        return len(self.network.line_names) if line_sets else 0
+
+    def _read_minute(self, minute):
+        """
+        :return: time type of minute
+        """
+        return read_time_type(self, self.network.time_type_table, minute)
+
+    @staticmethod
+    def _relax(heap, counter, keys, preds, label, next_label, key, bound):
+        old_key = keys[next_label]
+        if old_key != -1:
+            if key > old_key:
+                return
+            if key == old_key:
+                if preds is not None:
+                    preds[next_label].append(label)
+                return
+
+        keys[next_label] = key
+        if preds is not None:
+            preds[next_label] = [label]
+        heapq.heappush(heap, (key + bound, next(counter), next_label))
+
+    @staticmethod
+    def _relax_label(heap, counter, keys, preds, label, next_label, key, bound):
+        """
+        :return: whether key is the new best key of next_label
+        """
+        old_key = keys.get(next_label)
+        if old_key is not None:
+            if key > old_key:
+                return False
+            if key == old_key:
+                if preds is not None:
+                    preds[next_label].append(label)
+                return False
+
+        keys[next_label] = key
+        if preds is not None:
+            preds[next_label] = [label]
+        heapq.heappush(heap, (key + bound, next(counter), next_label))
+        return True
+
+
+class StationGraphSearch(NetworkSearch):
+    """
+    Shortest route search by Dijkstra on the station graph of a CompactNetwork
+
+    distance orders routes by station number,
+    time orders routes by station number too but only boards the lines which are operated at boarding time,
+    station cost and interchange cost follow the time type of the moment they happen,
+    so the label of a state is (station number, arrival time), times are integer minutes
+
+    all the routes tied on the best label are kept,
+    stations are station ids of the network and a route is a list of (from node, to node) legs
+
+    with time, keeping the best label of a state is exact while no line opens or closes and no cost drops
+    (CompactNetwork.can_change_lines and can_overtake) until the routes with as many stations can end,
+    otherwise the search runs again on the time expanded graph, a state reached at another minute is another label,
+    only kept when the labels of the state expanded before it don't dominate it until then
+
+    a route may leave a line and board it again later, without revisit_lines a line is boarded once at most
+    like MetroLineSearch does, the labels then keep the set of the lines boarded and a state reached with
+    other lines is another label
+    """
+
+    def __init__(self, network, read_minutes=None, revisit_lines=True):
+        """
+        :param read_minutes: optional set, filled with every minute whose time type was looked at
+        :param revisit_lines: whether a route may board again a line it left
+        """
+        super().__init__(network, read_minutes)
+        self.revisit_lines = revisit_lines
+        self.preds = {}
+        # whether the last run needed the time expanded search, its predecessors are kept by label then
+        self.fallback = False
+
+    def search(self, start, end, start_time, order_by):
+        goals = self.run(start, start_time, order_by, end)
+        if end not in goals:
+            return []
+        return self.collect_routes(goals[end][1])
+
+    def run(self, start, start_time, order_by, end=None, bounds=None):
+        """
+        run Dijkstra from start, stop once the routes to end are settled, or settle every station when end is None
+        :param bounds: optional, with end, array of node -> lower bound of the key to end,
+        states are settled by key + bound (A*), only the goals of end are exact then
+        :return: dict of station id -> (best label key, goal labels), predecessors are kept in self.preds
+        """
+        network = self.network
+        by_time = order_by == 'time'
+        node_station = network.node_station
+        line_sets = not self.revisit_lines
+        line_shift = self._get_line_shift(line_sets)
+        preds = {}
+        self.preds = preds
+        self.latest_minute = start_time or 0
+        self.expanded = 0
+        self.pruned = 0
+        if line_sets and end is not None and bounds is None:
+            # a state is reached with many line sets, only the ones which may still end first are settled
+            bounds = self._get_bounds(start, end)
+            if bounds is None:
+                self.fallback = False
+                return {}
+
+        if by_time:
+            start_type = self._read_minute(start_time)
+        start_labels = []
+        for node in network.get_nodes(start):
+            if by_time and not network.line_open[network.node_line[node] * network.type_number + start_type]:
+                continue
+            start_labels.append(((node * 2 + BOARDED) << line_shift | (1 << network.node_line[node] if line_sets else 0),
+                                 0))
+
+        goals = {}
+        end_key = None
+
+        def settle(label, key, priority):
+            nonlocal end_key
+            if end_key is not None and priority > end_key:
+                return STOP
+            state = label >> line_shift
+            station = node_station[state >> 1]
+            if state & 1 == RIDING and station != start:
+                goal = goals.get(station)
+                if goal is None:
+                    goals[station] = (key, [label])
+                elif goal[0] == key:
+                    goal[1].append(label)
+                if station == end:
+                    end_key = key
+                    return SKIP
+            return EXPAND
+
+        self._settle_by_time_type(start_labels, start_time, settle, by_time, bounds=bounds, preds=preds,
+                                  line_sets=line_sets)
+
+        self.fallback = False
+        if not by_time:
+            return goals
+        distance = self._get_distance_bound(goals, start, end)
+        if self._is_exact(distance, start, start_time, end):
+            return goals
+
+        self.fallback = True
+        return self._run_time_expanded(start, start_time, end, distance)
+
+    def _get_distance_bound(self, goals, start, end):
+        """
+        the routes found on the station graph are routes of the time expanded graph too
+        :return: station number of the found routes to end, or the most of them without end,
+        None when a reachable station wasn't found
+        """
+        network = self.network
+        if end is not None:
+            return self.get_distance(goals[end][0]) if end in goals else None
+        if len(goals) < len(network.get_reachable_stations(start)) - 1:
+            return None
+        return max([self.get_distance(key) for key, _ in goals.values()], default=0)
+
+    def _is_exact(self, distance, start, start_time, end):
+        """
+        any route with as many stations as the found ones arrives before CompactNetwork.get_latest_arrival
+        :param distance: see _get_distance_bound
+        :return: whether the labels of a state reached at another time can't be better
+        """
+        network = self.network
+        if distance is None:
+            return end is not None and end not in network.get_reachable_stations(start)
+
+        horizon = network.get_latest_arrival(start_time, distance)
+        self._read_minute(horizon)
+        return not network.can_change_lines(start_time, horizon) and not network.can_overtake(start_time, horizon)
+
+    def _run_time_expanded(self, start, start_time, end, distance=None):
+        """
+        Dijkstra on the time expanded graph, goal and predecessor states are labels,
+        collect_routes turns them back into states.
+        with end, labels are settled by key + station number to end (A*),
+        stops after the routes to end, once every reachable station is settled, or after a week.
+        the routes of at most distance stations arrive before CompactNetwork.get_latest_arrival, the labels
+        dominated until then are dropped, it is searched again until the latest arrival of a route passing every
+        reachable station when a route has more stations or a station is not reached
+        :param distance: optional station number of routes of the time expanded graph, see _get_distance_bound
+        """
+        network = self.network
+        bounds = None
+        if end is not None:
+            bounds = self._get_bounds(start, end)
+            if bounds is None:
+                return {}
+        # a route passes a station once at most
+        longest = len(network.get_reachable_stations(start)) - 1
+        if distance is not None and distance < longest:
+            horizon = network.get_latest_arrival(start_time, distance)
+            self._read_minute(horizon)
+            goals = self._settle_goals_time_expanded(start, start_time, end, bounds, horizon)
+            keys = [key for station, (key, _) in goals.items() if end is None or station == end]
+            if len(keys) == (longest if end is None else 1) and \
+                    all(self.get_distance(key) <= distance for key in keys):
+                return goals
+        horizon = network.get_latest_arrival(start_time, longest)
+        self._read_minute(horizon)
+        return self._settle_goals_time_expanded(start, start_time, end, bounds, horizon)
+
+    def _settle_goals_time_expanded(self, start, start_time, end, bounds, horizon=None):
+        network = self.network
+        node_station = network.node_station
+        state_number = network.node_number * 3
+        line_sets = not self.revisit_lines
+        line_shift = self._get_line_shift(line_sets)
+        preds = {}
+        self.preds = preds
+
+        start_labels = self._get_expanded_start_labels(start, start_time, line_sets)
+        reachable_number = len(network.get_reachable_stations(start)) - 1
+        goals = {}
+        end_key = None
+        last_key = None
+
+        def settle(label, key, priority):
+            nonlocal end_key, last_key
+            if end_key is not None and priority > end_key or last_key is not None and priority > last_key:
+                return STOP
+            node, mode = divmod((label >> line_shift) % state_number, 3)
+            station = node_station[node]
+            if mode != EXPANDED_BOARDED and station != start:
+                goal = goals.get(station)
+                if goal is None:
+                    goals[station] = (key, [label])
+                    # every station is settled, only the ties of the last one are left
+                    if end is None and len(goals) == reachable_number:
+                        last_key = key
+                elif goal[0] == key:
+                    goal[1].append(label)
+                if station == end:
+                    end_key = key
+                    return SKIP
+            return EXPAND
+
+        self._settle_time_expanded(start_labels, start_time, settle, bounds=bounds, preds=preds, horizon=horizon,
+                                   line_sets=line_sets)
+        return goals
+
+    @staticmethod
+    def get_distance(key):
+        return key >> TIME_BITS
+
+    @staticmethod
+    def get_duration(key):
+        return key & ((1 << TIME_BITS) - 1)
+
+    def collect_routes(self, goal_states):
+        """
+        :return: list of routes, each route is a list of (from node, to node) legs
+        """
+        line_sets = not self.revisit_lines
+        line_shift = self._get_line_shift(line_sets)
+        routes = []
+        seen = set()
+        for goal in goal_states:
+            for path in self._iter_paths(self.preds, goal):
+                if self.fallback:
+                    path = self._to_states(path, line_sets)
+                    # a tie may have passed a station the rest of the route passes again
+                    if not self._is_loopless(path):
+                        continue
+                elif line_sets:
+                    path = [label >> line_shift for label in path]
+                legs = self._to_legs(path)
+                if legs not in seen:
+                    seen.add(legs)
+                    routes.append(legs)
+        return routes
+
+    def _iter_paths(self, preds, state):
+        if not preds[state]:
+            yield [state]
+            return
+        for pred in preds[state]:
+            for path in self._iter_paths(preds, pred):
+                path.append(state)
+                yield path
+
+    @staticmethod
+    def _to_legs(path):
+        legs = []
+        leg_start = None
+        for idx, state in enumerate(path):
+            if state & 1 == BOARDED:
+                if leg_start is not None:
+                    legs.append((leg_start, path[idx - 1] >> 1))
+                leg_start = state >> 1
+        legs.append((leg_start, path[-1] >> 1))
+        return tuple(legs)
@@ -0,0 +1,109 @@
+import threading
+from array import array
+
+from services.dijkstra import StationGraphSearch
+
+UNREACHABLE = -1
+
+
+class DistanceTable(object):
+    """
+    All pairs shortest routes by station number, precomputed from the station graph
+
+    the result of order_by=distance only depends on the network topology, so it is computed once per topology
+    with one Dijkstra per origin. distances are kept in an array indexed by station pair,
+    the routes of a pair are route_offsets[pair]:route_offsets[pair + 1] of leg_offsets, and the legs of a route are
+    the (from node, to node) pairs of legs[2 * leg_offsets[route]:2 * leg_offsets[route + 1]] on the CompactNetwork.
+    the table is shared by the snapshots whose networks number their stations and nodes the same way,
+    a network file may hold its arrays compiled, they are read in place instead of being built
+    """
+
+    def __init__(self, railway_data):
+        network = railway_data.network
+        self.size = len(network.station_names)
+        compiled = railway_data.source.get_compiled_arrays(railway_data.topology_key)
+        if compiled is None:
+            compiled = self.build_arrays(network)
+        self.distances = compiled['distances']
+        self.route_offsets = compiled['route_offsets']
+        self.leg_offsets = compiled['leg_offsets']
+        self.legs = compiled['legs']
+
+    @staticmethod
+    def build_arrays(network):
+        """
+        :return: dict of name -> array of the table of network
+        """
+        size = len(network.station_names)
+        distances = array('i', [UNREACHABLE]) * (size * size)
+        route_offsets = array('i', [0])
+        leg_offsets = array('i', [0])
+        legs = array('i')
+        for start in range(size):
+            graph_search = StationGraphSearch(network)
+            goals = graph_search.run(start, 0, 'distance')
+            for end in range(size):
+                if end in goals:
+                    key, goal_states = goals[end]
+                    distances[start * size + end] = graph_search.get_distance(key)
+                    for route in graph_search.collect_routes(goal_states):
+                        for leg in route:
+                            legs.extend(leg)
+                        leg_offsets.append(len(legs) // 2)
+                route_offsets.append(len(leg_offsets) - 1)
+        return {'distances': distances, 'route_offsets': route_offsets, 'leg_offsets': leg_offsets, 'legs': legs}
+
+    def get_distance(self, start, end):
+        """
+        :param start: station id of the network
+        :param end: station id of the network
+        """
+        return self.distances[start * self.size + end]
+
+    def get_routes(self, start, end):
+        """
+        :return: list of routes, each route is a list of (from node, to node) legs, same as StationGraphSearch.search
+        """
+        pair = start * self.size + end
+        leg_offsets = self.leg_offsets
+        legs = self.legs
+        return [tuple((legs[idx], legs[idx + 1])
+                      for idx in range(2 * leg_offsets[route], 2 * leg_offsets[route + 1], 2))
+                for route in range(self.route_offsets[pair], self.route_offsets[pair + 1])]
+
+
+class DistanceTableCache(object):
+    """
+    Distance tables keyed by RailwayData.topology_key, the digest of the numbering of the network,
+    so a table is only rebuilt when a station, a line or an opened station code changes
+    """
+
+    def __init__(self, max_size=4):
+        self.max_size = max_size
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, railway_data):
+        key = railway_data.topology_key
+        table = self._tables.get(key)
+        if table is not None:
+            return table
+
+        with self._lock:
+            table = self._tables.get(key)
+            if table is None:
+                table = DistanceTable(railway_data)
+                if len(self._tables) >= self.max_size:
+                    self._tables.pop(next(iter(self._tables)))
+                self._tables[key] = table
+        return table
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+    def __len__(self):
+        return len(self._tables)
+
+
+distance_table_cache = DistanceTableCache()
@@ -0,0 +1,147 @@
+import csv
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from app import db
+from config import basedir
+from models.models import Line, Station, StationBelong
+from services.snapshot import get_railway_data, invalidate_railway_data
+
+STATION_MAP_FILE = os.path.join(basedir, 'StationMap.csv')
+
+# NS1 -> line NS, sequence 1
+STATION_CODE_PATTERN = re.compile(r'^([A-Za-z]+)(\d+)$')
+
+
+class StationMapLoader(object):
+    """
+    Load station map csv feeds (Station Code,Station Name,Opening Date) into the railway tables
+
+    the feed is streamed and written in batches of batch_size rows inside one transaction,
+    rows are diffed against the existing rows by station code, so loading the same feed twice changes nothing.
+    with prune, station belongs which are not in the feed are deleted.
+    lines added by a feed have no time cost, they are not operated (only searched by distance) until one is set.
+    the network snapshots are rebuilt once the load is committed
+    """
+
+    def __init__(self, batch_size=1000, prune=False):
+        self.batch_size = batch_size
+        self.prune = prune
+        self.stats = {}
+        self._line_ids = {}
+        self._station_ids = {}
+        self._belongs = {}
+        self._seen_codes = set()
+
+    def load(self, path=STATION_MAP_FILE):
+        """
+        :return: dict of counters, lines_added, stations_added, belongs_added, belongs_updated, belongs_deleted
+        and skipped rows
+        """
+        self.stats = dict.fromkeys(('rows', 'lines_added', 'stations_added', 'belongs_added', 'belongs_updated',
+                                    'belongs_deleted', 'skipped'), 0)
+        self._seen_codes = set()
+        try:
+            self._load_existing()
+            batch = []
+            for row in self._read_rows(path):
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._write_batch(batch)
+                    batch = []
+            if batch:
+                self._write_batch(batch)
+
+            if self.prune:
+                self._delete_missing()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        invalidate_railway_data()
+        get_railway_data(datetime.now().strftime('%Y-%m-%d'))
+        return self.stats
+
+    def _load_existing(self):
+        self._line_ids = {code: line_id for line_id, code in db.session.query(Line.id, Line.code)}
+        self._station_ids = {name: station_id for station_id, name in db.session.query(Station.id, Station.name)}
+        self._belongs = {}
+        for belong in db.session.query(StationBelong.id, StationBelong.station_code, StationBelong.line_id,
+                                       StationBelong.station_id, StationBelong.sequence, StationBelong.opened_at):
+            self._belongs[belong.station_code] = belong
+
+    def _read_rows(self, path):
+        with open(path, newline='', encoding='utf-8-sig') as file:
+            csv_data = csv.reader(file)
+            next(csv_data, None)
+            for row in csv_data:
+                self.stats['rows'] += 1
+                if len(row) < 3:
+                    self.stats['skipped'] += 1
+                    continue
+
+                station_code = row[0].strip().upper()
+                match = STATION_CODE_PATTERN.match(station_code)
+                station_name = row[1].strip()
+                try:
+                    opened_at = datetime.strptime(row[2].strip(), '%Y-%m-%d').strftime('%Y-%m-%d')
+                except ValueError:
+                    opened_at = None
+                if not match or not station_name or not opened_at or station_code in self._seen_codes:
+                    self.stats['skipped'] += 1
+                    continue
+
+                self._seen_codes.add(station_code)
+                yield station_code, match.group(1), int(match.group(2)), station_name, opened_at
+
+    def _write_batch(self, batch):
+        new_lines = sorted({row[1] for row in batch if row[1] not in self._line_ids})
+        if new_lines:
+            db.session.execute(Line.__table__.insert(), [{'code': code} for code in new_lines])
+            self._line_ids.update((code, line_id) for line_id, code in
+                                  db.session.query(Line.id, Line.code).filter(Line.code.in_(new_lines)))
+            self.stats['lines_added'] += len(new_lines)
+
+        new_stations = sorted({row[3] for row in batch if row[3] not in self._station_ids})
+        if new_stations:
+            db.session.execute(Station.__table__.insert(), [{'name': name} for name in new_stations])
+            self._station_ids.update((name, station_id) for station_id, name in
+                                     db.session.query(Station.id, Station.name).filter(Station.name.in_(new_stations)))
+            self.stats['stations_added'] += len(new_stations)
+
+        inserts = []
+        updates = []
+        for station_code, line_code, sequence, station_name, opened_at in batch:
+            values = {
+                'line_id': self._line_ids[line_code],
+                'station_id': self._station_ids[station_name],
+                'station_code': station_code,
+                'sequence': sequence,
+                'opened_at': opened_at
+            }
+            existing = self._belongs.get(station_code)
+            if existing is None:
+                inserts.append(values)
+            elif (existing.line_id, existing.station_id, existing.sequence, existing.opened_at) != \
+                    (values['line_id'], values['station_id'], sequence, opened_at):
+                values['belong_id'] = existing.id
+                updates.append(values)
+
+        if inserts:
+            db.session.execute(StationBelong.__table__.insert(), inserts)
+            self.stats['belongs_added'] += len(inserts)
+        if updates:
+            table = StationBelong.__table__
+            db.session.execute(table.update().where(table.c.id == bindparam('belong_id')), updates)
+            self.stats['belongs_updated'] += len(updates)
+
+    def _delete_missing(self):
+        missing = [belong.id for code, belong in self._belongs.items() if code not in self._seen_codes]
+        table = StationBelong.__table__
+        for idx in range(0, len(missing), self.batch_size):
+            db.session.execute(table.delete().where(table.c.id.in_(missing[idx:idx + self.batch_size])))
+        self.stats['belongs_deleted'] = len(missing)
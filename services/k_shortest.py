@@ -0,0 +1,203 @@
+import heapq
+from itertools import count
+
+from services.dijkstra import (BOARDED, DONE, EXPAND, EXPANDED_BACKWARD, EXPANDED_BOARDED, EXPANDED_FORWARD, RIDING,
+                               STOP, TIME_BITS, TIME_MASK, NetworkSearch, StationGraphSearch)
+from services.time_types import MINUTES_PER_WEEK
+
+
+class KShortestSearch(NetworkSearch):
+    """
+    Yen's k shortest loopless routes on the station graph of a CompactNetwork
+
+    routes are ranked by the same label key as StationGraphSearch, station number then travel time,
+    and follow the same rules (lines boarded only when operated with order_by time, no double interchange).
+    loopless means no station is passed twice, except for the interchange inside a station.
+    with time, a spur search falls back to the time expanded graph like StationGraphSearch,
+    when a line opens or closes or a cost drops before a route with as many stations can end,
+    its spur never passes a station twice nor boards a line closed since the departure either.
+    alternatives longer than the best route by more than max_detour stations are never searched,
+    every spur search stops at that bound.
+    a route is a list of states, it starts with None, the source linked to every start state
+    """
+
+    def __init__(self, network):
+        super().__init__(network)
+        # spur searches which needed the time expanded search
+        self.fallbacks = 0
+
+    def search(self, start, end, start_time, order_by, k, max_detour=None):
+        """
+        :param start: station id of the network
+        :param end: station id of the network
+        :param k: max number of routes
+        :param max_detour: max number of extra stations over the best route, None is no limit
+        :return: list of routes ranked from best, each route is a list of (from node, to node) legs
+        """
+        self.latest_minute = start_time
+        self.expanded = 0
+        self.pruned = 0
+        self.fallbacks = 0
+        by_time = order_by == 'time'
+
+        network = self.network
+        start_states = []
+        start_type = network.time_type_table[start_time % MINUTES_PER_WEEK]
+        for node in network.get_nodes(start):
+            if by_time and not network.line_open[network.node_line[node] * network.type_number + start_type]:
+                continue
+            start_states.append(node * 2 + BOARDED)
+
+        best = self._shortest_path([(state, 0) for state in start_states], end, start_time, by_time, set(), set(),
+                                   None)
+        if best is None:
+            return []
+        best = (best[0], [None] + best[1], [0] + best[2])
+
+        # a loopless route passes every station at most once
+        limit = len(network.station_names) << TIME_BITS
+        if max_detour is not None:
+            limit = min(limit, (StationGraphSearch.get_distance(best[0]) + max_detour + 1) << TIME_BITS)
+
+        found = [best]
+        candidates = []
+        seen = {tuple(best[1])}
+        counter = count()
+        while len(found) < k:
+            _, path, keys = found[-1]
+            for idx in range(len(path) - 1):
+                root = path[:idx + 1]
+                spur_state = path[idx]
+                banned_edges = {(other[idx], other[idx + 1]) for _, other, _ in found
+                                if len(other) > idx + 1 and other[:idx + 1] == root}
+                if spur_state is None:
+                    spur_states = [(state, 0) for state in start_states if (None, state) not in banned_edges]
+                    banned_stations = set()
+                else:
+                    # the spur station is banned too, only the interchange inside it is still allowed
+                    spur_states = [(spur_state, keys[idx])]
+                    banned_stations = {network.node_station[state >> 1] for state in root[1:]}
+
+                spur = self._shortest_path(spur_states, end, start_time, by_time, banned_stations, banned_edges,
+                                           limit, path[idx - 1] if idx > 1 else None)
+                if spur is None:
+                    continue
+                key, spur_path, spur_keys = spur
+                if spur_state is None:
+                    route, route_keys = [None] + spur_path, [0] + spur_keys
+                else:
+                    route, route_keys = root[:-1] + spur_path, keys[:idx] + spur_keys
+                if tuple(route) in seen or not self._is_loopless(route[1:]):
+                    continue
+                seen.add(tuple(route))
+                heapq.heappush(candidates, (key, next(counter), route, route_keys))
+
+            if not candidates:
+                break
+            key, _, route, route_keys = heapq.heappop(candidates)
+            found.append((key, route, route_keys))
+
+        return [StationGraphSearch._to_legs(path[1:]) for _, path, _ in found]
+
+    def _shortest_path(self, start_states, end, start_time, by_time, banned_stations, banned_edges, limit,
+                       prev_state=None):
+        """
+        Dijkstra from start_states, a list of (state, key), avoiding (state, state) edges and riding into banned stations
+        :param prev_state: the state before a riding start state, its ride keeps the direction
+        :return: (key, path of states, key of each state) of the best route to end, or None
+        """
+        if not start_states:
+            return None
+        best = self._run(start_states, end, start_time, by_time, banned_stations, banned_edges, limit)
+        if not by_time or self._is_exact(best, start_states, end, start_time, banned_stations, banned_edges, limit):
+            return best
+        self.fallbacks += 1
+        return self._run_time_expanded(start_states, end, start_time, banned_stations, banned_edges, limit,
+                                       prev_state)
+
+    def _is_exact(self, best, start_states, end, start_time, banned_stations, banned_edges, limit):
+        """
+        the routes with as many stations as the best one arrive before CompactNetwork.get_latest_arrival
+        :return: whether no line opens or closes and no cost drops until then, or no line at any time reaches end
+        """
+        network = self.network
+        if best is None:
+            return self._run(start_states, end, start_time, False, banned_stations, banned_edges, limit) is None
+
+        horizon = network.get_latest_arrival(start_time, StationGraphSearch.get_distance(best[0]))
+        if horizon > self.latest_minute:
+            self.latest_minute = horizon
+        return not network.can_change_lines(start_time, horizon) and not network.can_overtake(start_time, horizon)
+
+    def _run(self, start_states, end, start_time, by_time, banned_stations, banned_edges, limit):
+        node_station = self.network.node_station
+        preds = {}
+        goals = []
+
+        def settle(state, key, priority):
+            if limit is not None and key >= limit:
+                return STOP
+            if state & 1 == RIDING and node_station[state >> 1] == end:
+                goals.append(state)
+                return DONE
+            return EXPAND
+
+        keys = self._settle_by_time_type(start_states, start_time, settle, by_time, preds=preds,
+                                         banned_stations=banned_stations, banned_edges=banned_edges)
+        if not goals:
+            return None
+        path = self._get_path(preds, goals[0])
+        return keys[goals[0]], path, [keys[state] for state in path]
+
+    def _run_time_expanded(self, start_states, end, start_time, banned_stations, banned_edges, limit, prev_state):
+        """
+        the same search on the time expanded graph, settled by key + station number to end (A*),
+        edges are banned between the states of the labels
+        :return: (key, path of states, key of each state) of the best route to end, or None
+        """
+        network = self.network
+        node_station = network.node_station
+        bounds = self._get_bounds(node_station[start_states[0][0] >> 1], end)
+        if bounds is None:
+            return None
+
+        state_number = network.node_number * 3
+        start_labels = []
+        for state, key in start_states:
+            node = state >> 1
+            if state & 1 == BOARDED:
+                mode = EXPANDED_BOARDED
+            else:
+                mode = EXPANDED_FORWARD if node > prev_state >> 1 else EXPANDED_BACKWARD
+            start_labels.append(((key & TIME_MASK) * state_number + node * 3 + mode, key))
+
+        preds = {}
+        goals = []
+
+        def settle(label, key, priority):
+            if limit is not None and priority >= limit:
+                return STOP
+            node, mode = divmod(label % state_number, 3)
+            if mode != EXPANDED_BOARDED and node_station[node] == end:
+                goals.append(label)
+                return DONE
+            return EXPAND
+
+        keys = self._settle_time_expanded(start_labels, start_time, settle, bounds=bounds, preds=preds,
+                                          banned_stations=banned_stations, banned_edges=banned_edges)
+        if not goals:
+            return None
+        path = self._get_path(preds, goals[0])
+        return keys[goals[0]], self._to_states(path), [keys[label] for label in path]
+
+    @staticmethod
+    def _get_path(preds, label):
+        """
+        :return: the labels from a start label to label, by the first of their predecessors
+        """
+        path = [label]
+        while preds[label]:
+            label = preds[label][0]
+            path.append(label)
+        path.reverse()
+        return path
@@ -0,0 +1,204 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from services.reachable import EarliestArrivalSearch
+from services.snapshot import get_railway_data
+from services.time_types import minute_of_week
+
+# networks of a worker process by digest, read once for all the tasks of the searches on them,
+# the pool registers its networks here too, so the workers forked after it inherit them
+_worker_networks = OrderedDict()
+WORKER_NETWORKS = 4
+
+
+def _add_worker_network(digest, network):
+    _worker_networks[digest] = network
+    while len(_worker_networks) > WORKER_NETWORKS:
+        _worker_networks.popitem(last=False)
+
+
+def _get_worker_network(digest, path):
+    network = _worker_networks.get(digest)
+    if network is None:
+        with open(path, 'rb') as file:
+            network = pickle.load(file)
+        _add_worker_network(digest, network)
+    else:
+        _worker_networks.move_to_end(digest)
+    return network
+
+
+def search_worker_rows(digest, path, origins, destinations, start_minute):
+    """
+    search_rows in a worker process
+    :param digest: sha1 of the pickled CompactNetwork
+    :param path: file of the pickled CompactNetwork, only read by the workers which don't have it yet
+    """
+    return search_rows(origins, destinations, start_minute, _get_worker_network(digest, path))
+
+
+def search_rows(origins, destinations, start_minute, network):
+    """
+    one earliest arrival search per origin, which stops once the destinations are reached
+    :param origins: list of station ids of the network
+    :param destinations: list of station ids of the network
+    :return: list of (time costs, station numbers) rows, one per origin, None when a destination is not reachable
+    """
+    graph_search = EarliestArrivalSearch(network)
+    targets = set(destinations)
+    rows = []
+    for origin in origins:
+        reached = graph_search.run(origin, start_minute, targets=targets)
+        reached[origin] = (0, 0, 0)
+        time_costs = []
+        total_stations = []
+        for destination in destinations:
+            item = reached.get(destination)
+            time_costs.append(item[0] if item else None)
+            total_stations.append(item[1] if item else None)
+        rows.append((time_costs, total_stations))
+    return rows
+
+
+class MatrixPool(object):
+    """
+    Process pool of the matrix searches
+
+    the pool is started once and kept, the tasks only carry the digest of their CompactNetwork.
+    a network is pickled once into a file of the pool, the workers forked after it inherit it,
+    the other ones read the file once and keep the networks by digest,
+    so another network (eg. after the snapshots are invalidated) doesn't restart the pool
+    """
+
+    def __init__(self, workers=0, chunk_size=25):
+        """
+        :param workers: number of processes, 0 or 1 searches in the calling process
+        :param chunk_size: origins per task, matrices with fewer origins are searched in the calling process
+        """
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._network = None
+        self._payload = None
+        self._directory = None
+        # digests of the network files, the oldest are removed after WORKER_NETWORKS
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    def search(self, railway_data, origins, destinations, start_minute):
+        network = railway_data.network
+        chunk_size = max(self.chunk_size, 1)
+        if self.workers <= 1 or len(origins) <= chunk_size:
+            return search_rows(origins, destinations, start_minute, network)
+
+        chunks = [origins[idx:idx + chunk_size] for idx in range(0, len(origins), chunk_size)]
+        with self._lock:
+            digest, path = self._get_payload(network)
+            # map submits every task before returning, a shutdown meanwhile would refuse them
+            results = self._get_executor().map(search_worker_rows, [digest] * len(chunks), [path] * len(chunks),
+                                               chunks, [destinations] * len(chunks), [start_minute] * len(chunks))
+        rows = []
+        for chunk_rows in results:
+            rows.extend(chunk_rows)
+        return rows
+
+    def _get_payload(self, network):
+        if self._network is not network:
+            payload = pickle.dumps(network, pickle.HIGHEST_PROTOCOL)
+            digest = hashlib.sha1(payload).hexdigest()
+            if digest not in self._files:
+                if self._directory is None:
+                    self._directory = tempfile.mkdtemp(prefix='railway-matrix-')
+                path = os.path.join(self._directory, digest + '.pickle')
+                with open(path, 'wb') as file:
+                    file.write(payload)
+                self._files[digest] = path
+                while len(self._files) > WORKER_NETWORKS:
+                    os.remove(self._files.popitem(last=False)[1])
+            self._files.move_to_end(digest)
+            _add_worker_network(digest, network)
+            self._payload = (digest, self._files[digest])
+            self._network = network
+        return self._payload
+
+    def _get_executor(self):
+        if self._executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            self._executor = ProcessPoolExecutor(self.workers, context)
+        return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                # the workers are joined here, left running they block the exit of the process on some versions
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            if self._directory is not None:
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self._directory = None
+            self._files.clear()
+            self._network = None
+            self._payload = None
+
+
+matrix_pool = MatrixPool()
+
+
+class MatrixSearch(object):
+    """
+    Earliest arrival time cost and station number of every origin to every destination,
+    by one one-to-all search per origin, station names are case-insensitive
+    """
+
+    def __init__(self, origins, destinations, time, railway_data=None, pool=None):
+        self.origins = origins
+        self.destinations = destinations
+        self.time = datetime.strptime(time, '%Y-%m-%d %H:%M')
+        self.start_minute = minute_of_week(self.time)
+        if railway_data is None:
+            railway_data = get_railway_data(self.time.strftime('%Y-%m-%d'))
+        self.railway_data = railway_data
+        self.pool = pool or matrix_pool
+
+    def generate_matrix(self):
+        network = self.railway_data.network
+        station_names = {name.lower(): name for name in network.station_names}
+        origins = [station_names.get(str(name).strip().lower()) for name in self.origins]
+        destinations = [station_names.get(str(name).strip().lower()) for name in self.destinations]
+        unknown = [str(name) for name, station in zip(self.origins + self.destinations, origins + destinations)
+                   if station is None]
+        if unknown:
+            return self.generate_failed_result(', '.join(sorted(set(unknown))) + '  is not contain')
+
+        origin_ids = [network.station_ids[name] for name in origins]
+        destination_ids = [network.station_ids[name] for name in destinations]
+        rows = self.pool.search(self.railway_data, origin_ids, destination_ids, self.start_minute)
+
+        return {
+            'result': 'success',
+            'description': '{} x {} matrix'.format(len(origins), len(destinations)),
+            'origins': origins,
+            'destinations': destinations,
+            'time_costs': [time_costs for time_costs, _ in rows],
+            'total_stations': [total_stations for _, total_stations in rows]
+        }
+
+    @staticmethod
+    def generate_failed_result(error_info):
+        return {
+            'result': 'failed',
+            'description': error_info,
+            'origins': [],
+            'destinations': [],
+            'time_costs': [],
+            'total_stations': []
+        }
@@ -0,0 +1,123 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('railway.search')
+
+# upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+
+class SearchStats(object):
+    """
+    Phase timings and counters of one search
+
+    phases are load (network snapshot), search, render and jsonify, in milliseconds,
+    counters are nodes_expanded, branches_pruned, routes_tied and cache_hit
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def server_timing(self):
+        """
+        :return: Server-Timing header value, eg. load;dur=0.012, search;dur=1.3
+        """
+        return ', '.join('{};dur={:.3f}'.format(name, duration) for name, duration in self.phases.items())
+
+    def serialize(self):
+        return {
+            'phases': {name: round(duration, 4) for name, duration in self.phases.items()},
+            'counters': dict(self.counters),
+            'total_ms': round(self.total(), 4)
+        }
+
+
+class Histogram(object):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def serialize(self):
+        return {
+            'buckets': [{'le': 'inf' if bound == float('inf') else bound, 'count': count}
+                        for bound, count in zip(self.buckets, self.counts)],
+            'count': self.count,
+            'sum': round(self.sum, 4)
+        }
+
+
+class SearchMetrics(object):
+    """
+    In process metrics of the searches answered by this process,
+    one latency histogram per phase plus the total, and the sum of every counter
+    """
+
+    def __init__(self):
+        self.searches = 0
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stats, **labels):
+        """
+        record the stats of one search and write them to the structured log
+        """
+        with self._lock:
+            self.searches += 1
+            for name, duration in list(stats.phases.items()) + [('total', stats.total())]:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram()
+                histogram.observe(duration)
+            for name, value in stats.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+        if logger.isEnabledFor(logging.INFO):
+            payload = stats.serialize()
+            payload.update(labels)
+            logger.info(json.dumps(payload, sort_keys=True))
+
+    def reset(self):
+        with self._lock:
+            self.searches = 0
+            self.histograms.clear()
+            self.counters.clear()
+
+    def serialize(self):
+        with self._lock:
+            return {
+                'searches': self.searches,
+                'latency_ms': {name: histogram.serialize() for name, histogram in self.histograms.items()},
+                'counters': dict(self.counters)
+            }
+
+
+search_metrics = SearchMetrics()
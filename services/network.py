@@ -0,0 +1,455 @@
+import hashlib
+from array import array
+from bisect import bisect_right
+from fractions import Fraction
+from math import floor
+
+from domains.domains import Station2Station
+from services.time_types import MINUTES_PER_WEEK
+
+# arrays a network file may hold compiled for an opening epoch, they are used in place instead of being built
+COMPILED_ARRAYS = ('node_station', 'node_line', 'node_position', 'station_offsets', 'station_nodes', 'ride_offsets',
+                   'ride_targets', 'interchange_offsets', 'interchange_targets', 'change_costs', 'take_costs',
+                   'line_open', 'overtaking_minutes', 'line_change_minutes')
+
+
+class CompactNetwork(object):
+    """
+    Array backed station graph of a RailwayData snapshot, the search engines run on it directly
+
+    stations, lines and nodes are integer ids, a node is one station of one line.
+    adjacency is kept in CSR form, the neighbours of node n are targets[offsets[n]:offsets[n + 1]],
+    for ride edges (the previous and next station of the line) and interchange edges (the other lines of the station).
+    costs are flat arrays indexed by line_id * time type number + time type id.
+
+    nothing here refers to the domain objects, so many networks can be kept in memory at once.
+    every station is numbered, opened or not, so a station opening later shifts the ids of the others,
+    tables of station or node ids are shared by the networks of the same topology_key only.
+    the arrays of COMPILED_ARRAYS may be memoryviews of a mapped network file, shared by the processes mapping it
+    """
+
+    def __init__(self, railway_data, compiled=None):
+        """
+        :param compiled: optional dict of name -> array of COMPILED_ARRAYS, compiled from the same rows
+        """
+        lines = [line for line in railway_data.lines]
+        self.line_names = [line.name for line in lines]
+        self.line_ids = {name: line_id for line_id, name in enumerate(self.line_names)}
+        self.station_names = sorted(railway_data.station_name_dict)
+        self.station_ids = {name: station_id for station_id, name in enumerate(self.station_names)}
+
+        time_type_table = railway_data.time_type_table
+        self.time_type_names = list(time_type_table.names)
+        self.time_type_table = time_type_table.table
+        self.type_number = len(self.time_type_names)
+        if compiled is None:
+            self._build(railway_data, lines)
+        else:
+            for name in COMPILED_ARRAYS:
+                setattr(self, name, compiled[name])
+        self.topology_key = self._get_topology_key()
+
+        self.cost_drops = self._cost_drops()
+        self.overtaking_leads = self._overtaking_leads()
+        # only the minutes changing the time type may open or close a line or lower a cost
+        table = self.time_type_table
+        self.type_change_minutes = array('i', [minute for minute in range(MINUTES_PER_WEEK)
+                                               if table[minute] != table[minute - 1]])
+        open_minutes, close_minutes = self._line_open_close_minutes()
+        self.line_open_minutes = [array('i', minutes) for minutes in open_minutes]
+        self.line_close_minutes = [array('i', minutes) for minutes in close_minutes]
+        # station id -> frozenset of the stations reachable from it, filled by get_reachable_stations
+        self._reachable_stations = {}
+
+    def _build(self, railway_data, lines):
+        self.node_station = array('i')
+        self.node_line = array('i')
+        self.node_position = array('i')
+        for line_id, line in enumerate(lines):
+            for position, station in enumerate(line.stations):
+                self.node_station.append(self.station_ids[station.name])
+                self.node_line.append(line_id)
+                self.node_position.append(position)
+
+        self.station_offsets, self.station_nodes = self._build_csr(
+            len(self.station_names), ((station_id, node) for node, station_id in enumerate(self.node_station)))
+        self.ride_offsets, self.ride_targets = self._build_csr(len(self.node_station), self._ride_edges())
+        self.interchange_offsets, self.interchange_targets = self._build_csr(
+            len(self.node_station), self._interchange_edges())
+
+        type_number = self.type_number
+        self.change_costs = array('i', [0]) * type_number
+        for type_id, name in enumerate(self.time_type_names):
+            time_type = railway_data.time_type_name_dict.get(name)
+            if time_type is not None:
+                self.change_costs[type_id] = time_type.change_cost or 0
+
+        # a line without cost of a time type is not operated in it
+        self.take_costs = array('i', [0]) * (len(lines) * type_number)
+        self.line_open = array('b', [0]) * (len(lines) * type_number)
+        for line_id, line in enumerate(lines):
+            for type_id, name in enumerate(self.time_type_names):
+                cost = line.cost_info.get(name)
+                if cost is not None:
+                    self.take_costs[line_id * type_number + type_id] = cost.take_cost or 0
+                    self.line_open[line_id * type_number + type_id] = 1 if cost.is_open else 0
+
+        self.overtaking_minutes = array('i', self._overtaking_minutes())
+        self.line_change_minutes = array('i', self._line_change_minutes())
+
+    def _get_topology_key(self):
+        """
+        searches without time cost only depend on the numbering of the stations, lines and nodes
+        :return: sha1 of the station names, line names and node arrays
+        """
+        digest = hashlib.sha1()
+        for names in (self.station_names, self.line_names):
+            digest.update(repr(names).encode('utf-8'))
+        for item in (self.node_station, self.node_line, self.node_position):
+            digest.update(item.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _build_csr(size, edges):
+        neighbours = [[] for _ in range(size)]
+        for source, target in edges:
+            neighbours[source].append(target)
+        offsets = array('i', [0])
+        targets = array('i')
+        for items in neighbours:
+            targets.extend(items)
+            offsets.append(len(targets))
+        return offsets, targets
+
+    def _ride_edges(self):
+        node_number = len(self.node_station)
+        for node in range(node_number):
+            if node > 0 and self.node_line[node - 1] == self.node_line[node]:
+                yield node, node - 1
+            if node < node_number - 1 and self.node_line[node + 1] == self.node_line[node]:
+                yield node, node + 1
+
+    def _interchange_edges(self):
+        for node, station_id in enumerate(self.node_station):
+            for other in self.station_nodes[self.station_offsets[station_id]:self.station_offsets[station_id + 1]]:
+                if self.node_line[other] != self.node_line[node]:
+                    yield node, other
+
+    def _overtaking_minutes(self):
+        """
+        :return: minutes of the week whose time type lets a later arrival overtake an earlier one,
+        a line opens or a take or change cost gets lower than in the minute before
+        """
+        type_number = self.type_number
+        line_number = len(self.line_names)
+
+        def overtakes(before, after):
+            if self.change_costs[after] < self.change_costs[before]:
+                return True
+            for line_id in range(line_number):
+                if not self.line_open[line_id * type_number + after]:
+                    continue
+                if not self.line_open[line_id * type_number + before] or \
+                        self.take_costs[line_id * type_number + after] < self.take_costs[line_id * type_number + before]:
+                    return True
+            return False
+
+        changes = {(before, after): overtakes(before, after)
+                   for before in range(type_number) for after in range(type_number) if before != after}
+        table = self.time_type_table
+        return [minute for minute in range(MINUTES_PER_WEEK)
+                if table[minute] != table[minute - 1] and changes[(table[minute - 1], table[minute])]]
+
+    def _cost_drops(self):
+        """
+        :return: dict of (time type before, time type after) -> (drop, cheapest), the most a take cost of a line open
+        before or the change cost gets lower, 0 when none does, and the cheapest of these costs before
+        """
+        type_number = self.type_number
+        drops = {}
+        for before in range(type_number):
+            lines = [line_id for line_id in range(len(self.line_names))
+                     if self.line_open[line_id * type_number + before]]
+            costs = [self.take_costs[line_id * type_number + before] for line_id in lines]
+            cheapest = min(costs + [self.change_costs[before]])
+            for after in range(type_number):
+                if before == after:
+                    continue
+                drop = max([cost - self.take_costs[line_id * type_number + after] for line_id, cost in zip(lines, costs)]
+                           + [self.change_costs[before] - self.change_costs[after], 0])
+                drops[(before, after)] = (drop, cheapest)
+        return drops
+
+    def _overtaking_leads(self):
+        """
+        when no line opens (get_overtaking_lead), a later arrival only overtakes an earlier one across a drop of the
+        costs while they are less than lead minutes apart: each station or interchange of the earlier one before the
+        drop gains the later one the drop at most, and the earlier one goes through at most
+        ceil(minutes apart / cheapest cost) of them
+        :return: dict of (time type before, time type after) -> lead, None when a drop is not smaller than the cheapest
+        cost before it
+        """
+        leads = {}
+        for (before, after), (drop, cheapest) in self.cost_drops.items():
+            if drop >= cheapest:
+                leads[(before, after)] = None
+                continue
+            # beyond cheapest * cheapest minutes apart, the later arrival loses more than it gains
+            lead = 0
+            for minutes in range(1, cheapest * cheapest + 1):
+                if -(-minutes // cheapest) * drop > minutes:
+                    lead = minutes + 1
+            leads[(before, after)] = lead
+        return leads
+
+    def _line_change_minutes(self):
+        """
+        :return: minutes of the week whose time type opens or closes a line
+        """
+        type_number = self.type_number
+        table = self.time_type_table
+        open_lines = [self.line_open[type_id::type_number] for type_id in range(type_number)]
+        return [minute for minute in range(MINUTES_PER_WEEK)
+                if table[minute] != table[minute - 1] and open_lines[table[minute]] != open_lines[table[minute - 1]]]
+
+    def _line_open_close_minutes(self):
+        """
+        :return: for each line, the minutes of the week whose time type opens it, and for each line the ones closing it
+        """
+        type_number = self.type_number
+        table = self.time_type_table
+        line_open = self.line_open
+        open_minutes = []
+        close_minutes = []
+        for line_id in range(len(self.line_names)):
+            is_open = [line_open[line_id * type_number + table[minute - 1]] for minute in self.type_change_minutes]
+            opened = [line_open[line_id * type_number + table[minute]] for minute in self.type_change_minutes]
+            open_minutes.append([minute for minute, before, after in zip(self.type_change_minutes, is_open, opened)
+                                 if after and not before])
+            close_minutes.append([minute for minute, before, after in zip(self.type_change_minutes, is_open, opened)
+                                  if before and not after])
+        return open_minutes, close_minutes
+
+    def can_overtake(self, start_minute, end_minute):
+        """
+        searches keeping only the earliest arrival at a state (in a time type) are exact until the first of
+        overtaking_minutes, a later arrival can't do better before.
+        a line closed since start_minute opening again doesn't count, it is never boarded again (closes_line)
+        :return: whether a time type of (start_minute, end_minute] lets a later arrival overtake an earlier one
+        """
+        table = self.time_type_table
+        for minute in self._iter_minutes(self.overtaking_minutes, start_minute, end_minute):
+            drop, _ = self.cost_drops[(table[(minute - 1) % MINUTES_PER_WEEK], table[minute % MINUTES_PER_WEEK])]
+            if drop or self._opens_line(start_minute, minute):
+                return True
+        return False
+
+    def get_overtaking_minutes(self, start_minute, end_minute):
+        """
+        as for can_overtake, a minute only opening lines closed since start_minute doesn't count
+        :return: the minutes of overtaking_minutes in (start_minute, end_minute], from start_minute on
+        """
+        table = self.time_type_table
+        return [minute for minute in self._iter_minutes(self.overtaking_minutes, start_minute, end_minute)
+                if self.cost_drops[(table[(minute - 1) % MINUTES_PER_WEEK], table[minute % MINUTES_PER_WEEK])][0]
+                or self._opens_line(start_minute, minute)]
+
+    def get_overtaking_lead(self, start_minute, minute):
+        """
+        :return: overtaking_leads of the time types around minute, None when it opens a line which didn't close since
+        start_minute
+        """
+        if self._opens_line(start_minute, minute):
+            return None
+        table = self.time_type_table
+        return self.overtaking_leads[(table[(minute - 1) % MINUTES_PER_WEEK], table[minute % MINUTES_PER_WEEK])]
+
+    def can_change_lines(self, start_minute, end_minute):
+        """
+        searches keeping only the fewest stations at a state are exact until the first of line_change_minutes,
+        a label with more stations may board a line the other one can't.
+        as for can_overtake, a line closed since start_minute opening again doesn't count
+        :return: whether a time type of (start_minute, end_minute] opens or closes a line
+        """
+        for minute in self._iter_minutes(self.line_change_minutes, start_minute, end_minute):
+            if self._closes_any_line(minute) or self._opens_line(start_minute, minute):
+                return True
+        return False
+
+    def get_catch_up_events(self, start_minute, end_minute):
+        """
+        the events of (start_minute, end_minute] a label may catch up with another one of its state across,
+        see NetworkSearch._is_dominated.
+        across a drop, a later arrival gains at most ceil(minutes apart / cheapest cost) * drop on an earlier one
+        (as for overtaking_leads), it stays behind by at least minutes apart * (cheapest - drop) / cheapest - drop,
+        which only gets smaller with fewer minutes apart, so the gaps kept across all the drops start from a minimum
+        :return: (last opening, last closing, min gap), the last minute opening a line which didn't close since
+        start_minute, the last minute closing a line, start_minute when there is none, and the fewest minutes apart
+        a later arrival stays behind across every drop until end_minute, more than the window when none are
+        """
+        table = self.time_type_table
+        last_opening = last_closing = start_minute
+        drops = []
+        for minute in self._iter_minutes(self.type_change_minutes, start_minute, end_minute):
+            drops.append(self.cost_drops[(table[(minute - 1) % MINUTES_PER_WEEK], table[minute % MINUTES_PER_WEEK])])
+            if self._opens_line(start_minute, minute):
+                last_opening = minute
+            if self._closes_any_line(minute):
+                last_closing = minute
+
+        # back from the last drop, the minutes apart kept above the ones needed after it
+        gap = Fraction(0)
+        for drop, cheapest in reversed(drops):
+            if not drop:
+                continue
+            if drop >= cheapest:
+                return last_opening, last_closing, end_minute - start_minute + 1
+            gap = (gap + drop) * cheapest / (cheapest - drop)
+        return last_opening, last_closing, min(floor(gap) + 1, end_minute - start_minute + 1)
+
+    def _opens_line(self, start_minute, minute):
+        """
+        :return: whether the time type of minute opens a line which didn't close since start_minute
+        """
+        for line_id, minutes in enumerate(self.line_open_minutes):
+            if minute % MINUTES_PER_WEEK in minutes and not self.closes_line(line_id, start_minute, minute):
+                return True
+        return False
+
+    def _closes_any_line(self, minute):
+        """
+        :return: whether the time type of minute closes a line
+        """
+        return any(minute % MINUTES_PER_WEEK in minutes for minutes in self.line_close_minutes)
+
+    def closes_line(self, line_id, start_minute, end_minute):
+        """
+        a route boarding a line again after it closed would only have waited for it, riding the other lines
+        :return: whether a time type of (start_minute, end_minute] closes the line
+        """
+        return self._has_minute(self.line_close_minutes[line_id], start_minute, end_minute)
+
+    def get_latest_arrival(self, start_minute, station_number):
+        """
+        a station, with the interchange before it, costs at most the max take and change cost of the time types
+        seen since start_minute
+        :return: latest minute a route of station_number stations departing at start_minute can arrive
+        """
+        type_number = self.type_number
+        station_minutes = [max(self.take_costs[type_id::type_number], default=0) + self.change_costs[type_id]
+                           for type_id in range(type_number)]
+        max_minutes = max(station_minutes)
+        table = self.time_type_table
+        minute = start_minute
+        step = station_minutes[table[minute % MINUTES_PER_WEEK]]
+        for idx in range(station_number):
+            if step == max_minutes:
+                return minute + (station_number - idx) * max_minutes
+            next_minute = minute + step
+            for seen in range(minute + 1, next_minute + 1):
+                step = max(step, station_minutes[table[seen % MINUTES_PER_WEEK]])
+            minute = next_minute
+        return minute
+
+    @staticmethod
+    def _has_minute(minutes, start_minute, end_minute):
+        if not minutes or end_minute <= start_minute:
+            return False
+        if end_minute - start_minute >= MINUTES_PER_WEEK:
+            return True
+        start = start_minute % MINUTES_PER_WEEK
+        end = start + end_minute - start_minute
+        idx = bisect_right(minutes, start)
+        if idx < len(minutes) and minutes[idx] <= end:
+            return True
+        # the window runs into the next week
+        return minutes[0] <= end - MINUTES_PER_WEEK
+
+    @staticmethod
+    def _iter_minutes(minutes, start_minute, end_minute):
+        """
+        :param minutes: sorted minutes of the week
+        :return: iterator of their minutes in (start_minute, end_minute], from start_minute on
+        """
+        if not minutes:
+            return
+        week = start_minute - start_minute % MINUTES_PER_WEEK
+        idx = bisect_right(minutes, start_minute - week)
+        while True:
+            # the window runs into the next week
+            if idx == len(minutes):
+                idx = 0
+                week += MINUTES_PER_WEEK
+            minute = week + minutes[idx]
+            if minute > end_minute:
+                return
+            yield minute
+            idx += 1
+
+    def get_reachable_stations(self, start):
+        """
+        :return: set of station ids reached from start on the lines operated in any time type
+        """
+        reachable = self._reachable_stations.get(start)
+        if reachable is None:
+            reachable = frozenset(self._search_reachable_stations(start))
+            self._reachable_stations[start] = reachable
+        return set(reachable)
+
+    def _search_reachable_stations(self, start):
+        type_number = self.type_number
+        operated = [any(self.line_open[line_id * type_number:(line_id + 1) * type_number])
+                    for line_id in range(len(self.line_names))]
+        nodes = [node for node in self.get_nodes(start) if operated[self.node_line[node]]]
+        seen = set(nodes)
+        while nodes:
+            node = nodes.pop()
+            for offsets, targets in ((self.ride_offsets, self.ride_targets),
+                                     (self.interchange_offsets, self.interchange_targets)):
+                for idx in range(offsets[node], offsets[node + 1]):
+                    next_node = targets[idx]
+                    if next_node not in seen and operated[self.node_line[next_node]]:
+                        seen.add(next_node)
+                        nodes.append(next_node)
+        return {self.node_station[node] for node in seen} | {start}
+
+    def __getstate__(self):
+        # the time type table and the compiled arrays may be views of a mapped network file, they are copied to be
+        # pickled
+        state = self.__dict__.copy()
+        for name, value in state.items():
+            if isinstance(value, memoryview):
+                state[name] = array(value.format, value)
+        return state
+
+    @property
+    def node_number(self):
+        return len(self.node_station)
+
+    def nbytes(self):
+        """
+        :return: bytes used by the arrays, the shared time type table is not counted
+        """
+        arrays = (self.node_station, self.node_line, self.node_position, self.station_offsets, self.station_nodes,
+                  self.ride_offsets, self.ride_targets, self.interchange_offsets, self.interchange_targets,
+                  self.change_costs, self.take_costs, self.line_open, self.overtaking_minutes,
+                  self.line_change_minutes) + tuple(self.line_close_minutes)
+        return sum(item.itemsize * len(item) for item in arrays)
+
+    def get_nodes(self, station_id):
+        return self.station_nodes[self.station_offsets[station_id]:self.station_offsets[station_id + 1]]
+
+    def get_station_id(self, station):
+        return self.station_ids[station.name]
+
+    def to_station2station(self, railway_data, legs):
+        """
+        :param legs: list of (from node, to node) of one line each
+        :return: list of new Station2Station on the domain objects of railway_data
+        """
+        stations = railway_data.station_name_dict
+        lines = railway_data.line_name_dict
+        return [Station2Station(stations[self.station_names[self.node_station[from_node]]],
+                                lines[self.line_names[self.node_line[from_node]]],
+                                stations[self.station_names[self.node_station[to_node]]])
+                for from_node, to_node in legs]
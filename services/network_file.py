@@ -0,0 +1,278 @@
+import hashlib
+import mmap
+import os
+import struct
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from services.distance_table import DistanceTable
+from services.network import COMPILED_ARRAYS
+from services.routes import RailwayData, database_source
+from services.time_types import MINUTES_PER_WEEK, TimeTypeTable
+
+NETWORK_FILE = 'railway.network'
+NETWORK_FILE_MAGIC = b'RAILNET\0'
+NETWORK_FILE_VERSION = 2
+
+# magic, version, section number, digest of the sections, compiled at
+HEADER = struct.Struct('<8sHH20s20s')
+# name, offset, size
+SECTION = struct.Struct('<8sQQ')
+# owner, name, typecode, offset in the arrays section, item number of a compiled array
+ARRAY = struct.Struct('<IIcxxxQQ')
+# sections and arrays start on this alignment, so they are read in place as arrays of their typecode
+ALIGNMENT = 8
+# strings are stored once, records refer to them by index, NULL_STRING is None
+NULL_STRING = 0xFFFFFFFF
+NULL_INT = -2 ** 31
+
+LineRow = namedtuple('LineRow', 'id code')
+StationRow = namedtuple('StationRow', 'id name')
+StationBelongRow = namedtuple('StationBelongRow', 'id line_id station_id sequence opened_at station_code')
+TimeTypeRow = namedtuple('TimeTypeRow', 'id name weekdays time_intervals change_cost')
+TimeCostRow = namedtuple('TimeCostRow', 'id line_id time_type_id take_cost is_open')
+
+# section name -> (record struct, row type, fields which are strings)
+RECORDS = {
+    b'lines': (struct.Struct('<iI'), LineRow, ('code',)),
+    b'stations': (struct.Struct('<iI'), StationRow, ('name',)),
+    b'belongs': (struct.Struct('<iiiiII'), StationBelongRow, ('opened_at', 'station_code')),
+    b'ttypes': (struct.Struct('<iIIIi'), TimeTypeRow, ('name', 'weekdays', 'time_intervals')),
+    b'tcosts': (struct.Struct('<iiiii'), TimeCostRow, ()),
+}
+
+
+class NetworkFileError(ValueError):
+    pass
+
+
+def compile_network_file(path=None, source=None, since=None):
+    """
+    compile the railway tables into a network file
+
+    the file holds the line, station, station belong (in line and sequence order), time type and time cost tables,
+    the time types compiled into a minute of week table, and the arrays of the opening epochs serving the dates
+    from since on: the CompactNetwork arrays of each epoch and the DistanceTable of each topology
+    :param since: first service date whose arrays are compiled, default is today, the earlier epochs are built
+    from the rows when they are searched
+    :return: dict of row and array numbers, size and digest of the file
+    """
+    source = source or database_source
+    path = path or NETWORK_FILE
+    since = since or datetime.now().strftime('%Y-%m-%d')
+    strings = []
+    string_index = {}
+
+    def to_string(value):
+        if value is None:
+            return NULL_STRING
+        if value not in string_index:
+            string_index[value] = len(strings)
+            strings.append(value)
+        return string_index[value]
+
+    def to_int(value):
+        return NULL_INT if value is None else int(value)
+
+    sections = []
+    stats = {}
+    tables = (
+        (b'lines', source.get_lines()),
+        (b'stations', source.get_stations()),
+        (b'belongs', source.get_station_belongs()),
+        (b'ttypes', source.get_time_types()),
+        (b'tcosts', source.get_time_costs()),
+    )
+    for name, rows in tables:
+        record, row_type, string_fields = RECORDS[name]
+        data = bytearray()
+        for row in rows:
+            data += record.pack(*[to_string(getattr(row, field)) if field in string_fields
+                                  else to_int(getattr(row, field)) for field in row_type._fields])
+        sections.append((name, bytes(data)))
+        stats[name.decode()] = len(rows)
+
+    time_types = [RailwayData.parse_time_type(row) for row in dict(tables)[b'ttypes']]
+    time_type_table = TimeTypeTable(time_types)
+    sections.append((b'tnames', struct.pack('<{}I'.format(len(time_type_table.names)),
+                                            *[to_string(name) for name in time_type_table.names])))
+    sections.append((b'ttable', time_type_table.table.tobytes()))
+
+    epochs = RailwayData.load_opening_epochs(source)
+    first_epoch = RailwayData.get_opening_epoch(epochs, since)
+    compiled = []
+    topology_keys = set()
+    for epoch in epochs[epochs.index(first_epoch) if first_epoch else 0:]:
+        # the day after the epoch opens its station codes
+        service_date = (datetime.strptime(epoch, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        network = RailwayData(service_date, source).network
+        compiled.extend((epoch, name, getattr(network, name)) for name in COMPILED_ARRAYS)
+        if network.topology_key not in topology_keys:
+            topology_keys.add(network.topology_key)
+            compiled.extend((network.topology_key, name, item)
+                            for name, item in DistanceTable.build_arrays(network).items())
+    data = bytearray()
+    index = bytearray()
+    for owner, name, item in compiled:
+        data += bytes(-len(data) % ALIGNMENT)
+        index += ARRAY.pack(to_string(owner), to_string(name), item.typecode.encode(), len(data), len(item))
+        data += item.tobytes()
+    sections.append((b'arrays', bytes(data)))
+    sections.append((b'arrindex', bytes(index)))
+    stats['arrays'] = len(compiled)
+
+    encoded = [item.encode('utf-8') for item in strings]
+    offsets = [0]
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    sections.insert(0, (b'strings', struct.pack('<I{}I'.format(len(offsets)), len(encoded), *offsets)
+                        + b''.join(encoded)))
+
+    digest = hashlib.sha1()
+    for name, data in sections:
+        digest.update(name)
+        digest.update(data)
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    directory = []
+    padded = []
+    for name, data in sections:
+        padding = bytes(-offset % ALIGNMENT)
+        offset += len(padding)
+        directory.append(SECTION.pack(name, offset, len(data)))
+        padded.append(padding + data)
+        offset += len(data)
+
+    compiled_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S').encode()
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(NETWORK_FILE_MAGIC, NETWORK_FILE_VERSION, len(sections), digest.digest(),
+                               compiled_at))
+        file.write(b''.join(directory))
+        for data in padded:
+            file.write(data)
+    # workers reading the old file keep their mapping
+    os.replace(temp_path, path)
+
+    stats['size'] = offset
+    stats['digest'] = digest.hexdigest()
+    return stats
+
+
+class NetworkFile(object):
+    """
+    A compiled network file mapped read only, the RailwayData source used instead of the database
+
+    every process maps the same file, so they share its page cache. the minute of week table, and the CompactNetwork
+    and DistanceTable arrays of the compiled epochs, are used in place as memoryviews.
+    the other rows are unpacked each time a RailwayData is built, each process still builds its domain objects
+    from them (snapshot_kb of the startup benchmark)
+    """
+
+    def __init__(self, path=None):
+        self.path = path or NETWORK_FILE
+        with open(self.path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        if len(self._view) < HEADER.size:
+            raise NetworkFileError('{} is not a network file'.format(self.path))
+        magic, version, section_number, digest, compiled_at = HEADER.unpack_from(self._view)
+        if magic != NETWORK_FILE_MAGIC:
+            raise NetworkFileError('{} is not a network file'.format(self.path))
+        if version != NETWORK_FILE_VERSION:
+            raise NetworkFileError('{} is version {}, version {} is expected'.format(
+                self.path, version, NETWORK_FILE_VERSION))
+        self.version = version
+        self.digest = digest.hex()
+        self.compiled_at = compiled_at.decode()
+
+        directory_end = HEADER.size + section_number * SECTION.size
+        if directory_end > len(self._view):
+            raise NetworkFileError('{} is truncated'.format(self.path))
+        self._sections = {}
+        sections_digest = hashlib.sha1()
+        for idx in range(section_number):
+            name, offset, size = SECTION.unpack_from(self._view, HEADER.size + idx * SECTION.size)
+            name = name.rstrip(b'\0')
+            if offset < directory_end or offset + size > len(self._view):
+                raise NetworkFileError('{} is truncated, section {} is out of the file'.format(
+                    self.path, name.decode(errors='replace')))
+            self._sections[name] = self._view[offset:offset + size]
+            sections_digest.update(name)
+            sections_digest.update(self._sections[name])
+        if sections_digest.digest() != digest:
+            raise NetworkFileError('{} is corrupted, its digest does not match'.format(self.path))
+        missing = [name.decode() for name in (b'strings', b'tnames', b'ttable', b'arrays', b'arrindex') + tuple(RECORDS)
+                   if name not in self._sections]
+        if missing:
+            raise NetworkFileError('{} has no {} section'.format(self.path, ', '.join(missing)))
+        self._strings = self._load_strings()
+        self._arrays = self._load_arrays()
+
+    def _load_strings(self):
+        data = self._sections[b'strings']
+        number = struct.unpack_from('<I', data)[0]
+        offsets = struct.unpack_from('<{}I'.format(number + 1), data, 4)
+        start = 4 * (number + 2)
+        return [bytes(data[start + offsets[idx]:start + offsets[idx + 1]]).decode('utf-8') for idx in range(number)]
+
+    def _load_arrays(self):
+        """
+        :return: dict of owner -> {name: memoryview of the array in the file}
+        """
+        data = self._sections[b'arrays']
+        arrays = {}
+        for owner, name, typecode, offset, number in ARRAY.iter_unpack(self._sections[b'arrindex']):
+            typecode = typecode.decode()
+            end = offset + number * struct.calcsize(typecode)
+            if end > len(data):
+                raise NetworkFileError('{} is truncated, array {} is out of its section'.format(
+                    self.path, self._strings[name]))
+            arrays.setdefault(self._strings[owner], {})[self._strings[name]] = data[offset:end].cast(typecode)
+        return arrays
+
+    def _get_rows(self, name):
+        record, row_type, string_fields = RECORDS[name]
+        strings = self._strings
+        positions = [idx for idx, field in enumerate(row_type._fields) if field in string_fields]
+        rows = []
+        for values in record.iter_unpack(self._sections[name]):
+            values = [None if value == NULL_INT else value for value in values]
+            for idx in positions:
+                values[idx] = None if values[idx] == NULL_STRING else strings[values[idx]]
+            rows.append(row_type(*values))
+        return rows
+
+    def get_lines(self):
+        return self._get_rows(b'lines')
+
+    def get_stations(self):
+        return self._get_rows(b'stations')
+
+    def get_station_belongs(self):
+        return self._get_rows(b'belongs')
+
+    def get_opening_dates(self):
+        return list({row.opened_at for row in self.get_station_belongs()})
+
+    def get_time_types(self):
+        return self._get_rows(b'ttypes')
+
+    def get_time_costs(self):
+        return self._get_rows(b'tcosts')
+
+    def build_time_type_table(self, time_types):
+        data = self._sections[b'tnames']
+        names = [self._strings[idx] for idx in struct.unpack('<{}I'.format(len(data) // 4), data)]
+        table = self._sections[b'ttable']
+        if len(table) != MINUTES_PER_WEEK:
+            raise NetworkFileError('{} has a broken time type table'.format(self.path))
+        return TimeTypeTable(time_types, names, table)
+
+    def get_compiled_arrays(self, owner):
+        """
+        :param owner: opening epoch of a CompactNetwork, or topology key of a DistanceTable
+        :return: dict of name -> memoryview, None when they are not compiled
+        """
+        return self._arrays.get(owner)
@@ -0,0 +1,363 @@
+import heapq
+
+from services.dijkstra import EXPANDED_BOARDED, NetworkSearch
+from services.time_types import MINUTES_PER_WEEK
+
+
+class ParetoSearch(NetworkSearch):
+    """
+    Round based multi-criteria search on the lines of a CompactNetwork (RAPTOR)
+
+    round k only finds the routes of k lines, so each round adds one interchange, it scans both directions of every
+    line through a station reached in the last round. a label is (minutes since departure, station number) at a
+    station, it is kept when no label of this or an earlier round arrives as early with as few stations,
+    so the labels of the end station are the Pareto front over travel time, interchanges and stations.
+    costs follow the time type of the moment they happen, as for StationGraphSearch with order_by time,
+    and a line is only boarded when it is operated at boarding time and didn't close since the departure.
+    labels only dominate the ones arriving in the same time type, a later arrival may board a line opened since.
+    that is exact while no line opens and no cost drops (CompactNetwork.can_overtake) until the last route of the
+    front can arrive, and across one drop of the costs when no label was dominated by one less than
+    CompactNetwork.overtaking_leads minutes earlier before it, otherwise the front is searched again on the time
+    expanded graph, where a label only dominates the ones of the same state and minute
+
+    a label is (minutes, stations, alight node, board node, label boarded from), the start label has no nodes
+    """
+
+    def __init__(self, network, read_minutes=None):
+        """
+        :param read_minutes: optional set, filled with every minute whose time type was looked at
+        """
+        super().__init__(network, read_minutes)
+        # number of rounds of the last search, its labels created and dropped are counted by expanded and pruned
+        self.rounds = 0
+        # whether the time expanded search was needed
+        self.fallback = False
+
+        # earliest minute a label was dominated by one less than max_lead minutes earlier, which a drop of the costs
+        # may let overtake it
+        self.close_minute = None
+        self.max_lead = max([lead for lead in network.overtaking_leads.values() if lead], default=0)
+
+        # the nodes of a line are contiguous and in station order
+        self.line_nodes = {}
+        for node in range(network.node_number):
+            self.line_nodes.setdefault(network.node_line[node], []).append(node)
+
+    def search(self, start, end, start_time):
+        """
+        :param start: station id of the network
+        :param end: station id of the network
+        :param start_time: minutes from Monday 00:00
+        :return: list of (minutes, interchanges, stations, route) of the Pareto front, fastest first,
+        each route is a list of (from node, to node) legs
+        """
+        self.latest_minute = start_time
+        self.fallback = False
+        self.close_minute = None
+        front = self._search_by_round(start, end, start_time)
+        fewest_stations = self._get_fewest_stations(start, end)
+        if fewest_stations is None:
+            return front
+        min_interchanges = next(idx for idx, stations in enumerate(fewest_stations) if stations is not None)
+
+        horizon = self._get_horizon(front, fewest_stations, min_interchanges, start_time)
+        if horizon is not None and self._is_exact(start_time, horizon):
+            return front
+
+        self.fallback = True
+        return self._search_time_expanded(start, end, start_time, min_interchanges)
+
+    def _get_horizon(self, front, fewest_stations, min_interchanges, start_time):
+        """
+        a route missing from the front takes at least fewest_stations for its interchanges, and is not dominated by
+        the routes found with as few interchanges and as few stations, so it arrives before them.
+        the front is exact when no later arrival can overtake an earlier one until the last of them,
+        or until the latest arrival of a route with fewer stations than the ones found with as few interchanges
+        :return: minute the front is exact until, None when no route is found with the fewest interchanges
+        """
+        horizon = start_time + max([minutes for minutes, _, _, _ in front], default=0)
+        max_interchanges = max([interchanges for _, interchanges, _, _ in front], default=0)
+        for interchanges in range(min_interchanges, max(len(fewest_stations), max_interchanges + 1)):
+            found = [stations for _, other, stations, _ in front if other <= interchanges]
+            if not found:
+                return None
+            if min(found) > fewest_stations[min(interchanges, len(fewest_stations) - 1)]:
+                horizon = max(horizon, self.network.get_latest_arrival(start_time, min(found) - 1))
+        return horizon
+
+    def _is_exact(self, start_time, horizon):
+        """
+        :return: whether no later arrival can overtake an earlier one until horizon, no line opens and the costs drop
+        once at most, after every label dominated by one less than its lead earlier
+        """
+        self._read_minute(horizon)
+        minutes = self.network.get_overtaking_minutes(start_time, horizon)
+        if not minutes:
+            return True
+        if len(minutes) > 1:
+            return False
+        minute = minutes[0]
+        lead = self.network.get_overtaking_lead(start_time, minute)
+        return lead is not None and (self.close_minute is None or self.close_minute >= minute)
+
+    def _search_by_round(self, start, end, start_time):
+        network = self.network
+        # station -> (minutes, stations, time type) of the labels of every round, which don't dominate each other
+        bests = {start: [(0, 0, self._read_minute(start_time))]}
+        # labels of the end station, by round
+        goals = []
+        reached = {start: [(0, 0, None, None, None)]}
+        while reached:
+            lines = {network.node_line[node] for station in reached for node in network.get_nodes(station)}
+            goals.append([])
+            next_reached = {}
+            for line_id in sorted(lines):
+                nodes = self.line_nodes[line_id]
+                self._scan_line(nodes, reached, next_reached, bests, goals, start_time, end)
+                self._scan_line(nodes[::-1], reached, next_reached, bests, goals, start_time, end)
+            reached = next_reached
+        self.rounds = len(goals)
+
+        front = []
+        for interchanges, labels in enumerate(goals):
+            for label in labels:
+                front.append((label[0], interchanges, label[1], self._to_legs(label)))
+        front.sort(key=lambda item: item[:3])
+        return front
+
+    def _scan_line(self, nodes, reached, next_reached, bests, goals, start_time, end):
+        """
+        ride one direction of a line, arriving at each station with the labels on board and then boarding the
+        labels of the last round at it
+        """
+        network = self.network
+        type_number = network.type_number
+        node_station = network.node_station
+        line_id = network.node_line[nodes[0]]
+        # labels on board: (minutes, stations, board node, label boarded from)
+        route_bag = []
+        for node in nodes:
+            station = node_station[node]
+            if route_bag:
+                moved = []
+                for minutes, stations, board_node, parent in route_bag:
+                    minutes += network.take_costs[line_id * type_number + self._read_minute(start_time + minutes)]
+                    moved.append((minutes, stations + 1, board_node, parent))
+                route_bag = moved
+                for minutes, stations, board_node, parent in route_bag:
+                    self._arrive(station, (minutes, stations, node, board_node, parent), next_reached, bests, goals,
+                                 start_time, end)
+
+            for label in reached.get(station, ()):
+                minutes = label[0]
+                if label[2] is not None:
+                    # interchange from another line, riding on is not boarding
+                    if network.node_line[label[2]] == line_id:
+                        continue
+                    minutes += network.change_costs[self._read_minute(start_time + minutes)]
+                if not network.line_open[line_id * type_number + self._read_minute(start_time + minutes)] or \
+                        network.closes_line(line_id, start_time, start_time + minutes):
+                    continue
+                route_bag = self._add_to_bag(route_bag, (minutes, label[1], node, label), start_time)
+
+    def _arrive(self, station, label, next_reached, bests, goals, start_time, end):
+        minutes, stations = label[0], label[1]
+        # a label no better than a route to the end already found can't lead to a better one
+        for goal in (goal for labels in goals for goal in labels):
+            if goal[0] <= minutes and goal[1] <= stations:
+                self.pruned += 1
+                return
+        item = (minutes, stations, self._read_minute(start_time + minutes))
+        best = bests.setdefault(station, [])
+        dominating = [other for other in best if self._dominates(other, item)]
+        if dominating:
+            self._note_leads(dominating, item, start_time)
+            self.pruned += 1
+            return
+
+        self.expanded += 1
+        dominated = [other for other in best if self._dominates(item, other)]
+        for other in dominated:
+            self._note_leads([item], other, start_time)
+        best[:] = [other for other in best if other not in dominated]
+        best.append(item)
+        if station == end:
+            goals[-1][:] = [goal for goal in goals[-1] if not (minutes <= goal[0] and stations <= goal[1])]
+            goals[-1].append(label)
+        else:
+            next_reached.setdefault(station, []).append(label)
+
+    def _add_to_bag(self, route_bag, item, start_time):
+        """
+        :param item: (minutes, stations, board node, label boarded from)
+        """
+        key = (item[0], item[1], self._read_minute(start_time + item[0]))
+        keys = [(other[0], other[1], self._read_minute(start_time + other[0])) for other in route_bag]
+        dominating = [other_key for other_key in keys if self._dominates(other_key, key)]
+        if dominating:
+            self._note_leads(dominating, key, start_time)
+            return route_bag
+        kept = []
+        for other, other_key in zip(route_bag, keys):
+            if self._dominates(key, other_key):
+                self._note_leads([key], other_key, start_time)
+            else:
+                kept.append(other)
+        kept.append(item)
+        return kept
+
+    def _note_leads(self, dominating, item, start_time):
+        """
+        keeps close_minute, when item is dominated by labels less than max_lead minutes earlier only
+        """
+        leads = [item[0] - other[0] for other in dominating]
+        if all(0 < lead < self.max_lead for lead in leads):
+            minute = start_time + max(other[0] for other in dominating)
+            if self.close_minute is None or minute < self.close_minute:
+                self.close_minute = minute
+
+    @staticmethod
+    def _dominates(item, other):
+        """
+        an earlier arrival is only better in the same time type, a line may open or costs may change later
+        """
+        return item[2] == other[2] and item[0] <= other[0] and item[1] <= other[1]
+
+    def _search_time_expanded(self, start, end, start_time, min_interchanges):
+        """
+        label setting by minutes, a state is node * 3 + EXPANDED_*, a ride keeps its direction.
+        a label is (minutes, interchanges, stations, state, label before, bit set of the stations passed),
+        kept when no label of the same state and minute has as few interchanges and stations,
+        and no route to the end arrives as early with as few.
+        as in NetworkSearch._settle_time_expanded, a route never passes a station twice nor boards a line closed since
+        the departure
+        """
+        network = self.network
+        node_station = network.node_station
+        node_line = network.node_line
+        state_number = network.node_number * 3
+        # minutes * state_number + state -> labels
+        bags = {}
+        heap = []
+        goals = []
+
+        def add(label):
+            bag_key = label[0] * state_number + label[3]
+            bag = bags.get(bag_key)
+            if bag is None:
+                bags[bag_key] = [label]
+                heapq.heappush(heap, (label[0], label[3]))
+            elif any(other[1] <= label[1] and other[2] <= label[2] for other in bag):
+                self.pruned += 1
+            else:
+                bag[:] = [other for other in bag if not (label[1] <= other[1] and label[2] <= other[2])]
+                bag.append(label)
+
+        start_type = self._read_minute(start_time)
+        for node in network.get_nodes(start):
+            if network.line_open[network.node_line[node] * network.type_number + start_type]:
+                add((0, 0, 0, node * 3 + EXPANDED_BOARDED, None, 1 << start))
+
+        while heap:
+            minutes, state = heapq.heappop(heap)
+            if minutes >= MINUTES_PER_WEEK:
+                break
+            node, mode = divmod(state, 3)
+            # the edges are the same for every label of the state and minute
+            edges = None
+            for label in bags[minutes * state_number + state]:
+                interchanges, stations = label[1], label[2]
+                # the route can't take fewer interchanges than min_interchanges
+                if any(goal[1] <= max(interchanges, min_interchanges) and goal[2] <= stations for goal in goals):
+                    self.pruned += 1
+                    continue
+                self.expanded += 1
+                if mode != EXPANDED_BOARDED and node_station[node] == end:
+                    goals[:] = [goal for goal in goals if not (goal[0] == minutes and interchanges <= goal[1]
+                                                               and stations <= goal[2])]
+                    goals.append(label)
+                    continue
+
+                if edges is None:
+                    edges = self._get_expanded_edges(node, mode, start_time + minutes)
+                for next_node, next_mode, cost in edges:
+                    if next_mode == EXPANDED_BOARDED:
+                        if not network.closes_line(node_line[next_node], start_time, start_time + minutes + cost):
+                            add((minutes + cost, interchanges + 1, stations, next_node * 3 + next_mode, label,
+                                 label[5]))
+                    elif not label[5] >> node_station[next_node] & 1:
+                        add((minutes + cost, interchanges, stations + 1, next_node * 3 + next_mode, label,
+                             label[5] | 1 << node_station[next_node]))
+
+        front = [(label[0], label[1], label[2], self._to_expanded_legs(label)) for label in goals]
+        front.sort(key=lambda item: item[:3])
+        return front
+
+    def _get_fewest_stations(self, start, end):
+        """
+        rounds over the lines operated in any time type, without time, riding on a line again counts an interchange
+        :return: list of the fewest stations from start to end with at most as many interchanges as its index, None
+        before the fewest interchanges, up to the round with the fewest stations, None if end is unreachable
+        """
+        network = self.network
+        type_number = network.type_number
+        node_station = network.node_station
+        operated = {line_id for line_id in self.line_nodes
+                    if any(network.line_open[line_id * type_number:(line_id + 1) * type_number])}
+        # station -> fewest stations of any round so far
+        bests = {start: 0}
+        reached = {start: 0}
+        fewest = []
+        while reached:
+            lines = {network.node_line[node] for station in reached for node in network.get_nodes(station)}
+            next_reached = {}
+            for line_id in sorted(lines & operated):
+                nodes = self.line_nodes[line_id]
+                for direction in (nodes, nodes[::-1]):
+                    on_board = None
+                    for node in direction:
+                        station = node_station[node]
+                        if on_board is not None:
+                            on_board += 1
+                            if on_board < bests.get(station, on_board + 1):
+                                bests[station] = on_board
+                                next_reached[station] = on_board
+                        boarded = reached.get(station)
+                        if boarded is not None and (on_board is None or boarded < on_board):
+                            on_board = boarded
+            reached = next_reached
+            fewest.append(bests.get(end))
+            if end in reached:
+                reached.pop(end)
+        if fewest[-1] is None:
+            return None
+        # the last round found nothing new
+        while len(fewest) > 1 and fewest[-2] == fewest[-1]:
+            fewest.pop()
+        return fewest
+
+    @staticmethod
+    def _to_expanded_legs(label):
+        states = []
+        while label is not None:
+            states.append(label[3])
+            label = label[4]
+        states.reverse()
+        # the first state boards the first line
+        leg_start = states[0] // 3
+        legs = []
+        for idx, state in enumerate(states):
+            if state % 3 == EXPANDED_BOARDED:
+                if idx:
+                    legs.append((leg_start, states[idx - 1] // 3))
+                leg_start = state // 3
+        legs.append((leg_start, states[-1] // 3))
+        return tuple(legs)
+
+    @staticmethod
+    def _to_legs(label):
+        legs = []
+        while label[2] is not None:
+            legs.append((label[3], label[2]))
+            label = label[4]
+        return tuple(reversed(legs))
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+from services.bfs import MetroLineSearch
+from services.snapshot import get_railway_data
+
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+class ProfileSearch(object):
+    """
+    Best departures of a time window, the Pareto set of (departure, arrival) of order_by time searches
+
+    a search only depends on the departure through the time types of the minutes it looked at,
+    and time types are constant in runs (segments) of minutes,
+    so a search answers every later departure until one of these minutes, shifted, leaves its segment.
+    the window is covered by jumping from one such change to the next instead of searching every minute.
+    a departure is dominated when a later one arrives no later, the options of the window which are not dominated
+    are returned as runs of departures sharing the same route and time cost
+
+    it is not one scan of the window, every piece is a full point search of the engine (MetroLineSearch.run, which
+    may fall back to the time expanded graph), without the search result cache. while the trips cross a time type
+    change, each later departure moves a read minute past it and is searched again, so a window costs about one
+    search per segment plus one per minute of departures whose trips cross a change (searches counts them)
+    """
+
+    def __init__(self, from_station, to_station, depart_from, depart_to, engine='bfs', revisit_lines=False):
+        """
+        :param depart_from: first departure, '%Y-%m-%d %H:%M'
+        :param depart_to: last departure, '%Y-%m-%d %H:%M'
+        :param revisit_lines: see MetroLineSearch
+        """
+        self.from_station = from_station
+        self.to_station = to_station
+        self.depart_from = datetime.strptime(depart_from, TIME_FORMAT)
+        self.depart_to = datetime.strptime(depart_to, TIME_FORMAT)
+        self.engine = engine
+        self.revisit_lines = revisit_lines
+        # number of searches run for the window
+        self.searches = 0
+
+    def generate_profile(self):
+        if self.depart_to < self.depart_from:
+            return self.generate_failed_result('depart_to is earlier than depart_from')
+
+        pieces = self._search_pieces()
+        failed = [result for _, _, result in pieces if result['result'] != 'success']
+        if len(failed) == len(pieces):
+            return self.generate_failed_result(failed[0]['description'])
+
+        options = []
+        # latest departures first, keep the departures arriving before every later departure
+        best_arrival = None
+        for first, last, result in reversed(pieces):
+            if result['result'] != 'success':
+                continue
+            route = min(result['suggest_routes'], key=lambda item: item['total_cost'])
+            time_cost = route['total_cost']
+            if best_arrival is not None:
+                last = min(last, best_arrival - time_cost - 1)
+            if last >= first:
+                options.append((first, last, route))
+            if best_arrival is None or first + time_cost < best_arrival:
+                best_arrival = first + time_cost
+
+        options = [self._render_option(first, last, route)
+                   for first, last, route in self._merge_options(reversed(options))]
+        return {
+            'result': 'success',
+            'description': '{} departure option(s) found'.format(len(options)),
+            'profile': options
+        }
+
+    def _search_pieces(self):
+        """
+        :return: list of (first, last, result), departures as minutes from depart_from, last is inclusive
+        """
+        pieces = []
+        window = int((self.depart_to - self.depart_from).total_seconds() // 60)
+        minute = 0
+        while minute <= window:
+            departure = self.depart_from + timedelta(minutes=minute)
+            railway_data = get_railway_data(departure.strftime('%Y-%m-%d'))
+            search = MetroLineSearch(self.from_station, self.to_station, departure.strftime(TIME_FORMAT), 'time',
+                                     railway_data, self.engine, revisit_lines=self.revisit_lines)
+            read_minutes = set()
+            context = search.run(read_minutes)
+            self.searches += 1
+
+            # the same search from a later departure reads the same time types until one read minute
+            # reaches the end of its time type segment
+            time_type_table = railway_data.time_type_table
+            last = minute + min((time_type_table.get_segment(read)[1] - read - 1 for read in read_minutes),
+                                default=window)
+            # a new day may be a new opening epoch
+            next_day = datetime(departure.year, departure.month, departure.day) + timedelta(days=1)
+            last = min(last, window, int((next_day - self.depart_from).total_seconds() // 60) - 1)
+
+            if pieces and pieces[-1][2] == context.result:
+                pieces[-1] = (pieces[-1][0], last, context.result)
+            else:
+                pieces.append((minute, last, context.result))
+            minute = last + 1
+        return pieces
+
+    def _render_option(self, first, last, route):
+        time_cost = route['total_cost']
+        return {
+            'depart_from': self._format_minute(first),
+            'depart_to': self._format_minute(last),
+            'arrive_from': self._format_minute(first + time_cost),
+            'arrive_to': self._format_minute(last + time_cost),
+            'time_cost': time_cost,
+            'total_station': route['total_station'],
+            'total_interchange': route['total_interchange'],
+            'summary': route['summary']
+        }
+
+    @staticmethod
+    def _merge_options(options):
+        """
+        merge the runs of departures next to each other which take the same route in the same time
+        """
+        merged = []
+        for first, last, route in options:
+            if merged:
+                previous_first, previous_last, previous_route = merged[-1]
+                if previous_last + 1 == first and previous_route['summary'] == route['summary']:
+                    merged[-1] = (previous_first, last, previous_route)
+                    continue
+            merged.append((first, last, route))
+        return merged
+
+    def _format_minute(self, minute):
+        return (self.depart_from + timedelta(minutes=minute)).strftime(TIME_FORMAT)
+
+    @staticmethod
+    def generate_failed_result(error_info):
+        return {
+            'result': 'failed',
+            'description': error_info,
+            'profile': []
+        }
@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+
+from services.dijkstra import BOARDED, DONE, EXPAND, EXPANDED_BOARDED, RIDING, STOP, NetworkSearch
+from services.snapshot import get_railway_data
+from services.time_types import MINUTES_PER_WEEK, minute_of_week
+
+# a label key is minutes since departure << 32 | interchange number << 16 | station number
+MINUTE_SHIFT = 32
+INTERCHANGE_SHIFT = 16
+FIELD_MASK = (1 << INTERCHANGE_SHIFT) - 1
+ARRIVAL_KEY = (MINUTE_SHIFT, 1, 1 << INTERCHANGE_SHIFT)
+
+
+class EarliestArrivalSearch(NetworkSearch):
+    """
+    One to all earliest arrival search by Dijkstra on the station graph of a CompactNetwork
+
+    costs follow the time type of the moment they happen, as for StationGraphSearch with order_by time:
+    a station costs the take cost of its line, an interchange the change cost,
+    and a line is only boarded when it is operated at boarding time.
+    a state is settled once per time type it is reached in, an earlier arrival in another time type
+    doesn't settle it, the later one may board a line opened since.
+    that is exact until a line opens or a cost gets lower (CompactNetwork.can_overtake), when it happens
+    during the trips the search is run again on the time expanded graph, keeping a state once per minute
+    but dropping the labels of a state dominated by an earlier one until the last arrival of the first search.
+    ties on arrival time are broken by interchange number then station number
+    """
+
+    def __init__(self, network):
+        super().__init__(network)
+        # whether the time expanded search was needed
+        self.fallback = False
+
+    def run(self, start, start_time, within=None, targets=None):
+        """
+        :param start: station id of the network
+        :param within: only stations reached within this number of minutes, None is no limit
+        :param targets: optional set of station ids, the search stops once they are all reached,
+        the other stations may be missing then
+        :return: dict of station id -> (minutes, station number, interchange number), start station excluded
+        """
+        self.fallback = False
+        self.expanded = 0
+        self.pruned = 0
+        reachable = self.network.get_reachable_stations(start)
+        reachable.discard(start)
+        if targets is not None:
+            reachable &= targets
+        reached = self._run_by_time_type(start, start_time, within, reachable)
+
+        # the result depends on the time types until the horizon, the last arrival or the limit
+        if all(station in reached for station in reachable):
+            horizon = start_time + max([reached[station][0] for station in reachable], default=0)
+        elif within is not None:
+            horizon = start_time + within
+        else:
+            horizon = None
+        if horizon is not None and not self.network.can_overtake(start_time, horizon):
+            self.latest_minute = max(self.latest_minute, horizon)
+            return reached
+
+        self.fallback = True
+        return self._run_time_expanded(start, start_time, within, reachable, horizon)
+
+    def _run_by_time_type(self, start, start_time, within, targets):
+        network = self.network
+        type_number = network.type_number
+        node_station = network.node_station
+        self.latest_minute = start_time
+        limit = None if within is None else (within + 1) << MINUTE_SHIFT
+
+        # a label is a state and the time type it is reached in: state * type_number + time type
+        start_type = self._read_minute(start_time)
+        start_labels = [((node * 2 + BOARDED) * type_number + start_type, 0) for node in network.get_nodes(start)
+                        if network.line_open[network.node_line[node] * type_number + start_type]]
+
+        reached = {}
+        left = len(targets)
+
+        def settle(label, key, priority):
+            nonlocal left
+            if limit is not None and key >= limit:
+                return STOP
+            state = label // type_number
+            station = node_station[state >> 1]
+            if state & 1 == RIDING and station != start and station not in reached:
+                reached[station] = (key >> MINUTE_SHIFT, key & FIELD_MASK, (key >> INTERCHANGE_SHIFT) & FIELD_MASK)
+                if station in targets:
+                    left -= 1
+                    if not left:
+                        return DONE
+            return EXPAND
+
+        if targets:
+            self._settle_by_time_type(start_labels, start_time, settle, key_layout=ARRIVAL_KEY,
+                                      label_types=type_number)
+        return reached
+
+    def _run_time_expanded(self, start, start_time, within, targets, horizon=None):
+        """
+        exact search, a state reached at another minute is another label,
+        on the shared time expanded search of NetworkSearch, so a station reached only by riding around until a closed
+        line opens again is not reached.
+        stops at the limit, once every station of targets is reached, or after a week.
+        the labels dominated until horizon are dropped, it is searched again until the latest arrival of a route
+        passing every reachable station when a station of targets is not reached before horizon
+        :param horizon: optional minute the stations of targets are expected to be reached by
+        """
+        network = self.network
+        self.latest_minute = start_time
+        # a route passes a station once at most
+        longest = network.get_latest_arrival(start_time, len(network.get_reachable_stations(start)) - 1)
+        if within is not None:
+            longest = min(longest, start_time + within)
+        if horizon is not None and horizon < longest:
+            self._read_minute(horizon)
+            reached = self._settle_reached_time_expanded(start, start_time, within, targets, horizon)
+            if all(station in reached and start_time + reached[station][0] <= horizon for station in targets):
+                return reached
+        self._read_minute(longest)
+        return self._settle_reached_time_expanded(start, start_time, within, targets, longest)
+
+    def _settle_reached_time_expanded(self, start, start_time, within, targets, horizon=None):
+        network = self.network
+        node_station = network.node_station
+        state_number = network.node_number * 3
+        limit = (MINUTES_PER_WEEK if within is None else min(within + 1, MINUTES_PER_WEEK)) << MINUTE_SHIFT
+
+        start_labels = self._get_expanded_start_labels(start, start_time)
+        reached = {}
+        left = len(targets)
+
+        def settle(label, key, priority):
+            nonlocal left
+            if key >= limit:
+                return STOP
+            node, mode = divmod(label % state_number, 3)
+            station = node_station[node]
+            if mode != EXPANDED_BOARDED and station != start and station not in reached:
+                reached[station] = (key >> MINUTE_SHIFT, key & FIELD_MASK, (key >> INTERCHANGE_SHIFT) & FIELD_MASK)
+                if station in targets:
+                    left -= 1
+                    if not left:
+                        return DONE
+            return EXPAND
+
+        if targets:
+            self._settle_time_expanded(start_labels, start_time, settle, key_layout=ARRIVAL_KEY, horizon=horizon)
+        return reached
+
+
+class ReachableSearch(object):
+    """
+    Every station reachable from one station within a number of minutes, by one earliest arrival search
+    """
+
+    def __init__(self, from_station, time, within, railway_data=None):
+        self.from_station = from_station
+        self.time = datetime.strptime(time, '%Y-%m-%d %H:%M')
+        self.start_minute = minute_of_week(self.time)
+        self.within = within
+        if railway_data is None:
+            railway_data = get_railway_data(self.time.strftime('%Y-%m-%d'))
+        self.railway_data = railway_data
+
+    def generate_reachable_stations(self):
+        station = self.railway_data.station_name_dict.get(self.from_station)
+        if station is None:
+            return self._generate_failed_result(self.from_station + "  is not contain")
+
+        if not station.codes:
+            return self._generate_failed_result(self.from_station + " is not in operation or opened")
+
+        network = self.railway_data.network
+        reached = EarliestArrivalSearch(network).run(network.get_station_id(station), self.start_minute,
+                                                     self.within)
+
+        stations = []
+        for station_id, (minutes, total_station, total_interchange) in sorted(
+                reached.items(), key=lambda item: (item[1], network.station_names[item[0]])):
+            stations.append({
+                'name': network.station_names[station_id],
+                'arrival_time': (self.time + timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M'),
+                'time_cost': minutes,
+                'total_station': total_station,
+                'total_interchange': total_interchange
+            })
+
+        return {
+            'result': 'success',
+            'description': '{} station(s) reachable within {} minutes'.format(len(stations), self.within),
+            'stations': stations
+        }
+
+    @staticmethod
+    def _generate_failed_result(error_info):
+        return {
+            'result': 'failed',
+            'description': error_info,
+            'stations': []
+        }
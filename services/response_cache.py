@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from services.snapshot import railway_data_cache
+
+
+class SearchResultCache(object):
+    """
+    LRU and TTL cache of search results
+
+    a result depends on the departure time only through the time types the search looked at,
+    and every time in a result is relative to the departure, so a result computed at departure t
+    is exactly the result of any departure t' of the same time type segment
+    as long as [t', t' + span] stays in the segment, span being the latest minute the search looked at minus t.
+    results are cached per bucket of time_bucket minutes inside a segment, and checked against their span on lookup,
+    results whose span crosses the segment end are only reused for the very same minute.
+
+    results are kept as json, every caller gets its own copy and may change it.
+    the cache is cleared whenever the network snapshots are invalidated
+    """
+
+    def __init__(self, max_size=10000, ttl=3600, time_bucket=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.time_bucket = time_bucket
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._version = railway_data_cache.version
+        self._lock = threading.Lock()
+
+    def get(self, search):
+        """
+        :param search: MetroLineSearch
+        :return: a copy of the cached result or None
+        """
+        with self._lock:
+            self._check_version()
+            segment_start, segment_end = self._get_segment(search)
+            bucket_key = self._bucket_key(search, segment_start)
+            for key in (self._exact_key(search), bucket_key):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                result, span, expire_at = entry
+                if expire_at < time.monotonic():
+                    del self._entries[key]
+                    self.expirations += 1
+                    continue
+                # an exact entry is the result of this very minute, a bucket entry must fit in the segment
+                if key == bucket_key and search.start_minute + span >= segment_end:
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(result)
+
+            self.misses += 1
+            return None
+
+    def put(self, search, result, latest_minute):
+        """
+        :param latest_minute: latest minute whose time type the search looked at
+        """
+        if self.max_size <= 0:
+            return
+
+        span = latest_minute - search.start_minute
+        result = json.dumps(result)
+        with self._lock:
+            self._check_version()
+            segment_start, segment_end = self._get_segment(search)
+            if search.start_minute + span < segment_end:
+                key = self._bucket_key(search, segment_start)
+            else:
+                key = self._exact_key(search)
+
+            self._entries[key] = (result, span, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations
+        }
+
+    def _check_version(self):
+        if self._version != railway_data_cache.version:
+            self._entries.clear()
+            self._version = railway_data_cache.version
+            self.invalidations += 1
+
+    @staticmethod
+    def _get_segment(search):
+        return search.time_type_table.get_segment(search.start_minute)
+
+    @staticmethod
+    def _base_key(search):
+        return (search.railway_data.opening_epoch, search.from_station, search.to_station, search.order_by, search.engine,
+                search.alternatives, search.max_detour, search.revisit_lines)
+
+    def _exact_key(self, search):
+        return self._base_key(search) + ('at', search.start_minute)
+
+    def _bucket_key(self, search, segment_start):
+        bucket = max(self.time_bucket, 1)
+        return self._base_key(search) + ('in', segment_start, search.start_minute // bucket)
+
+
+search_result_cache = SearchResultCache()
@@ -1,15 +1,64 @@
+from bisect import bisect_left
 from datetime import datetime
 
 from domains.domains import Line, Station, LineTimeCost
 from models.models import Line as ModelLine, Station as ModelStation, StationBelong, TimeType, TimeCost
+from services.network import CompactNetwork
+from services.time_types import TimeTypeTable
+
+
+class DatabaseSource(object):
+    """
+    Rows of the railway tables, read with the models
+    """
+
+    @staticmethod
+    def get_lines():
+        return ModelLine.query.all()
+
+    @staticmethod
+    def get_stations():
+        return ModelStation.query.all()
+
+    @staticmethod
+    def get_station_belongs():
+        return StationBelong.query.order_by(StationBelong.line_id, StationBelong.sequence).all()
+
+    @staticmethod
+    def get_opening_dates():
+        return [row.opened_at for row in StationBelong.query.with_entities(StationBelong.opened_at).distinct()]
+
+    @staticmethod
+    def get_time_types():
+        return TimeType.query.all()
+
+    @staticmethod
+    def get_time_costs():
+        return TimeCost.query.all()
+
+    @staticmethod
+    def build_time_type_table(time_types):
+        return TimeTypeTable(time_types)
+
+    @staticmethod
+    def get_compiled_arrays(owner):
+        # nothing is compiled in the database, the arrays are built
+        return None
+
+
+database_source = DatabaseSource()
 
 
 class RailwayData(object):
     """
     This class just cook data for BFS algorithm from sqlite database
+
+    only the station codes opened before start_date are loaded, so lines, interchanges and the network
+    are already limited to what is open, and every date of the same opening epoch gets the same data.
+    rows are read from source, the database by default or a compiled NetworkFile
     """
 
-    def __init__(self, start_date):
+    def __init__(self, start_date, source=None):
         self.station_name_dict = {}
         self.lines = []
         self.station_code_dict = {}
@@ -18,11 +67,16 @@ class RailwayData(object):
         self.line_name_dict = {}
         self.time_type_dict = {}
         self.time_type_name_dict = {}
+        self.time_type_table = None
+        self.network = None
+        self.topology_key = None
+        self.opening_epoch = ''
         self.start_date = start_date
+        self.source = source or database_source
         self.load()
 
     def load(self):
-        lines = ModelLine.query.all()
+        lines = self.source.get_lines()
         for item in lines:
             line_name = item.code
             line_id = item.id
@@ -33,18 +87,16 @@ class RailwayData(object):
 
         self._load_stations()
 
-        stations_in_line = self._load_station_belong()
-
-        for line in self.lines:
-            line_id = line.line_id
-            stations = stations_in_line[line_id]
-            line.stations = stations
+        self._load_station_belong()
 
         self._refill_line_in_station()
         self._load_line_cost()
+        self.network = CompactNetwork(self, self.source.get_compiled_arrays(self.opening_epoch))
+        # searches without time cost are cached by the numbering of the network
+        self.topology_key = self.network.topology_key
 
     def _load_stations(self):
-        stations = ModelStation.query.all()
+        stations = self.source.get_stations()
 
         for item in stations:
             station_id = item.id
@@ -54,7 +106,7 @@ class RailwayData(object):
             self.station_name_dict[item.name] = station
 
     def _load_station_belong(self):
-        station_belongs = StationBelong.query.order_by(StationBelong.line_id, StationBelong.sequence).all()
+        station_belongs = self.source.get_station_belongs()
         stations_in_line = {}
         for belong in station_belongs:
             line_id = belong.line_id
@@ -63,7 +115,9 @@ class RailwayData(object):
             line_stations = stations_in_line.get(line_id, [])
 
             station = self.station_id_dict[station_id]
-            opened_at = datetime.strptime(belong.opened_at, '%Y-%m-%d').strftime('%Y-%m-%d')
+            opened_at = self.format_opened_at(belong.opened_at)
+            if opened_at >= self.start_date:
+                continue
             station_code = belong.station_code
             station_sequence = belong.sequence
 
@@ -79,8 +133,39 @@ class RailwayData(object):
             self.station_code_dict[station_code] = station
             stations_in_line[line_id] = line_stations
 
+            if self.opening_epoch < opened_at:
+                self.opening_epoch = opened_at
+
+        for line in self.lines:
+            stations = stations_in_line.get(line.line_id, [])
+            line.stations = stations
+            # position of each station in the line, for O(1) membership and distance checks
+            line.station_index = {}
+            for idx, station in enumerate(stations):
+                line.station_index.setdefault(station, idx)
         return stations_in_line
 
+    @staticmethod
+    def format_opened_at(opened_at):
+        return datetime.strptime(opened_at, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+    @classmethod
+    def load_opening_epochs(cls, source=None):
+        """
+        :return: sorted distinct opening dates of the station codes, the network only changes on these dates
+        """
+        opening_dates = (source or database_source).get_opening_dates()
+        return sorted({cls.format_opened_at(opened_at) for opened_at in opening_dates})
+
+    @staticmethod
+    def get_opening_epoch(epochs, service_date):
+        """
+        :param epochs: sorted opening dates
+        :return: the latest opening date before service_date, '' when nothing is opened yet
+        """
+        idx = bisect_left(epochs, service_date)
+        return epochs[idx - 1] if idx else ''
+
     def _refill_line_in_station(self):
 
         for line in self.lines:
@@ -104,28 +189,38 @@ class RailwayData(object):
 
             line.transform_stations = interchangeable_stations
 
+    @staticmethod
+    def parse_time_type(time_type):
+        """
+        :param time_type: row of the time type table
+        :return: LineTimeCost with the parsed weekdays and time intervals
+        """
+        if time_type.weekdays:
+            weekdays = time_type.weekdays.split(',')
+        else:
+            weekdays = []
+        time_intervals = []
+        if time_type.time_intervals:
+            intervals = time_type.time_intervals.split(',')
+            for interval in intervals:
+                time_intervals.append(tuple(interval.split('-')))
+        time_cost = LineTimeCost(time_type.name, time_type.id)
+        time_cost.time_intervals = time_intervals
+        time_cost.weekdays = weekdays
+        time_cost.change_cost = time_type.change_cost
+        return time_cost
+
     def _load_line_cost(self):
-        time_types = TimeType.query.all()
+        time_types = self.source.get_time_types()
         time_type_dict = {}
         for time_type in time_types:
-
-            if time_type.weekdays:
-                weekdays = time_type.weekdays.split(',')
-            else:
-                weekdays = []
-            time_intervals = []
-            if time_type.time_intervals:
-                intervals = time_type.time_intervals.split(',')
-                for interval in intervals:
-                    time_intervals.append(tuple(interval.split('-')))
-            time_cost = LineTimeCost(time_type.name, time_type.id)
-            time_cost.time_intervals = time_intervals
-            time_cost.weekdays = weekdays
-            time_cost.change_cost = time_type.change_cost
+            time_cost = self.parse_time_type(time_type)
             time_type_dict[time_type.id] = time_cost
             self.time_type_name_dict[time_type.name] = time_cost
 
-        time_cost = TimeCost.query.all()
+        self.time_type_table = self.source.build_time_type_table(list(time_type_dict.values()))
+
+        time_cost = self.source.get_time_costs()
         time_cost_dict = {}
         for cost in time_cost:
             line_id = cost.line_id
@@ -135,7 +230,7 @@ class RailwayData(object):
 
         for line in self.lines:
             line_id = line.line_id
-            line_costs = time_cost_dict[line_id]
+            line_costs = time_cost_dict.get(line_id, [])
             for cost in line_costs:
                 time_type_id = cost.time_type_id
                 time_type = time_type_dict[time_type_id]
@@ -0,0 +1,208 @@
+import gc
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models.models import Line, Station, StationBelong, TimeType, TimeCost
+from services.routes import RailwayData
+
+NETWORK_MODELS = (Line, Station, StationBelong, TimeType, TimeCost)
+
+
+class RailwayDataCache(object):
+    """
+    Process-wide cache of RailwayData snapshots keyed by opening epoch
+
+    a service date picks its epoch, the latest opening date before it, by binary search in the opening dates,
+    a snapshot is built once from the database and then shared by every search of the dates of that epoch,
+    searches must treat it as read only. the cache keeps at most max_size epochs (least recently used is dropped)
+    and is cleared whenever one of the railway tables is changed.
+    snapshots are read from source, a compiled NetworkFile, when it is set, from the database otherwise.
+    an epoch is built by one thread at a time, without blocking the searches of the other epochs
+    """
+
+    def __init__(self, max_size=8, source=None):
+        self.max_size = max_size
+        self.source = source
+        self.version = 0
+        self._snapshots = OrderedDict()
+        self._epochs = None
+        self._building = {}
+        self._lock = threading.RLock()
+
+    def get(self, service_date):
+        with self._lock:
+            epoch = self.get_opening_epoch(service_date)
+            railway_data = self._snapshots.get(epoch)
+            if railway_data is not None:
+                self._snapshots.move_to_end(epoch)
+                return railway_data
+            building = self._building.setdefault(epoch, threading.Lock())
+
+        with building:
+            with self._lock:
+                railway_data = self._snapshots.get(epoch)
+                if railway_data is not None:
+                    return railway_data
+                version = self.version
+
+            railway_data = RailwayData(service_date, self.source)
+
+            with self._lock:
+                self._building.pop(epoch, None)
+                # a snapshot built while the tables changed is answered but not kept
+                if version == self.version:
+                    self._snapshots[epoch] = railway_data
+                    while len(self._snapshots) > self.max_size:
+                        self._snapshots.popitem(last=False)
+            return railway_data
+
+    def get_opening_epoch(self, service_date):
+        with self._lock:
+            if self._epochs is None:
+                self._epochs = RailwayData.load_opening_epochs(self.source)
+            return RailwayData.get_opening_epoch(self._epochs, service_date)
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshots.clear()
+            self._epochs = None
+            self.version += 1
+
+    def __contains__(self, service_date):
+        epochs = self._epochs
+        return epochs is not None and RailwayData.get_opening_epoch(epochs, service_date) in self._snapshots
+
+    def __len__(self):
+        return len(self._snapshots)
+
+
+railway_data_cache = RailwayDataCache()
+
+
+def get_railway_data(service_date):
+    return railway_data_cache.get(service_date)
+
+
+def invalidate_railway_data():
+    from services.distance_table import distance_table_cache
+    from services.transfer_patterns import transfer_patterns_cache
+
+    railway_data_cache.invalidate()
+    distance_table_cache.clear()
+    transfer_patterns_cache.clear()
+
+
+class WarmUpStatus(object):
+    """
+    State of the eager warm-up of this process, reported by /api/ready
+
+    pending until a warm-up is started, then running, and done or failed
+    """
+
+    def __init__(self):
+        self.state = 'pending'
+        self.service_dates = []
+        self.elapsed_ms = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self.state == 'done'
+
+    def serialize(self):
+        return {
+            'ready': self.ready,
+            'state': self.state,
+            'service_dates': self.service_dates,
+            'elapsed_ms': self.elapsed_ms,
+            'error': self.error
+        }
+
+
+warm_up_status = WarmUpStatus()
+
+
+def preload_railway_data(app, service_dates=None):
+    """
+    build the snapshots (and their distance tables and transfer patterns) of service_dates,
+    a preforking server calls prepare_fork after it
+    :param service_dates: list of dates, default is today
+    """
+    from app import db
+    from services.distance_table import distance_table_cache
+    from services.transfer_patterns import transfer_patterns_cache
+
+    if service_dates is None:
+        service_dates = [datetime.now().strftime('%Y-%m-%d')]
+    warm_up_status.state = 'running'
+    warm_up_status.service_dates = list(service_dates)
+    started = perf_counter()
+    try:
+        with app.app_context():
+            for service_date in service_dates:
+                railway_data = get_railway_data(service_date)
+                distance_table_cache.get(railway_data)
+                transfer_patterns_cache.get(railway_data)
+            db.session.remove()
+    except Exception as e:
+        warm_up_status.state = 'failed'
+        warm_up_status.error = str(e)
+        raise
+    warm_up_status.elapsed_ms = round((perf_counter() - started) * 1000, 3)
+    warm_up_status.error = None
+    warm_up_status.state = 'done'
+
+
+def prepare_fork(app):
+    """
+    run once the snapshots are preloaded and before the server forks its workers,
+    so the workers share the snapshots copy-on-write instead of loading their own
+    """
+    from app import db
+
+    with app.app_context():
+        # connections must not be shared with the forked workers
+        db.get_engine().dispose()
+    # keep the garbage collector off the preloaded objects, it would touch and copy their pages
+    gc.freeze()
+
+
+def start_warm_up(app, service_dates=None):
+    """
+    preload the snapshots in a background thread, requests are served meanwhile and /api/ready tells when it is done
+    :return: the warm-up thread
+    """
+    def warm_up():
+        try:
+            preload_railway_data(app, service_dates)
+        except Exception:
+            logging.getLogger(__name__).exception('warm-up failed')
+
+    thread = threading.Thread(target=warm_up, name='railway-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_network_changes(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, NETWORK_MODELS):
+            session.info['railway_network_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('railway_network_changed', False):
+        invalidate_railway_data()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_on_rollback(session):
+    session.info.pop('railway_network_changed', None)
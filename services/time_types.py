@@ -0,0 +1,112 @@
+import calendar
+from array import array
+from bisect import bisect_right
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+DEFAULT_TIME_TYPE = 'Non-Peak'
+
+WEEKDAY_NAMES = [name.lower() for name in calendar.day_name]
+
+
+def parse_minute(h_m):
+    """
+    '21:50' -> 1310
+    """
+    hour, minute = h_m.strip().split(':')
+    return int(hour) * 60 + int(minute)
+
+
+def minute_of_week(time):
+    return time.weekday() * MINUTES_PER_DAY + time.hour * 60 + time.minute
+
+
+def read_time_type(reader, table, minute):
+    """
+    look up the time type of minute and record it in reader, a search or a SearchContext,
+    its latest_minute and read_minutes tell which time types its result depends on
+    :param table: minute of week table of time type ids
+    :return: time type id of minute
+    """
+    if minute > reader.latest_minute:
+        reader.latest_minute = minute
+    if reader.read_minutes is not None:
+        reader.read_minutes.add(minute)
+    return table[minute % MINUTES_PER_WEEK]
+
+
+class TimeTypeTable(object):
+    """
+    Time types compiled into a minute of week table
+
+    each of the 10080 minutes of a week holds the index of its time type,
+    the first time type whose weekdays and time intervals contain the minute wins,
+    minutes no time type contains are Non-Peak.
+    time intervals are half open, 06:00-09:00 means from 06:00 to 08:59
+    """
+
+    def __init__(self, time_types, names=None, table=None):
+        """
+        :param time_types: list of LineTimeCost in priority order
+        :param names: with table, an already compiled table, eg. from a NetworkFile, time_types is ignored then
+        """
+        if table is not None:
+            self.names = list(names)
+            self.table = table
+            self.segment_starts = self._find_segment_starts(table)
+            return
+
+        self.names = [time_type.time_type for time_type in time_types]
+        if DEFAULT_TIME_TYPE not in self.names:
+            self.names.append(DEFAULT_TIME_TYPE)
+        default_index = self.names.index(DEFAULT_TIME_TYPE)
+        self.table = array('B', [default_index]) * MINUTES_PER_WEEK
+
+        assigned = bytearray(MINUTES_PER_WEEK)
+        for index, time_type in enumerate(time_types):
+            weekdays = self._parse_weekdays(time_type.weekdays)
+            for interval in time_type.time_intervals:
+                start, end = parse_minute(interval[0]), parse_minute(interval[1])
+                for weekday in weekdays:
+                    day_start = weekday * MINUTES_PER_DAY
+                    for minute in range(day_start + start, day_start + end):
+                        if not assigned[minute]:
+                            assigned[minute] = 1
+                            self.table[minute] = index
+
+        self.segment_starts = self._find_segment_starts(self.table)
+
+    @staticmethod
+    def _find_segment_starts(table):
+        # first minute of every run of the same time type, the week start always begins a run
+        return [minute for minute in range(MINUTES_PER_WEEK) if minute == 0 or table[minute] != table[minute - 1]]
+
+    @staticmethod
+    def _parse_weekdays(weekdays):
+        return [WEEKDAY_NAMES.index(day.strip().lower()) for day in weekdays
+                if day.strip().lower() in WEEKDAY_NAMES]
+
+    def get_time_type(self, time):
+        """
+        :param time: datetime
+        :return: time type name
+        """
+        return self.names[self.table[minute_of_week(time)]]
+
+    def get_time_type_at(self, minute):
+        """
+        :param minute: minutes from Monday 00:00, may run past the end of the week
+        :return: time type name
+        """
+        return self.names[self.table[minute % MINUTES_PER_WEEK]]
+
+    def get_segment(self, minute):
+        """
+        :param minute: minutes from Monday 00:00, may run past the end of the week
+        :return: (start, end) of the run of the same time type containing minute, end is exclusive
+        """
+        week_start = minute - minute % MINUTES_PER_WEEK
+        idx = bisect_right(self.segment_starts, minute - week_start)
+        start = self.segment_starts[idx - 1]
+        end = self.segment_starts[idx] if idx < len(self.segment_starts) else MINUTES_PER_WEEK
+        return week_start + start, week_start + end
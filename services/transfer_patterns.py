@@ -0,0 +1,339 @@
+import heapq
+import threading
+from collections import OrderedDict
+
+from services.dijkstra import NetworkSearch, StationGraphSearch
+
+
+class TransferPatterns(object):
+    """
+    Optimal line sequences between every pair of lines, precomputed on the line graph of a CompactNetwork
+
+    a pattern is the lines of a route and the stations it interchanges at, eg. (EW, NS), (Jurong East, ).
+    the line graph has the lines as nodes and the interchange stations as edges. for each set of lines open together
+    (the lines open in each time type and in all of them), the line sequences with the fewest stations from leaving
+    a line at each of its interchange stations to boarding each line at another one are searched on it, one search
+    per interchange node. they are kept by first and last line, with the position of the first and last interchange
+    on them, unless leaving the first line and boarding the last one at other interchanges has fewer stations for
+    every station of both lines. the patterns don't depend on time or cost,
+    a query only evaluates the patterns of the lines of its stations with the time cost model
+    """
+
+    def __init__(self, network):
+        type_number = network.type_number
+        line_number = len(network.line_names)
+        self.node_ids = {(network.node_station[node], network.node_line[node]): node
+                         for node in range(network.node_number)}
+
+        self.open_sets = [frozenset(line_id for line_id in range(line_number)
+                                    if network.line_open[line_id * type_number + type_id])
+                          for type_id in range(type_number)]
+        # open line set -> {(first line, last line): list of patterns}
+        self.patterns = {}
+        for open_set in set(self.open_sets) | {frozenset().union(*self.open_sets)}:
+            self.patterns[open_set] = self._build(network, open_set)
+
+    def _build(self, network, open_set):
+        node_line = network.node_line
+        node_station = network.node_station
+        node_position = network.node_position
+        # the nodes of the open lines at each interchange station, and the interchange nodes of each line
+        station_nodes = {}
+        for node in range(network.node_number):
+            if node_line[node] in open_set:
+                station_nodes.setdefault(node_station[node], []).append(node)
+        station_nodes = {station: nodes for station, nodes in station_nodes.items() if len(nodes) > 1}
+        line_nodes = {}
+        for nodes in station_nodes.values():
+            for node in nodes:
+                line_nodes.setdefault(node_line[node], []).append(node)
+
+        # (first line, last line) -> {(first interchange node, last interchange node): (inner distance, patterns)}
+        inner_patterns = {}
+        for first_node in sorted(node for nodes in line_nodes.values() for node in nodes):
+            keys, preds = self._search_line_graph(network, first_node, station_nodes, line_nodes)
+            for last_node, key in keys.items():
+                if last_node == first_node:
+                    continue
+                patterns = [(key, node_position[first_node], node_position[last_node],
+                             (node_line[first_node],) + tuple(node_line[node] for node in path),
+                             tuple(node_station[node] for node in path))
+                            for path in self._iter_paths(preds, last_node)]
+                inner_patterns.setdefault((node_line[first_node], node_line[last_node]), {})[
+                    (first_node, last_node)] = (key, patterns)
+
+        patterns = {(line_id, line_id): [(0, -1, -1, (line_id,), ())] for line_id in open_set}
+        for line_pair, ends in inner_patterns.items():
+            line_patterns = patterns.setdefault(line_pair, [])
+            for (first_node, last_node), (key, end_patterns) in ends.items():
+                first_position = node_position[first_node]
+                last_position = node_position[last_node]
+                # other interchanges are fewer stations from any station of the first line to any of the last one
+                if not any(other_key + abs(node_position[other_first] - first_position)
+                           + abs(node_position[other_last] - last_position) < key
+                           for (other_first, other_last), (other_key, _) in ends.items()):
+                    line_patterns.extend(end_patterns)
+        return {line_pair: sorted(line_patterns) for line_pair, line_patterns in patterns.items()}
+
+    @staticmethod
+    def _search_line_graph(network, first_node, station_nodes, line_nodes):
+        """
+        Dijkstra on the line graph, from leaving the line of first_node at its station
+        :return: (dict of interchange node -> fewest stations until boarding its line at its station,
+        dict of interchange node -> the nodes of the lines boarded just before it with as few stations)
+        """
+        node_line = network.node_line
+        node_station = network.node_station
+        node_position = network.node_position
+        keys = {}
+        preds = {}
+        for node in station_nodes[node_station[first_node]]:
+            if node != first_node:
+                keys[node] = 0
+                preds[node] = []
+        heap = [(0, node) for node in keys]
+        heapq.heapify(heap)
+        settled = set()
+        while heap:
+            key, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            for to_node in line_nodes[node_line[node]]:
+                if to_node == node:
+                    continue
+                to_key = key + abs(node_position[node] - node_position[to_node])
+                for next_node in station_nodes[node_station[to_node]]:
+                    if next_node == to_node:
+                        continue
+                    old_key = keys.get(next_node)
+                    if old_key is None or to_key < old_key:
+                        keys[next_node] = to_key
+                        preds[next_node] = [node]
+                        heapq.heappush(heap, (to_key, next_node))
+                    elif to_key == old_key:
+                        preds[next_node].append(node)
+        return keys, preds
+
+    @classmethod
+    def _iter_paths(cls, preds, node):
+        """
+        :return: iterator of the lists of the nodes of the lines boarded, from the first interchange to node
+        """
+        if not preds[node]:
+            yield [node]
+            return
+        for pred in preds[node]:
+            for path in cls._iter_paths(preds, pred):
+                yield path + [node]
+
+    def get_patterns(self, open_set, first_line, last_line):
+        return self.patterns[open_set].get((first_line, last_line), ())
+
+    def __contains__(self, open_set):
+        return open_set in self.patterns
+
+
+class TransferPatternSearch(NetworkSearch):
+    """
+    order_by=time route search evaluating the precomputed TransferPatterns instead of searching the network
+
+    the patterns of the lines open at the departure are costed station by station with the time type of each moment
+    (a line is only boarded when it is operated and didn't close since the departure), the ones with the fewest
+    stations and then minutes are the routes.
+    no route is shorter when no other line can open before the last boarding of a route with as many stations,
+    and the station number is the fewest of the lines open until then.
+    every pattern of the fewest stations is costed as a whole, so the routes tied across a drop of the costs,
+    at the end of the peak, are all kept like the time expanded search of StationGraphSearch keeps them.
+    otherwise, when a line closes before the fewest stations patterns can board it, the search falls back to
+    StationGraphSearch
+    """
+
+    def __init__(self, transfer_patterns, network, time_type_table, read_minutes=None):
+        super().__init__(network, read_minutes)
+        self.transfer_patterns = transfer_patterns
+        self.time_type_table = time_type_table
+        # patterns costed, or states settled by the fall back search, and whether it fell back
+        self.fallback = False
+
+        # max minutes of one station, with the interchange before it, in each time type
+        type_number = network.type_number
+        line_number = len(network.line_names)
+        self._station_minutes = [max(network.take_costs[line_id * type_number + type_id]
+                                     for line_id in range(line_number)) + network.change_costs[type_id]
+                                 for type_id in range(type_number)]
+
+    def search(self, start, end, start_time):
+        """
+        :param start: station id of the network
+        :param end: station id of the network
+        :param start_time: minutes from Monday 00:00
+        :return: list of routes, each route is a list of (from node, to node) legs
+        """
+        self.latest_minute = start_time
+        open_set = self.transfer_patterns.open_sets[self._read_minute(start_time)]
+        if end not in self.network.get_reachable_stations(start):
+            return []
+
+        while open_set in self.transfer_patterns:
+            routes, distance, fewest_stations = self._evaluate(open_set, start, end, start_time)
+            if not routes:
+                break
+            # any route as short as the found ones boards its lines in the time types of this window
+            window_open_set = self._get_window_open_set(start_time, distance)
+            if window_open_set <= open_set:
+                # and it can't be shorter than the fewest stations on these lines
+                if distance == fewest_stations:
+                    return routes
+                break
+            open_set |= window_open_set
+
+        self.fallback = True
+        graph_search = StationGraphSearch(self.network, self.read_minutes)
+        routes = graph_search.search(start, end, start_time, 'time')
+        self.latest_minute = max(self.latest_minute, graph_search.latest_minute)
+        self.expanded += graph_search.expanded
+        self.pruned += graph_search.pruned
+        return routes
+
+    def _evaluate(self, open_set, start, end, start_time):
+        """
+        the patterns of the lines of start and end hold a route with the fewest stations on the open lines
+        :return: (routes with the fewest stations and then minutes, their station number, the fewest stations on the
+        open lines), the station numbers are None without routes
+        """
+        network = self.network
+        start_positions = {network.node_line[node]: network.node_position[node] for node in network.get_nodes(start)}
+        end_positions = {network.node_line[node]: network.node_position[node] for node in network.get_nodes(end)}
+
+        candidates = []
+        for first_line, start_position in start_positions.items():
+            for last_line, end_position in end_positions.items():
+                for inner_distance, first_position, last_position, lines, stations in \
+                        self.transfer_patterns.get_patterns(open_set, first_line, last_line):
+                    if not stations:
+                        candidates.append((abs(start_position - end_position), lines, stations))
+                    # the first or last leg must ride a station
+                    elif first_position != start_position and last_position != end_position:
+                        candidates.append((abs(start_position - first_position) + inner_distance
+                                           + abs(last_position - end_position), lines, stations))
+        candidates.sort()
+
+        best_key = None
+        routes = []
+        for idx, (distance, lines, stations) in enumerate(candidates):
+            if best_key is not None and distance > best_key[0]:
+                self.pruned += len(candidates) - idx
+                break
+            self.expanded += 1
+            legs = self._to_legs(lines, (start,) + stations + (end,))
+            arrival_time = self._get_arrival_time(legs, start_time)
+            if arrival_time is None:
+                continue
+            key = (distance, arrival_time)
+            if best_key is None or key < best_key:
+                best_key = key
+                routes = [legs]
+            elif key == best_key:
+                routes.append(legs)
+        fewest_stations = candidates[0][0] if candidates else None
+        if best_key is None:
+            return routes, None, fewest_stations
+        return routes, best_key[0], fewest_stations
+
+    def _to_legs(self, lines, stations):
+        node_ids = self.transfer_patterns.node_ids
+        return tuple((node_ids[(stations[idx], line)], node_ids[(stations[idx + 1], line)])
+                     for idx, line in enumerate(lines))
+
+    def _get_arrival_time(self, legs, start_time):
+        """
+        cost a route like StationGraphSearch, each station and interchange in the time type of its moment
+        :return: arrival time, None when a line is not operated, or closed since the departure, when it is boarded
+        """
+        network = self.network
+        type_number = network.type_number
+        current_time = start_time
+        for idx, (from_node, to_node) in enumerate(legs):
+            line_id = network.node_line[from_node]
+            if idx:
+                current_time += network.change_costs[self._read_minute(current_time)]
+            if not network.line_open[line_id * type_number + self._read_minute(current_time)] or \
+                    network.closes_line(line_id, start_time, current_time):
+                return None
+            for _ in range(abs(network.node_position[from_node] - network.node_position[to_node])):
+                current_time += network.take_costs[line_id * type_number + self._read_minute(current_time)]
+        return current_time
+
+    def _get_window_open_set(self, start_time, distance):
+        """
+        the window is long enough for distance stations at the max minutes of the time types in it
+        :return: the lines open in any time type of the window
+        """
+        open_sets = self.transfer_patterns.open_sets
+        types = {self._read_minute(start_time)}
+        station_minutes = 0
+        while max(self._station_minutes[type_id] for type_id in types) > station_minutes:
+            station_minutes = max(self._station_minutes[type_id] for type_id in types)
+            window_end = start_time + distance * station_minutes
+            minute = start_time
+            while minute <= window_end:
+                types.add(self._read_minute(minute))
+                minute = self.time_type_table.get_segment(minute)[1]
+            # the window is read up to its end, a later departure may reach another time type
+            self._read_minute(window_end)
+        return frozenset().union(*[open_sets[type_id] for type_id in types])
+
+
+class TransferPatternsCache(object):
+    """
+    TransferPatterns keyed by RailwayData.topology_key and the lines open in each time type,
+    the least recently used are dropped.
+    a key is built by one thread at a time, without blocking the searches of the other keys
+    """
+
+    def __init__(self, max_size=4):
+        self.max_size = max_size
+        self.version = 0
+        self._patterns = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def get(self, railway_data):
+        network = railway_data.network
+        key = (railway_data.topology_key, network.type_number, network.line_open.tobytes())
+        with self._lock:
+            transfer_patterns = self._patterns.get(key)
+            if transfer_patterns is not None:
+                self._patterns.move_to_end(key)
+                return transfer_patterns
+            building = self._building.setdefault(key, threading.Lock())
+
+        with building:
+            with self._lock:
+                transfer_patterns = self._patterns.get(key)
+                if transfer_patterns is not None:
+                    return transfer_patterns
+                version = self.version
+
+            transfer_patterns = TransferPatterns(network)
+
+            with self._lock:
+                self._building.pop(key, None)
+                # patterns built while the cache was cleared are answered but not kept
+                if version == self.version:
+                    self._patterns[key] = transfer_patterns
+                    while len(self._patterns) > self.max_size:
+                        self._patterns.popitem(last=False)
+            return transfer_patterns
+
+    def clear(self):
+        with self._lock:
+            self._patterns.clear()
+            self.version += 1
+
+    def __len__(self):
+        return len(self._patterns)
+
+
+transfer_patterns_cache = TransferPatternsCache()
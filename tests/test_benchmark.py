@@ -0,0 +1,45 @@
+import unittest
+
+from app import create_app
+from benchmarks.search import SearchBenchmark, compare_reports, load_station_names, percentile
+
+
+class SearchBenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_station_names(self):
+        names = load_station_names()
+        self.assertIn('Holland Village', names)
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_report(self):
+        benchmark = SearchBenchmark(self.app, engines=('dijkstra',), stride=40, config_name='testing')
+        report = benchmark.run()
+        self.assertEqual(report['pairs'], len(benchmark.station_names) * (len(benchmark.station_names) - 1))
+        # search and api paths, two order_by and four departure times
+        self.assertEqual(len(report['scenarios']), 16)
+        for scenario in report['scenarios']:
+            self.assertEqual(scenario['queries'], report['pairs'])
+            self.assertLessEqual(scenario['p50_ms'], scenario['p99_ms'])
+            if scenario['path'] == 'search':
+                self.assertIsNotNone(scenario['nodes_expanded_mean'])
+        # cold start with the snapshot built by the first request, warmed up before it, and from a network file
+        self.assertEqual([startup['mode'] for startup in report['startup']], ['lazy', 'eager', 'file'])
+        for startup in report['startup']:
+            self.assertEqual(startup['status'], 200)
+            self.assertGreater(startup['first_response_ms'], 0)
+            self.assertGreater(startup['snapshot_kb'], 0)
+        # a matrix of the stations in the calling process and by the pool, at three departure times
+        self.assertEqual([(matrix['mode'], matrix['window']) for matrix in report['matrix']],
+                         [(mode, window) for mode in ('process', 'pool') for window in ('non-peak', 'peak', 'night')])
+        for matrix in report['matrix']:
+            self.assertEqual(matrix['result'], 'success')
+            self.assertEqual(matrix['size'], len(benchmark.station_names))
+        self.assertEqual(len(compare_reports(report, report)), 25)
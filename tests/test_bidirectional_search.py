@@ -0,0 +1,80 @@
+import unittest
+
+from app import create_app, db
+from services.bfs import MetroLineSearch
+from services.bidirectional import BidirectionalSearch
+from services.dijkstra import StationGraphSearch
+from services.snapshot import get_railway_data
+from services.time_types import parse_minute
+
+
+class BidirectionalSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        self.railway_data = get_railway_data('2021-01-15')
+        self.network = self.railway_data.network
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _compare(self, order_by, start_time, stride=7):
+        forward_expanded = 0
+        expanded = 0
+        station_number = len(self.network.station_names)
+        for start in range(0, station_number, stride):
+            for end in range(station_number):
+                if start == end:
+                    continue
+                forward = StationGraphSearch(self.network)
+                expected = forward.search(start, end, start_time, order_by)
+                bidirectional = BidirectionalSearch(self.network)
+                routes = bidirectional.search(start, end, start_time, order_by)
+                # every tied route, maybe in another order
+                self.assertEqual(sorted(routes), sorted(expected))
+                forward_expanded += forward.expanded
+                expanded += bidirectional.expanded
+        return forward_expanded, expanded
+
+    def test_distance_same_routes_as_dijkstra(self):
+        forward_expanded, expanded = self._compare('distance', 0)
+        self.assertLess(expanded, forward_expanded)
+
+    def test_time_searched_by_dijkstra(self):
+        # arrival times depend on the departure, they aren't searched back from the end
+        with self.assertRaises(ValueError):
+            BidirectionalSearch(self.network).search(self.network.station_ids['MacPherson'],
+                                                     self.network.station_ids['Chinatown'],
+                                                     4 * 1440 + parse_minute('05:30'), 'time')
+        search = MetroLineSearch('MacPherson', 'Chinatown', '2021-01-15 05:30', 'time', self.railway_data,
+                                 'bidirectional')
+        self.assertEqual(search.engine, 'dijkstra')
+        result = search.generate_railway_routes()
+        expected = MetroLineSearch('MacPherson', 'Chinatown', '2021-01-15 05:30', 'time', self.railway_data,
+                                   'dijkstra').generate_railway_routes()
+        self.assertEqual(result['result'], 'success')
+        self.assertEqual(result, expected)
+
+    def test_tied_routes_are_rendered(self):
+        search = MetroLineSearch('Dhoby Ghaut', 'Promenade', '2021-01-15 13:00', 'distance', self.railway_data,
+                                 'bidirectional')
+        context = search.run()
+        expected = MetroLineSearch('Dhoby Ghaut', 'Promenade', '2021-01-15 13:00', 'distance', self.railway_data,
+                                   'dijkstra', revisit_lines=True).generate_railway_routes()
+        self.assertGreater(len(context.result['suggest_routes']), 1)
+        self.assertEqual(sorted(route['summary'] for route in context.result['suggest_routes']),
+                         sorted(route['summary'] for route in expected['suggest_routes']))
+        self.assertEqual(context.stats.counters['routes_tied'], len(context.result['suggest_routes']))
+        self.assertGreater(context.stats.counters['nodes_expanded'], 0)
+
+    def test_engine_selected_by_api(self):
+        response = self.client.get('/api/search?from=Holland Village&to=Bugis&order_by=distance&engine=bidirectional'
+                                   '&time=2021-01-15 13:00')
+        self.assertEqual(response.get_json()['result'], 'success')
+
+
+if __name__ == '__main__':
+    unittest.main()
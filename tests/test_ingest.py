@@ -0,0 +1,100 @@
+import csv
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from app import create_app, db
+from config import basedir
+from models.models import Line, Station, StationBelong
+from services.bfs import MetroLineSearch
+from services.ingest import StationMapLoader, STATION_MAP_FILE
+from services.snapshot import get_railway_data, railway_data_cache
+
+
+class StationMapLoaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        # load into a scratch database so the shared test database is untouched
+        db.session.remove()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.tmp_dir, 'railway.sqlite')
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.get_engine().dispose()
+        railway_data_cache.invalidate()
+        self.app_context.pop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_feed(self, rows):
+        path = os.path.join(self.tmp_dir, 'feed.csv')
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Station Code', 'Station Name', 'Opening Date'])
+            writer.writerows(rows)
+        return path
+
+    def test_load_station_map(self):
+        stats = StationMapLoader().load(STATION_MAP_FILE)
+        self.assertEqual(stats['lines_added'], 8)
+        self.assertEqual(stats['belongs_added'], 166)
+        self.assertEqual(Station.query.count(), stats['stations_added'])
+
+        belong = StationBelong.query.filter_by(station_code='CC21').one()
+        self.assertEqual(belong.sequence, 21)
+        self.assertEqual(belong.line.code, 'CC')
+        self.assertEqual(belong.station.name, 'Holland Village')
+
+    def test_load_is_idempotent(self):
+        StationMapLoader().load(STATION_MAP_FILE)
+        stats = StationMapLoader().load(STATION_MAP_FILE)
+        self.assertEqual(stats['lines_added'] + stats['stations_added'], 0)
+        self.assertEqual(stats['belongs_added'] + stats['belongs_updated'], 0)
+        self.assertEqual(StationBelong.query.count(), 166)
+
+    def test_diff_against_existing_rows(self):
+        path = self._write_feed([['AB1', 'Alpha', '2020-01-01'], ['AB2', 'Beta', '2020-01-01'],
+                                 ['XY1', 'Beta', '2021-01-01']])
+        StationMapLoader(batch_size=2).load(path)
+
+        path = self._write_feed([['AB1', 'Alpha', '2019-01-01'], ['AB2', 'Beta', '2020-01-01'], ['bad', '', '']])
+        stats = StationMapLoader(prune=True).load(path)
+        self.assertEqual(stats['belongs_updated'], 1)
+        self.assertEqual(stats['belongs_deleted'], 1)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(StationBelong.query.filter_by(station_code='AB1').one().opened_at, '2019-01-01')
+        self.assertEqual(Line.query.count(), 2)
+
+    def test_new_line_without_cost_is_not_operated(self):
+        # a copy of the test database, which has the time types and the costs of the existing lines
+        db.session.remove()
+        db.get_engine().dispose()
+        path = os.path.join(self.tmp_dir, 'railway-copy.sqlite')
+        shutil.copy(os.path.join(basedir, 'railway-test.sqlite'), path)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+
+        StationMapLoader().load(self._write_feed([['ZZ1', 'Bugis', '2020-01-01'], ['ZZ2', 'Zed Town', '2020-01-01']]))
+        railway_data = get_railway_data('2021-01-15')
+        self.assertEqual(railway_data.line_name_dict['ZZ'].cost_info, {})
+        for engine in ('bfs', 'dijkstra'):
+            by_time = MetroLineSearch('Zed Town', 'Little India', '2021-01-15 13:00', 'time', railway_data,
+                                      engine).generate_railway_routes()
+            self.assertEqual(by_time['result'], 'failed')
+            by_distance = MetroLineSearch('Zed Town', 'Little India', '2021-01-15 13:00', 'distance', railway_data,
+                                          engine).generate_railway_routes()
+            self.assertEqual(by_distance['result'], 'success')
+
+    def test_large_feed(self):
+        rows = [['L{}{}'.format(chr(65 + line // 26) + chr(65 + line % 26), seq), 'Station {} {}'.format(line, seq),
+                 '2000-01-01'] for line in range(100) for seq in range(1, 101)]
+        path = self._write_feed(rows)
+        started = time.time()
+        stats = StationMapLoader().load(path)
+        self.assertEqual(stats['belongs_added'], 10000)
+        self.assertLess(time.time() - started, 30)
@@ -0,0 +1,82 @@
+import unittest
+
+from app import create_app, db
+from services.bfs import MetroLineSearch
+from services.snapshot import get_railway_data
+
+
+class KShortestSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        self.railway_data = get_railway_data('2021-01-15')
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _search(self, from_station, to_station, time, order_by, alternatives=0, max_detour=None):
+        search = MetroLineSearch(from_station, to_station, time, order_by, self.railway_data, 'dijkstra',
+                                 alternatives=alternatives, max_detour=max_detour)
+        return search.generate_railway_routes()
+
+    def _assert_alternatives(self, from_station, to_station, time, order_by, k):
+        best = self._search(from_station, to_station, time, order_by)
+        result = self._search(from_station, to_station, time, order_by, k)
+        routes = result['suggest_routes']
+        self.assertEqual(result['result'], 'success')
+        self.assertEqual(len(routes), k)
+        self.assertIn(routes[0]['summary'], [route['summary'] for route in best['suggest_routes']])
+
+        # distinct, ranked by station number then time, and no station passed twice
+        self.assertEqual(len({route['summary'] for route in routes}), k)
+        ranks = [(route['total_station'], route['total_cost']) for route in routes]
+        if order_by == 'time':
+            self.assertEqual(ranks, sorted(ranks))
+        else:
+            self.assertEqual([rank[0] for rank in ranks], sorted(rank[0] for rank in ranks))
+        for route in routes:
+            names = [station['name'] for station in route['take_stations']]
+            names = [name for idx, name in enumerate(names) if not idx or names[idx - 1] != name]
+            self.assertEqual(len(names), len(set(names)))
+        return routes
+
+    def test_distance_alternatives(self):
+        self._assert_alternatives('Holland Village', 'Bugis', '2021-01-15 13:00', 'distance', 5)
+        self._assert_alternatives('Boon Lay', 'Little India', '2021-01-15 13:00', 'distance', 4)
+
+    def test_time_alternatives(self):
+        self._assert_alternatives('Holland Village', 'Bugis', '2021-01-15 13:00', 'time', 5)
+        self._assert_alternatives('Boon Lay', 'Little India', '2021-01-15 20:40', 'time', 3)
+
+    def test_time_until_lines_open_again(self):
+        # departing at 05:30, the Downtown line opens at 06:00
+        best = self._search('MacPherson', 'Chinatown', '2021-01-15 05:30', 'time')
+        result = self._search('MacPherson', 'Chinatown', '2021-01-15 05:30', 'time', 3)
+        self.assertEqual(result['result'], 'success')
+        self.assertIn(result['suggest_routes'][0]['summary'], [route['summary'] for route in best['suggest_routes']])
+        self._assert_alternatives('Boon Lay', 'Little India', '2021-01-15 21:40', 'time', 3)
+
+    def test_time_alternatives_at_night(self):
+        # the lines closed at 22:00 only open again at 06:00, no alternative rides around until then
+        result = self._search('Admiralty', 'Beauty World', '2021-01-15 20:50', 'time', 3)
+        self.assertEqual(result['description'], 'Sorry, no route found !')
+        routes = self._assert_alternatives('Jurong East', 'Bishan', '2021-01-15 21:45', 'time', 5)
+        for route in routes:
+            self.assertLess(route['total_cost'], 8 * 60 + 15)
+
+    def test_max_detour(self):
+        routes = self._search('Holland Village', 'Bugis', '2021-01-15 13:00', 'distance', 10, 2)['suggest_routes']
+        self.assertTrue(routes)
+        best = routes[0]['total_station']
+        self.assertTrue(all(route['total_station'] <= best + 2 for route in routes))
+        self.assertLess(len(routes), 10)
+
+    def test_alternatives_by_api(self):
+        response = self.client.get('/api/search?from=Holland Village&to=Bugis&time=2021-01-15 13:00'
+                                   '&alternatives=3&max_detour=5')
+        data = response.get_json()
+        self.assertEqual(data['result'], 'success')
+        self.assertEqual(len(data['suggest_routes']), 3)
@@ -0,0 +1,101 @@
+import os
+import unittest
+
+from app import create_app, db
+from services import matrix
+from services.matrix import MatrixPool, MatrixSearch, search_rows, search_worker_rows
+from services.reachable import ReachableSearch
+from services.snapshot import get_railway_data, invalidate_railway_data
+
+STATIONS = ['Holland Village', 'Bugis', 'Little India', 'Bishan', 'Boon Lay', 'HarbourFront']
+
+
+class MatrixSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        self.railway_data = get_railway_data('2021-01-15')
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _matrix(self, origins, destinations, pool, time='2021-01-15 13:00'):
+        return MatrixSearch(origins, destinations, time, self.railway_data, pool).generate_matrix()
+
+    def test_matches_reachable_stations(self):
+        result = self._matrix(STATIONS, STATIONS, MatrixPool())
+        self.assertEqual(result['result'], 'success')
+        for row, origin in enumerate(STATIONS):
+            reachable = ReachableSearch(origin, '2021-01-15 13:00', None, self.railway_data)
+            stations = {station['name']: station for station in reachable.generate_reachable_stations()['stations']}
+            for column, destination in enumerate(STATIONS):
+                if origin == destination:
+                    self.assertEqual(result['time_costs'][row][column], 0)
+                    continue
+                self.assertEqual(result['time_costs'][row][column], stations[destination]['time_cost'])
+                self.assertEqual(result['total_stations'][row][column], stations[destination]['total_station'])
+
+    def test_process_pool_matches_in_process(self):
+        pool = MatrixPool(workers=2, chunk_size=2)
+        try:
+            self.assertEqual(self._matrix(STATIONS, STATIONS[:3], pool),
+                             self._matrix(STATIONS, STATIONS[:3], MatrixPool()))
+        finally:
+            pool.shutdown()
+
+    def test_pool_is_kept_for_another_network(self):
+        pool = MatrixPool(workers=2, chunk_size=2)
+        try:
+            first = self._matrix(STATIONS, STATIONS[:3], pool)
+            executor = pool._executor
+            invalidate_railway_data()
+            self.railway_data = get_railway_data('2021-01-15')
+            self.assertEqual(self._matrix(STATIONS, STATIONS[:3], pool), first)
+            self.assertIs(pool._executor, executor)
+        finally:
+            pool.shutdown()
+
+    def test_network_is_written_once(self):
+        pool = MatrixPool(workers=2, chunk_size=2)
+        try:
+            self._matrix(STATIONS, STATIONS[:3], pool)
+            digest, path = pool._payload
+            self.assertTrue(os.path.exists(path))
+            self._matrix(STATIONS[::-1], STATIONS[:3], pool)
+            self.assertEqual(pool._payload, (digest, path))
+
+            # a worker started before the network reads it from the file once
+            network = matrix._worker_networks.pop(digest)
+            self.assertEqual(search_worker_rows(digest, path, [0, 1], [2, 3], 4 * 1440 + 780),
+                             search_rows([0, 1], [2, 3], 4 * 1440 + 780, network))
+            self.assertIn(digest, matrix._worker_networks)
+        finally:
+            pool.shutdown()
+        self.assertFalse(os.path.exists(path))
+
+    def test_line_opening_during_the_trip(self):
+        result = self._matrix(['Tanjong Pagar'], ['Bencoolen'], MatrixPool(), '2021-01-15 05:00')
+        self.assertEqual(result['time_costs'], [[107]])
+
+    def test_closed_lines_are_not_waited_for(self):
+        result = self._matrix(['Jurong East', 'Bugis'], ['Bukit Panjang', 'Bishan'], MatrixPool(), '2021-01-15 20:50')
+        self.assertEqual(result['time_costs'], [[None, 100], [98, 76]])
+        self.assertEqual(result['total_stations'], [[None, 9], [12, 7]])
+
+    def test_unknown_station(self):
+        result = self._matrix(['Bugis', 'Nowhere'], ['Bishan'], MatrixPool())
+        self.assertEqual(result['result'], 'failed')
+        self.assertIn('Nowhere', result['description'])
+
+    def test_matrix_by_api(self):
+        response = self.client.get('/api/matrix?origins=bugis,bishan&destinations=harbourfront'
+                                   '&time=2021-01-15 13:00')
+        data = response.get_json()
+        self.assertEqual(data['result'], 'success')
+        self.assertEqual(data['origins'], ['Bugis', 'Bishan'])
+        self.assertEqual(data['destinations'], ['HarbourFront'])
+        self.assertEqual(len(data['time_costs']), 2)
+        self.assertEqual(len(data['time_costs'][0]), 1)
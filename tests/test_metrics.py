@@ -0,0 +1,72 @@
+import unittest
+
+from app import create_app, db
+from services.bfs import MetroLineSearch
+from services.metrics import Histogram, SearchMetrics, SearchStats, search_metrics
+from services.response_cache import search_result_cache
+
+
+class SearchMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        search_result_cache.clear()
+        search_metrics.reset()
+
+    def tearDown(self):
+        search_result_cache.clear()
+        search_metrics.reset()
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_histogram_buckets(self):
+        histogram = Histogram((1, 10, float('inf')))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        result = histogram.serialize()
+        self.assertEqual([bucket['count'] for bucket in result['buckets']], [2, 1, 1])
+        self.assertEqual(result['buckets'][-1]['le'], 'inf')
+        self.assertEqual(result['count'], 4)
+        self.assertEqual(result['sum'], 56.5)
+
+    def test_metrics_observe(self):
+        stats = SearchStats()
+        with stats.phase('search'):
+            pass
+        stats.count('nodes_expanded', 3)
+        metrics = SearchMetrics()
+        metrics.observe(stats)
+        metrics.observe(stats)
+        result = metrics.serialize()
+        self.assertEqual(result['searches'], 2)
+        self.assertEqual(result['latency_ms']['search']['count'], 2)
+        self.assertEqual(result['latency_ms']['total']['count'], 2)
+        self.assertEqual(result['counters'], {'nodes_expanded': 6})
+
+    def test_search_counters(self):
+        for engine in MetroLineSearch.ENGINES:
+            search = MetroLineSearch('Holland Village', 'Bugis', '2021-01-15 13:00', 'time', engine=engine)
+            stats = search.run().stats
+            self.assertEqual(set(stats.phases), {'load', 'search', 'render'})
+            self.assertGreater(stats.counters['nodes_expanded'], 0)
+            self.assertGreaterEqual(stats.counters['routes_tied'], 1)
+            self.assertIn('branches_pruned', stats.counters)
+
+    def test_server_timing_header(self):
+        url = '/api/search?from=Holland Village&to=Bugis&order_by=time&time=2021-01-15 13:00'
+        response = self.client.get(url)
+        self.assertNotIn('Server-Timing', response.headers)
+
+        self.app.config['SEARCH_SERVER_TIMING'] = True
+        response = self.client.get(url)
+        self.assertIn('jsonify;dur=', response.headers['Server-Timing'])
+
+    def test_metrics_api(self):
+        self.client.get('/api/search?from=Holland Village&to=Bugis&order_by=distance')
+        data = self.client.get('/api/metrics').get_json()
+        self.assertEqual(data['searches'], 1)
+        for phase in ('load', 'search', 'render', 'jsonify', 'total'):
+            self.assertEqual(data['latency_ms'][phase]['count'], 1)
+        self.assertIn('nodes_expanded', data['counters'])
@@ -0,0 +1,114 @@
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import unittest
+from array import array
+
+from app import create_app, db
+from services.bfs import MetroLineSearch
+from services.distance_table import DistanceTable
+from services.network import COMPILED_ARRAYS
+from services.network_file import NetworkFile, NetworkFileError, compile_network_file, HEADER
+from services.routes import RailwayData
+
+
+class NetworkFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'railway.network')
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_same_rows_as_database(self):
+        stats = compile_network_file(self.path, since='2021-01-15')
+        self.assertEqual(stats['size'], os.path.getsize(self.path))
+        network_file = NetworkFile(self.path)
+
+        database = RailwayData('2021-01-15')
+        compiled = RailwayData('2021-01-15', network_file)
+        self.assertEqual(RailwayData.load_opening_epochs(network_file), RailwayData.load_opening_epochs())
+        self.assertEqual(compiled.opening_epoch, database.opening_epoch)
+        self.assertEqual(sorted(compiled.station_code_dict), sorted(database.station_code_dict))
+        self.assertEqual(list(compiled.time_type_table.table), list(database.time_type_table.table))
+        self.assertEqual(compiled.time_type_table.segment_starts, database.time_type_table.segment_starts)
+
+        for time in ('2021-01-15 08:00', '2021-01-15 22:30', '2021-01-17 12:00'):
+            for order_by in ('time', 'station'):
+                for engine in ('bfs', 'dijkstra'):
+                    expected = MetroLineSearch('Boon Lay', 'Little India', time, order_by, database,
+                                               engine).generate_railway_routes()
+                    result = MetroLineSearch('Boon Lay', 'Little India', time, order_by, compiled,
+                                             engine).generate_railway_routes()
+                    self.assertEqual(result, expected)
+
+        # the mapped table and arrays are copied to send the network to another process
+        network = pickle.loads(pickle.dumps(compiled.network))
+        self.assertEqual(list(network.time_type_table), list(compiled.network.time_type_table))
+        self.assertEqual(network.topology_key, database.network.topology_key)
+
+    def test_compiled_arrays_are_read_in_place(self):
+        compile_network_file(self.path, since='2021-01-15')
+        network_file = NetworkFile(self.path)
+
+        database = RailwayData('2021-01-15')
+        compiled = RailwayData('2021-01-15', network_file)
+        self.assertIsInstance(compiled.network.ride_targets, memoryview)
+        for name in COMPILED_ARRAYS:
+            self.assertEqual(list(getattr(compiled.network, name)), list(getattr(database.network, name)))
+        self.assertEqual(compiled.network.line_close_minutes, database.network.line_close_minutes)
+
+        table = DistanceTable(compiled)
+        self.assertIsInstance(table.distances, memoryview)
+        expected = DistanceTable(database)
+        for from_station, to_station in [('Holland Village', 'Bugis'), ('Dhoby Ghaut', 'Promenade'),
+                                         ('Boon Lay', 'Changi Airport')]:
+            start = compiled.network.station_ids[from_station]
+            end = compiled.network.station_ids[to_station]
+            self.assertEqual(table.get_distance(start, end), expected.get_distance(start, end))
+            self.assertEqual(table.get_routes(start, end), expected.get_routes(start, end))
+
+        # the epochs before since are built from the rows
+        self.assertIsNone(network_file.get_compiled_arrays(RailwayData('2005-01-15').opening_epoch))
+        self.assertIsInstance(RailwayData('2005-01-15', network_file).network.ride_targets, array)
+
+    def test_refuses_other_files(self):
+        compile_network_file(self.path)
+        with open(self.path, 'r+b') as file:
+            file.seek(8)
+            file.write(struct.pack('<H', 99))
+        with self.assertRaises(NetworkFileError):
+            NetworkFile(self.path)
+
+        with open(self.path, 'wb') as file:
+            file.write(b'\0' * HEADER.size)
+        with self.assertRaises(NetworkFileError):
+            NetworkFile(self.path)
+
+    def test_refuses_truncated_or_corrupted_files(self):
+        compile_network_file(self.path)
+        with open(self.path, 'rb') as file:
+            data = file.read()
+
+        with open(self.path, 'wb') as file:
+            file.write(data[:-100])
+        with self.assertRaisesRegex(NetworkFileError, 'truncated'):
+            NetworkFile(self.path)
+
+        corrupted = bytearray(data)
+        corrupted[-1] ^= 0xFF
+        with open(self.path, 'wb') as file:
+            file.write(corrupted)
+        with self.assertRaisesRegex(NetworkFileError, 'corrupted'):
+            NetworkFile(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+
+from app import create_app, db
+from services.dijkstra import StationGraphSearch
+from services.pareto import ParetoSearch
+from services.reachable import EarliestArrivalSearch
+from services.snapshot import get_railway_data
+from services.time_types import parse_minute
+
+
+class ParetoSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        self.railway_data = get_railway_data('2021-01-15')
+        self.network = self.railway_data.network
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_front_ends_are_the_time_and_distance_routes(self):
+        start_time = 4 * 1440 + parse_minute('13:00')
+        station_number = len(self.network.station_names)
+        for start in range(0, station_number, 13):
+            arrivals = EarliestArrivalSearch(self.network).run(start, start_time)
+            for end in range(station_number):
+                if start == end:
+                    continue
+                front = ParetoSearch(self.network).search(start, end, start_time)
+                if end not in arrivals:
+                    self.assertEqual(front, [])
+                    continue
+                # the fastest route, and the one with the fewest stations then minutes
+                minutes, stations, interchanges = arrivals[end]
+                self.assertEqual(front[0][:3], (minutes, interchanges, stations))
+                graph_search = StationGraphSearch(self.network)
+                key = graph_search.run(start, start_time, 'time', end)[end][0]
+                self.assertEqual(min((item[2], item[0]) for item in front),
+                                 (graph_search.get_distance(key), graph_search.get_duration(key)))
+
+    def test_front_ends_at_night(self):
+        # lines open at 06:00 and costs drop at 21:00 and 22:00, a later arrival at a station may be faster
+        station_number = len(self.network.station_names)
+        for minute in ('05:00', '20:50'):
+            start_time = 4 * 1440 + parse_minute(minute)
+            for start in range(0, station_number, 29):
+                arrivals = EarliestArrivalSearch(self.network).run(start, start_time)
+                for end in range(0, station_number, 7):
+                    if start == end:
+                        continue
+                    front = ParetoSearch(self.network).search(start, end, start_time)
+                    if end not in arrivals:
+                        self.assertEqual(front, [])
+                        continue
+                    minutes, stations, interchanges = arrivals[end]
+                    self.assertEqual(front[0][:3], (minutes, interchanges, stations))
+
+        pareto_search = ParetoSearch(self.network)
+        front = pareto_search.search(self.network.station_ids['Tanjong Pagar'], self.network.station_ids['Bencoolen'],
+                                     4 * 1440 + parse_minute('05:00'))
+        self.assertTrue(pareto_search.fallback)
+        self.assertEqual(front[0][0], 107)
+
+    def test_front_without_fallback(self):
+        # off-peak nothing can overtake, across the end of the peak a later arrival only overtakes a close one
+        start = self.network.station_ids['Boon Lay']
+        end = self.network.station_ids['Little India']
+        for minute in ('13:00', '08:30'):
+            start_time = 4 * 1440 + parse_minute(minute)
+            pareto_search = ParetoSearch(self.network)
+            front = pareto_search.search(start, end, start_time)
+            self.assertFalse(pareto_search.fallback)
+            expanded_front = ParetoSearch(self.network)._search_time_expanded(start, end, start_time, 1)
+            self.assertEqual([item[:3] for item in front], [item[:3] for item in expanded_front])
+
+    def test_front_without_fallback_after_lines_close(self):
+        # departing at 21:50, the lines closed at 22:00 are never boarded again, their opening at 23:59 doesn't count
+        start_time = 4 * 1440 + parse_minute('21:50')
+        station_number = len(self.network.station_names)
+        fallbacks = queries = 0
+        for start in range(0, station_number, 29):
+            for end in range(0, station_number, 7):
+                if start == end:
+                    continue
+                pareto_search = ParetoSearch(self.network)
+                front = pareto_search.search(start, end, start_time)
+                queries += 1
+                if pareto_search.fallback or not front:
+                    fallbacks += pareto_search.fallback
+                    continue
+                expanded_front = ParetoSearch(self.network)._search_time_expanded(
+                    start, end, start_time, min(item[1] for item in front))
+                self.assertEqual([item[:3] for item in front], [item[:3] for item in expanded_front])
+        self.assertLess(fallbacks, queries / 4)
+
+    def test_front_is_not_dominated(self):
+        start = self.network.get_station_id(self.railway_data.station_name_dict['Boon Lay'])
+        end = self.network.get_station_id(self.railway_data.station_name_dict['Little India'])
+        front = ParetoSearch(self.network).search(start, end, 4 * 1440 + parse_minute('13:00'))
+        self.assertGreater(len(front), 1)
+        for item in front:
+            minutes, interchanges, stations, legs = item
+            self.assertEqual(len(legs), interchanges + 1)
+            self.assertEqual(sum(abs(self.network.node_position[from_node] - self.network.node_position[to_node])
+                                 for from_node, to_node in legs), stations)
+            for other in front:
+                if other is not item:
+                    self.assertFalse(all(a <= b for a, b in zip(other[:3], item[:3])))
+
+    def test_order_by_pareto(self):
+        response = self.client.get('/api/search?from=Boon Lay&to=Little India&order_by=pareto'
+                                   '&time=2021-01-15 13:00')
+        result = response.get_json()
+        self.assertEqual(result['result'], 'success')
+        routes = result['suggest_routes']
+        self.assertGreater(len(routes), 1)
+        self.assertEqual(routes, sorted(routes, key=lambda route: route['total_cost']))
+        # a faster route takes more interchanges or stations
+        for route, next_route in zip(routes, routes[1:]):
+            self.assertTrue(route['total_interchange'] > next_route['total_interchange']
+                            or route['total_station'] > next_route['total_station'])
+        self.assertIn('Interchanges: ', routes[0]['summary'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from services.bfs import MetroLineSearch
+from services.profile import ProfileSearch
+
+
+class ProfileSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _assert_pareto(self, from_station, to_station, depart_from, depart_to, engine):
+        profile = ProfileSearch(from_station, to_station, depart_from, depart_to, engine)
+        result = profile.generate_profile()
+        self.assertEqual(result['result'], 'success')
+
+        # every minute of the window searched one by one
+        start = datetime.strptime(depart_from, '%Y-%m-%d %H:%M')
+        end = datetime.strptime(depart_to, '%Y-%m-%d %H:%M')
+        pairs = []
+        departure = start
+        while departure <= end:
+            search = MetroLineSearch(from_station, to_station, departure.strftime('%Y-%m-%d %H:%M'), 'time',
+                                     engine=engine)
+            routes = search.generate_railway_routes()['suggest_routes']
+            if routes:
+                pairs.append((departure, departure + timedelta(minutes=min(r['total_cost'] for r in routes))))
+            departure += timedelta(minutes=1)
+        expected = [(departure, arrival) for departure, arrival in pairs
+                    if not any(later > departure and other <= arrival for later, other in pairs)]
+
+        options = []
+        for option in result['profile']:
+            departure = datetime.strptime(option['depart_from'], '%Y-%m-%d %H:%M')
+            while departure <= datetime.strptime(option['depart_to'], '%Y-%m-%d %H:%M'):
+                options.append((departure, departure + timedelta(minutes=option['time_cost'])))
+                departure += timedelta(minutes=1)
+        self.assertEqual(options, expected)
+        self.assertLess(profile.searches, len(pairs))
+
+    def test_peak_window(self):
+        self._assert_pareto('Holland Village', 'Bugis', '2021-01-15 17:00', '2021-01-15 20:00', 'dijkstra')
+
+    def test_window_into_night_time(self):
+        self._assert_pareto('Boon Lay', 'Little India', '2021-01-15 20:00', '2021-01-15 23:30', 'dijkstra')
+        self._assert_pareto('Boon Lay', 'Little India', '2021-01-15 20:00', '2021-01-15 23:30', 'bfs')
+
+    def test_profile_by_api(self):
+        response = self.client.get('/api/search?from=Holland Village&to=Bugis&order_by=time&time=2021-01-15 00:00'
+                                   '&depart_from=17:00&depart_to=18:00')
+        data = response.get_json()
+        self.assertEqual(data['result'], 'success')
+        self.assertEqual(data['profile'][0]['depart_from'], '2021-01-15 17:00')
+
+        response = self.client.get('/api/search?from=Holland Village&to=Bugis&order_by=time'
+                                   '&depart_from=18:00&depart_to=17:00')
+        self.assertEqual(response.get_json()['result'], 'failed')
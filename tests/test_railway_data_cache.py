@@ -0,0 +1,170 @@
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app, db
+from models.models import Line, Station, StationBelong
+from services.bfs import MetroLineSearch
+from services.routes import RailwayData
+from services.snapshot import RailwayDataCache, prepare_fork, preload_railway_data, railway_data_cache, \
+    start_warm_up, warm_up_status
+from services.transfer_patterns import transfer_patterns_cache
+
+
+class RailwayDataCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        railway_data_cache.invalidate()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_snapshot_is_shared_by_opening_epoch(self):
+        first = railway_data_cache.get('2021-01-15')
+        self.assertIs(first, railway_data_cache.get('2021-01-15'))
+        # no station opens between these dates
+        self.assertIs(first, railway_data_cache.get('2021-12-31'))
+        self.assertIsNot(first, railway_data_cache.get('2022-01-01'))
+        self.assertEqual(first.opening_epoch, '2020-12-31')
+
+    def test_opening_epoch_by_binary_search(self):
+        epochs = ['2019-12-31', '2020-12-31', '2021-12-31']
+        self.assertEqual(RailwayData.get_opening_epoch(epochs, '2019-12-31'), '')
+        self.assertEqual(RailwayData.get_opening_epoch(epochs, '2020-12-31'), '2019-12-31')
+        self.assertEqual(RailwayData.get_opening_epoch(epochs, '2021-01-15'), '2020-12-31')
+        self.assertEqual(RailwayData.get_opening_epoch(epochs, '2030-01-01'), '2021-12-31')
+
+    def test_cache_is_bounded(self):
+        cache = RailwayDataCache(max_size=2)
+        cache.get('2021-01-15')
+        cache.get('2022-01-15')
+        cache.get('2021-01-15')
+        cache.get('2020-06-01')
+        self.assertEqual(len(cache), 2)
+        self.assertIn('2021-01-16', cache)
+        self.assertNotIn('2022-01-15', cache)
+
+    def test_unopened_stations_are_not_in_the_network(self):
+        railway_data = railway_data_cache.get('2021-01-15')
+        network = railway_data.network
+        stations = {network.station_names[station_id] for station_id in network.node_station}
+        self.assertNotIn('Mount Pleasant', stations)
+        self.assertFalse(railway_data.station_name_dict['Mount Pleasant'].codes)
+        self.assertIn('Mount Pleasant', {network.station_names[station_id]
+                                         for station_id in railway_data_cache.get('2022-01-01').network.node_station})
+
+        for engine in MetroLineSearch.ENGINES:
+            search = MetroLineSearch('Holland Village', 'Stevens', '2021-01-15 13:00', 'distance', railway_data,
+                                     engine, alternatives=5 if engine == 'dijkstra' else 0)
+            for route in search.generate_railway_routes()['suggest_routes']:
+                codes = {station['code'] for station in route['take_stations']}
+                self.assertFalse(codes & {'TE10', 'TE11'})
+
+    def test_search_uses_given_snapshot(self):
+        railway_data = railway_data_cache.get('2021-01-15')
+        search = MetroLineSearch('Holland Village', 'Bugis', '2021-01-15 13:00', 'distance', railway_data)
+        self.assertIs(search.stations, railway_data.station_name_dict)
+        self.assertEqual(search.generate_railway_routes()['result'], 'success')
+
+    def test_search_is_reentrant(self):
+        railway_data = railway_data_cache.get('2021-01-15')
+        searches = [MetroLineSearch('Holland Village', 'Bugis', '2021-01-15 13:00', order_by, railway_data, engine)
+                    for engine in MetroLineSearch.ENGINES for order_by in ('distance', 'time')]
+        expected = [search.generate_railway_routes() for search in searches]
+
+        # every thread runs the same search objects at the same time
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            rounds = list(executor.map(lambda _: [search.generate_railway_routes() for search in searches],
+                                       range(32)))
+        for results in rounds:
+            self.assertEqual(results, expected)
+
+        first, second = searches[0].run(), searches[0].run()
+        self.assertIsNot(first.result, second.result)
+
+    def test_preload_before_fork(self):
+        transfer_patterns_cache.clear()
+        preload_railway_data(self.app, ['2021-01-15'])
+        self.assertIn('2021-01-15', railway_data_cache)
+        # the first engine=patterns query doesn't build them
+        self.assertEqual(len(transfer_patterns_cache), 1)
+        self.assertTrue(warm_up_status.ready)
+        self.assertEqual(gc.get_freeze_count(), 0)
+
+        prepare_fork(self.app)
+        self.assertGreater(gc.get_freeze_count(), 0)
+        gc.unfreeze()
+        self.assertIn('2021-01-15', railway_data_cache)
+
+    def test_ready_after_warm_up(self):
+        warm_up_status.state = 'pending'
+        client = self.app.test_client()
+        self.assertEqual(client.get('/api/ready').status_code, 503)
+
+        start_warm_up(self.app, ['2021-01-15']).join()
+        self.assertEqual(gc.get_freeze_count(), 0)
+        response = client.get('/api/ready')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['state'], 'done')
+        self.assertEqual(data['service_dates'], ['2021-01-15'])
+        self.assertIn('2021-01-15', railway_data_cache)
+
+    def test_invalidated_when_network_changes(self):
+        railway_data_cache.get('2021-01-15')
+        db.session.remove()
+
+        # write to a scratch database so the shared test database is untouched
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+        try:
+            db.create_all()
+            db.session.add(Line(code='ZZ'))
+            db.session.commit()
+            self.assertNotIn('2021-01-15', railway_data_cache)
+        finally:
+            db.session.remove()
+            db.get_engine().dispose()
+            os.remove(path)
+
+    def test_cached_tables_follow_the_network_numbering(self):
+        db.session.remove()
+
+        # copy the test database, the new station is only written to the copy
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        shutil.copyfile(self.app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):], path)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+        railway_data_cache.invalidate()
+        searches = [('distance', 'dijkstra'), ('time', 'patterns')]
+
+        def search(order_by, engine):
+            return MetroLineSearch('Holland Village', 'Bugis', '2021-01-15 13:00', order_by,
+                                   railway_data_cache.get('2021-01-15'), engine).generate_railway_routes()
+
+        try:
+            expected = [search(order_by, engine) for order_by, engine in searches]
+            topology_key = railway_data_cache.get('2021-01-15').topology_key
+
+            # sorted first, the station shifts the ids of every other station, but doesn't open in the epoch
+            station = Station(name='Aaa Future')
+            db.session.add(station)
+            db.session.flush()
+            line = Line.query.filter_by(code='CC').one()
+            db.session.add(StationBelong(line_id=line.id, station_id=station.id, station_code='CC99', sequence=99,
+                                         opened_at='2030-01-01'))
+            db.session.commit()
+
+            self.assertNotEqual(railway_data_cache.get('2021-01-15').topology_key, topology_key)
+            self.assertEqual([search(order_by, engine) for order_by, engine in searches], expected)
+        finally:
+            db.session.remove()
+            db.get_engine().dispose()
+            os.remove(path)
@@ -0,0 +1,114 @@
+import unittest
+from datetime import datetime
+
+from app import create_app, db
+from services.bfs import MetroLineSearch
+from services.reachable import EarliestArrivalSearch, ReachableSearch
+from services.snapshot import get_railway_data
+from services.time_types import minute_of_week
+
+
+class ReachableSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        self.railway_data = get_railway_data('2021-01-15')
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _reachable(self, time, within, from_station='Holland Village'):
+        return ReachableSearch(from_station, time, within, self.railway_data).generate_reachable_stations()
+
+    def test_within_minutes(self):
+        result = self._reachable('2021-01-15 13:00', 30)
+        self.assertEqual(result['result'], 'success')
+        stations = {station['name']: station for station in result['stations']}
+        self.assertTrue(all(station['time_cost'] <= 30 for station in stations.values()))
+        self.assertNotIn('Holland Village', stations)
+        self.assertEqual(stations['Buona Vista'], {'name': 'Buona Vista', 'arrival_time': '2021-01-15 13:10',
+                                                   'time_cost': 10, 'total_station': 1, 'total_interchange': 0})
+        self.assertLess(len(stations), len(self._reachable('2021-01-15 13:00', 60)['stations']))
+
+    def test_not_later_than_searched_routes(self):
+        for time in ('2021-01-15 13:00', '2021-01-15 17:50', '2021-01-15 22:30'):
+            stations = {station['name']: station for station in self._reachable(time, 120)['stations']}
+            for to_station in ('Bugis', 'Little India', 'Bishan'):
+                search = MetroLineSearch('Holland Village', to_station, time, 'time', self.railway_data, 'dijkstra')
+                routes = search.generate_railway_routes()['suggest_routes']
+                self.assertLessEqual(stations[to_station]['time_cost'], routes[0]['total_cost'])
+
+    def test_night_time_skips_closed_lines(self):
+        day = {station['name'] for station in self._reachable('2021-01-15 13:00', 600)['stations']}
+        # until 05:30, before the closed lines open again
+        night = {station['name'] for station in self._reachable('2021-01-15 22:30', 420)['stations']}
+        self.assertLess(night, day)
+
+    def test_line_opening_during_the_trip(self):
+        # the Downtown line opens at 06:00, on the way by the East West, North South and North East lines,
+        # an earlier arrival at Chinatown can't board it and rides on
+        stations = {station['name']: station for station in self._reachable('2021-01-15 05:00', 300, 'Tanjong Pagar')
+                    ['stations']}
+        self.assertEqual(stations['Bencoolen']['time_cost'], 107)
+
+    def test_closed_lines_are_not_waited_for(self):
+        # the Downtown line closes at 22:00 before it can be reached from Jurong East, it only opens again at 06:00
+        stations = {station['name']: station for station in self._reachable('2021-01-15 20:50', None, 'Jurong East')
+                    ['stations']}
+        self.assertNotIn('Bukit Panjang', stations)
+        self.assertTrue(all(station['time_cost'] < 9 * 60 + 10 for station in stations.values()))
+
+    def test_time_expanded_search_only_when_lines_open_or_costs_drop(self):
+        network = self.railway_data.network
+        for time, fallback in ((datetime(2021, 1, 15, 13, 0), False), (datetime(2021, 1, 15, 22, 30), True)):
+            start_minute = minute_of_week(time)
+            for from_station in ('Holland Village', 'Tanjong Pagar', 'Bishan'):
+                start = network.station_ids[from_station]
+                graph_search = EarliestArrivalSearch(network)
+                reached = graph_search.run(start, start_minute)
+                self.assertEqual(graph_search.fallback, fallback)
+                reachable = network.get_reachable_stations(start) - {start}
+                self.assertEqual(graph_search._run_time_expanded(start, start_minute, None, reachable), reached)
+
+    def test_dominated_labels_are_dropped(self):
+        # the time expanded search only keeps the labels of a state an earlier one doesn't dominate until the last
+        # arrival of the first search, it reaches the stations as early as keeping every minute
+        network = self.railway_data.network
+        for time in (datetime(2021, 1, 15, 5, 30), datetime(2021, 1, 15, 8, 30), datetime(2021, 1, 15, 21, 50)):
+            start_minute = minute_of_week(time)
+            pruned = 0
+            for start in range(0, len(network.station_names), 5):
+                graph_search = EarliestArrivalSearch(network)
+                reached = graph_search.run(start, start_minute)
+                if graph_search.fallback:
+                    pruned += graph_search.pruned
+                reachable = network.get_reachable_stations(start) - {start}
+                expected = EarliestArrivalSearch(network)._settle_reached_time_expanded(start, start_minute, None,
+                                                                                        reachable)
+                self.assertEqual(reached, expected)
+            self.assertGreater(pruned, 0)
+
+    def test_search_stops_at_the_targets(self):
+        network = self.railway_data.network
+        start = network.station_ids['Holland Village']
+        for time in (datetime(2021, 1, 15, 13, 0), datetime(2021, 1, 15, 21, 30)):
+            reached = EarliestArrivalSearch(network).run(start, minute_of_week(time))
+            targets = {network.station_ids[name] for name in ('Bugis', 'Bishan')}
+            graph_search = EarliestArrivalSearch(network)
+            targeted = graph_search.run(start, minute_of_week(time), targets=targets)
+            self.assertLess(len(targeted), len(reached))
+            for station in targets:
+                self.assertEqual(targeted[station], reached[station])
+
+    def test_unknown_station(self):
+        result = self._reachable('2021-01-15 13:00', 30, 'Nowhere')
+        self.assertEqual(result['result'], 'failed')
+
+    def test_reachable_by_api(self):
+        response = self.client.get('/api/reachable?from=holland village&time=2021-01-15 13:00&within=20')
+        data = response.get_json()
+        self.assertEqual(data['result'], 'success')
+        self.assertTrue(all(station['time_cost'] <= 20 for station in data['stations']))
@@ -0,0 +1,84 @@
+import unittest
+
+from app import create_app, db
+from services.bfs import MetroLineSearch
+from services.response_cache import SearchResultCache
+from services.snapshot import get_railway_data, invalidate_railway_data
+
+
+class SearchResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        self.cache = SearchResultCache(max_size=2, ttl=60, time_bucket=60)
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _search(self, time, order_by='time', cache=True, from_station='Holland Village', to_station='Bugis',
+                engine='dijkstra'):
+        railway_data = get_railway_data(time[:10])
+        search = MetroLineSearch(from_station, to_station, time, order_by, railway_data, engine,
+                                 result_cache=self.cache if cache else None)
+        return search.generate_railway_routes()
+
+    def test_same_time_type_segment_is_a_hit(self):
+        first = self._search('2021-01-15 13:00')
+        second = self._search('2021-01-15 13:20')
+        self.assertEqual(first, second)
+        self.assertEqual(second, self._search('2021-01-15 13:20', cache=False))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+        first = self._search('2021-01-15 13:00', 'distance', engine='bfs')
+        second = self._search('2021-01-15 13:20', 'distance', engine='bfs')
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_changed_result_leaves_the_cache(self):
+        first = self._search('2021-01-15 13:00')
+        expected = self._search('2021-01-15 13:00', cache=False)
+        first['suggest_routes'][0]['take_stations'].clear()
+        second = self._search('2021-01-15 13:00')
+        self.assertIsNot(second, first)
+        self.assertEqual(second, expected)
+        second['suggest_routes'].clear()
+        self.assertEqual(self._search('2021-01-15 13:00'), expected)
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_route_crossing_time_type_is_not_reused(self):
+        self._search('2021-01-15 17:00')
+        # the 70 minutes route departing at 17:10 ends in peak time
+        result = self._search('2021-01-15 17:10')
+        self.assertEqual(result, self._search('2021-01-15 17:10', cache=False))
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+    def test_route_crossing_time_type_is_reused_at_the_same_minute(self):
+        first = self._search('2021-01-15 17:10')
+        self.assertEqual(self._search('2021-01-15 17:10'), first)
+        self.assertEqual(self._search('2021-01-15 17:10'), first)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (2, 1, 1))
+
+    def test_lru_eviction(self):
+        self._search('2021-01-15 13:00')
+        self._search('2021-01-15 13:00', to_station='Bishan')
+        self._search('2021-01-15 13:00', to_station='Dhoby Ghaut')
+        stats = self.cache.stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+    def test_invalidated_with_snapshots(self):
+        self._search('2021-01-15 13:00')
+        invalidate_railway_data()
+        self._search('2021-01-15 13:00')
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 0)
+        self.assertEqual(stats['invalidations'], 1)
+
+    def test_stats_api(self):
+        response = self.client.get('/api/search/cache')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hits', response.get_json())
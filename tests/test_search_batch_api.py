@@ -0,0 +1,51 @@
+import json
+import unittest
+
+from app import create_app, db
+
+
+class SearchBatchAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _post(self, queries, engine='bfs'):
+        response = self.client.post('/api/search/batch?engine={}'.format(engine), data=json.dumps(queries),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.get_data(as_text=True))
+
+    def _get(self, query, engine='bfs'):
+        url = '/api/search?from={}&to={}&time={}&order_by={}&engine={}'.format(
+            query['from'], query['to'], query['time'], query['order_by'], engine)
+        return json.loads(self.client.get(url).get_data(as_text=True))
+
+    def test_results_match_single_search(self):
+        queries = [
+            {'from': 'Holland Village', 'to': 'Bugis', 'time': '2021-01-15 13:00', 'order_by': 'distance'},
+            {'from': 'holland village', 'to': 'bugis', 'time': '2021-01-15 22:00', 'order_by': 'time'},
+            {'from': 'Boon Lay', 'to': 'Little India', 'time': '2021-01-15 20:40', 'order_by': 'time'},
+            {'from': 'Boon Lay', 'to': 'Bugis', 'time': '2021-01-15 20:40', 'order_by': 'time'},
+            {'from': 'Yish', 'to': 'Cashew', 'time': '2021-01-15 13:00', 'order_by': 'distance'},
+        ]
+        for engine in ('bfs', 'dijkstra'):
+            json_response = self._post({'queries': queries}, engine)
+            self.assertEqual(json_response['result'], 'success')
+            self.assertEqual(len(json_response['results']), len(queries))
+            for query, result in zip(queries, json_response['results']):
+                self.assertEqual(result, self._get(query, engine))
+
+    def test_invalid_queries(self):
+        json_response = self._post({'queries': 'Bugis'})
+        self.assertEqual(json_response['result'], 'failed')
+
+        json_response = self._post([{'from': 'Bugis', 'to': 'Bishan', 'time': 'today'}, 'Bugis'])
+        self.assertEqual(json_response['result'], 'success')
+        self.assertEqual(json_response['results'][0]['description'], 'today is not a valid time')
+        self.assertEqual(json_response['results'][1]['result'], 'failed')
@@ -0,0 +1,53 @@
+import unittest
+
+from common.serializable import Serializable
+from domains.domains import Route, SuggestRoute
+
+
+class PlainRoute(Serializable):
+    def __init__(self):
+        self.line = 'CC'
+        self.take_stations = [{'code': 'CC21', 'name': 'Holland Village'}]
+        self.time_cost = 10
+
+
+class FormattedRoute(Serializable):
+    __slots__ = ('line', 'time_cost')
+
+    def __init__(self):
+        self.line = 'cc'
+        self.time_cost = 10
+
+    def get_line(self):
+        return self.line.upper()
+
+
+class SerializableTestCase(unittest.TestCase):
+    def test_compiled_serializer_matches_reflective_one(self):
+        route = Route()
+        route.line = 'CC'
+        route.direction = 'HarbourFront->Dhoby Ghaut'
+        route.from_station = 'Holland Village'
+        route.to_station = 'Botanic Gardens'
+        route.take_stations = [{'code': 'CC21', 'name': 'Holland Village'}, {'code': 'CC19', 'name': 'Botanic Gardens'}]
+        route.time_cost = 20
+        suggest_route = SuggestRoute()
+        suggest_route.summary = 'summary'
+        suggest_route.take_stations = list(route.take_stations)
+        suggest_route.routes = [route]
+
+        expected = {}
+        for field in SuggestRoute.__slots__:
+            expected[field] = Serializable._serialize_complex_field(suggest_route, getattr(suggest_route, field))
+        self.assertEqual(suggest_route.serialize(), expected)
+        self.assertFalse(hasattr(suggest_route, '__dict__'))
+
+    def test_format_method(self):
+        self.assertEqual(FormattedRoute().serialize(), {'line': 'CC', 'time_cost': 10})
+
+    def test_class_without_slots(self):
+        self.assertEqual(PlainRoute().serialize(), {
+            'line': 'CC',
+            'take_stations': [{'code': 'CC21', 'name': 'Holland Village'}],
+            'time_cost': 10
+        })
@@ -0,0 +1,200 @@
+import unittest
+
+from app import create_app, db
+from services.bfs import MetroLineSearch
+from services.dijkstra import StationGraphSearch
+from services.snapshot import get_railway_data
+from services.time_types import parse_minute
+
+
+class StationGraphSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        self.railway_data = get_railway_data('2021-01-15')
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _search(self, from_station, to_station, time, order_by, engine, revisit_lines=False):
+        search = MetroLineSearch(from_station, to_station, time, order_by, self.railway_data, engine,
+                                 revisit_lines=revisit_lines)
+        return search.generate_railway_routes()
+
+    def _assert_same_best_route(self, from_station, to_station, time, order_by):
+        expected = self._search(from_station, to_station, time, order_by, 'bfs')
+        result = self._search(from_station, to_station, time, order_by, 'dijkstra')
+        self.assertEqual(result['result'], 'success')
+        summaries = [route['summary'] for route in result['suggest_routes']]
+        self.assertIn(expected['suggest_routes'][0]['summary'], summaries)
+
+    def test_distance(self):
+        self._assert_same_best_route('Holland Village', 'Bugis', '2021-01-15 13:00', 'distance')
+        self._assert_same_best_route('Boon Lay', 'Little India', '2021-01-15 13:00', 'distance')
+
+    def test_line_ridden_again(self):
+        # bfs doesn't board a line it has left, nor does dijkstra unless revisit_lines is set,
+        # then it leaves the Downtown line at MacPherson and boards it again at Bugis
+        expected = self._search('Tampines West', 'Newton', '2021-01-15 13:00', 'distance', 'bfs')
+        self.assertEqual([route['line'] for route in expected['suggest_routes'][0]['routes']], ['DT'])
+        self.assertEqual(expected['suggest_routes'][0]['total_station'], 20)
+
+        for order_by in ('distance', 'time'):
+            result = self._search('Tampines West', 'Newton', '2021-01-15 13:00', order_by, 'dijkstra')
+            self.assertEqual([route['line'] for route in result['suggest_routes'][0]['routes']], ['DT', 'CC', 'NS'])
+            self.assertEqual(result['suggest_routes'][0]['total_station'], 14)
+
+            result = self._search('Tampines West', 'Newton', '2021-01-15 13:00', order_by, 'dijkstra', True)
+            self.assertEqual([route['line'] for route in result['suggest_routes'][0]['routes']],
+                             ['DT', 'CC', 'EW', 'DT'])
+            self.assertEqual(result['suggest_routes'][0]['total_station'], 13)
+
+        response = self.client.get('/api/search?from=Tampines West&to=Newton&engine=dijkstra&revisit_lines=true'
+                                   '&time=2021-01-15 13:00')
+        self.assertEqual(response.get_json()['suggest_routes'][0]['total_station'], 13)
+
+    def test_lines_boarded_once(self):
+        # without revisit_lines, no route is longer than the bfs one
+        station_names = sorted(self.railway_data.station_name_dict)
+        for from_station in station_names[::11]:
+            for to_station in station_names[::3]:
+                if from_station == to_station:
+                    continue
+                expected = self._search(from_station, to_station, '2021-01-15 13:00', 'distance', 'bfs')
+                result = self._search(from_station, to_station, '2021-01-15 13:00', 'distance', 'dijkstra')
+                self.assertEqual(result['result'], expected['result'])
+                if result['result'] != 'success':
+                    continue
+                self.assertLessEqual(result['suggest_routes'][0]['total_station'],
+                                     expected['suggest_routes'][0]['total_station'])
+                for route in result['suggest_routes']:
+                    lines = [leg['line'] for leg in route['routes']]
+                    self.assertEqual(len(lines), len(set(lines)))
+
+    def test_time_in_non_peak_time(self):
+        self._assert_same_best_route('Holland Village', 'Bugis', '2021-01-15 13:00', 'time')
+
+    def test_time_in_night_time(self):
+        self._assert_same_best_route('Holland Village', 'Bugis', '2021-01-15 22:00', 'time')
+
+    def test_time_in_peak_time(self):
+        self._assert_same_best_route('Boon Lay', 'Little India', '2021-01-15 06:00', 'time')
+
+    def test_time_crossing_time_types(self):
+        self._assert_same_best_route('Boon Lay', 'Little India', '2021-01-15 20:40', 'time')
+
+    def test_time_until_lines_open_again(self):
+        # departing at 05:30 the Downtown line opens at 06:00, riding out of MacPherson and back only waits for it
+        network = self.railway_data.network
+        graph_search = StationGraphSearch(network)
+        graph_search.search(network.station_ids['MacPherson'], network.station_ids['Chinatown'],
+                            4 * 1440 + parse_minute('05:30'), 'time')
+        self.assertTrue(graph_search.fallback)
+        self._assert_same_best_route('MacPherson', 'Chinatown', '2021-01-15 05:30', 'time')
+
+    def test_time_without_waiting_for_closed_lines(self):
+        # departing at 20:50 on a Friday, the lines closed at 22:00 only open again at 06:00,
+        # a route riding the other lines until then is no route
+        expected = self._search('Bayfront', 'Changi Airport', '2021-01-15 20:50', 'time', 'bfs')
+        self.assertEqual(expected['suggest_routes'][0]['total_cost'], 780)
+        for engine in ('dijkstra', 'bidirectional', 'patterns'):
+            for from_station, to_station in (('Bayfront', 'Changi Airport'), ('Jurong East', 'Bukit Panjang')):
+                result = self._search(from_station, to_station, '2021-01-15 20:50', 'time', engine)
+                self.assertEqual(result['description'], 'Sorry, no route found !')
+
+        network = self.railway_data.network
+        graph_search = StationGraphSearch(network)
+        routes = graph_search.search(network.station_ids['Jurong East'], network.station_ids['Bukit Panjang'],
+                                     4 * 1440 + parse_minute('20:50'), 'time')
+        self.assertTrue(graph_search.fallback)
+        self.assertEqual(routes, [])
+
+    def test_time_expanded_search_agrees_when_exact(self):
+        network = self.railway_data.network
+        start = network.station_ids['Boon Lay']
+        for end in (network.station_ids['Little India'], network.station_ids['Changi Airport']):
+            graph_search = StationGraphSearch(network)
+            goals = graph_search.run(start, 4 * 1440 + parse_minute('13:00'), 'time', end)
+            routes = graph_search.collect_routes(goals[end][1])
+            expanded_search = StationGraphSearch(network)
+            expanded_goals = expanded_search._run_time_expanded(start, 4 * 1440 + parse_minute('13:00'), end)
+            expanded_search.fallback = True
+            self.assertEqual(expanded_goals[end][0], goals[end][0])
+            self.assertEqual(sorted(expanded_search.collect_routes(expanded_goals[end][1])), sorted(routes))
+
+    def test_dominated_labels_are_dropped(self):
+        # the time expanded search only keeps the labels of a state an earlier one doesn't dominate until the latest
+        # arrival of the routes, it finds the same routes as keeping every minute
+        network = self.railway_data.network
+        station_number = len(network.station_names)
+        for minute, revisit_lines in (('05:30', True), ('21:50', True), ('21:50', False)):
+            start_time = 4 * 1440 + parse_minute(minute)
+            pruned = 0
+            for start in range(0, station_number, 17):
+                for end in range(station_number):
+                    if start == end:
+                        continue
+                    graph_search = StationGraphSearch(network, revisit_lines=revisit_lines)
+                    routes = graph_search.search(start, end, start_time, 'time')
+                    if graph_search.fallback:
+                        pruned += graph_search.pruned
+                    expanded_search = StationGraphSearch(network, revisit_lines=revisit_lines)
+                    expanded_search.fallback = True
+                    bounds = expanded_search._get_bounds(start, end)
+                    goals = {} if bounds is None else \
+                        expanded_search._settle_goals_time_expanded(start, start_time, end, bounds)
+                    expected = expanded_search.collect_routes(goals[end][1]) if end in goals else []
+                    self.assertEqual(sorted(routes), sorted(expected))
+            self.assertGreater(pruned, 0)
+
+    def test_tied_routes_are_all_returned(self):
+        result = self._search('Dhoby Ghaut', 'Promenade', '2021-01-15 13:00', 'distance', 'dijkstra')
+        total_stations = {route['total_station'] for route in result['suggest_routes']}
+        self.assertEqual(len(total_stations), 1)
+        self.assertEqual(result['description'], '{} route(s) found'.format(len(result['suggest_routes'])))
+
+    def test_engine_selected_by_api(self):
+        response = self.client.get('/api/search?from=Holland Village&to=Bugis&engine=dijkstra')
+        self.assertEqual(response.get_json()['result'], 'success')
+
+    def test_distance_table_matches_live_search(self):
+        from services.distance_table import distance_table_cache
+
+        table = distance_table_cache.get(self.railway_data)
+        network = self.railway_data.network
+        for from_station, to_station in [('Holland Village', 'Bugis'), ('Dhoby Ghaut', 'Promenade'),
+                                         ('Boon Lay', 'Changi Airport'), ('Punggol', 'HarbourFront')]:
+            start = network.station_ids[from_station]
+            end = network.station_ids[to_station]
+            live = StationGraphSearch(network).search(start, end, 0, 'distance')
+            self.assertEqual(live, table.get_routes(start, end))
+            distance = sum(abs(network.node_position[from_node] - network.node_position[to_node])
+                           for from_node, to_node in live[0])
+            self.assertEqual(table.get_distance(start, end), distance)
+
+        # same topology and opening epoch, the table is shared
+        other_day = get_railway_data('2021-01-16')
+        self.assertIs(table, distance_table_cache.get(other_day))
+        legs = table.get_routes(network.station_ids['Holland Village'], network.station_ids['Bugis'])[0]
+        route = other_day.network.to_station2station(other_day, legs)
+        self.assertIs(route[0].line, other_day.line_name_dict['CC'])
+        self.assertIs(route[-1].to_station, other_day.station_name_dict['Bugis'])
+
+    def test_compact_network(self):
+        network = self.railway_data.network
+        names = network.station_names
+        holland_village = network.get_nodes(network.station_ids['Holland Village'])
+        self.assertEqual(len(holland_village), 1)
+        node = holland_village[0]
+        self.assertEqual(network.line_names[network.node_line[node]], 'CC')
+        neighbours = network.ride_targets[network.ride_offsets[node]:network.ride_offsets[node + 1]]
+        self.assertEqual(sorted(names[network.node_station[n]] for n in neighbours), ['Buona Vista', 'Farrer Road'])
+
+        buona_vista = network.get_nodes(network.station_ids['Buona Vista'])
+        for node in buona_vista:
+            targets = network.interchange_targets[network.interchange_offsets[node]:network.interchange_offsets[node + 1]]
+            self.assertEqual(len(targets), len(buona_vista) - 1)
+        self.assertGreater(network.nbytes(), 0)
@@ -0,0 +1,46 @@
+import unittest
+from datetime import datetime
+
+from domains.domains import LineTimeCost
+from services.time_types import TimeTypeTable, MINUTES_PER_WEEK
+
+
+def time_type(name, weekdays, time_intervals):
+    cost = LineTimeCost(name, 0)
+    cost.weekdays = weekdays.split(',') if weekdays else []
+    cost.time_intervals = [tuple(interval.split('-')) for interval in time_intervals.split(',')] \
+        if time_intervals else []
+    return cost
+
+
+class TimeTypeTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.table = TimeTypeTable([
+            time_type('Peak', 'Monday,Tuesday,Wednesday,Thursday,Friday', '06:00-09:00,18:00-21:00'),
+            time_type('Night', 'Monday,Tuesday,Wednesday,Thursday,Friday,Saturday,Sunday', '22:00-23:59,00:00-06:00'),
+            time_type('Non-Peak', 'Monday,Tuesday,Wednesday,Thursday,Friday,Saturday,Sunday', ''),
+        ])
+
+    def _get(self, time):
+        return self.table.get_time_type(datetime.strptime(time, '%Y-%m-%d %H:%M'))
+
+    def test_table_covers_the_week(self):
+        self.assertEqual(len(self.table.table), MINUTES_PER_WEEK)
+
+    def test_interval_boundaries(self):
+        # 2021-01-15 is a Friday
+        self.assertEqual(self._get('2021-01-15 05:59'), 'Night')
+        self.assertEqual(self._get('2021-01-15 06:00'), 'Peak')
+        self.assertEqual(self._get('2021-01-15 08:59'), 'Peak')
+        self.assertEqual(self._get('2021-01-15 09:00'), 'Non-Peak')
+        self.assertEqual(self._get('2021-01-15 21:00'), 'Non-Peak')
+        self.assertEqual(self._get('2021-01-15 22:00'), 'Night')
+        self.assertEqual(self._get('2021-01-15 23:59'), 'Non-Peak')
+
+    def test_weekdays_are_respected(self):
+        self.assertEqual(self._get('2021-01-16 07:00'), 'Non-Peak')
+        self.assertEqual(self._get('2021-01-16 23:00'), 'Night')
+
+        table = TimeTypeTable([time_type('Peak', 'Saturday,Sunday', '06:00-09:00')])
+        self.assertEqual(table.get_time_type(datetime(2021, 1, 16, 7, 0)), 'Peak')
+        self.assertEqual(table.get_time_type(datetime(2021, 1, 11, 7, 0)), 'Non-Peak')
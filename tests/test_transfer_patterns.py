@@ -0,0 +1,141 @@
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from app import create_app, db
+from services.bfs import MetroLineSearch
+from services.dijkstra import StationGraphSearch
+from services.snapshot import get_railway_data
+from services.time_types import parse_minute
+from services.transfer_patterns import TransferPatternSearch, TransferPatternsCache, transfer_patterns_cache
+
+
+class TransferPatternsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        self.railway_data = get_railway_data('2021-01-15')
+        self.network = self.railway_data.network
+        self.transfer_patterns = transfer_patterns_cache.get(self.railway_data)
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _compare(self, start_time, stride=9):
+        fallbacks = 0
+        station_number = len(self.network.station_names)
+        for start in range(0, station_number, stride):
+            for end in range(station_number):
+                if start == end:
+                    continue
+                expected = StationGraphSearch(self.network).search(start, end, start_time, 'time')
+                pattern_search = TransferPatternSearch(self.transfer_patterns, self.network,
+                                                       self.railway_data.time_type_table)
+                routes = pattern_search.search(start, end, start_time)
+                self.assertEqual(sorted(routes), sorted(expected))
+                fallbacks += pattern_search.fallback
+        return fallbacks
+
+    def test_least_recently_used_patterns_are_dropped(self):
+        cache = TransferPatternsCache(max_size=2)
+        snapshots = [SimpleNamespace(topology_key=key, network=self.network) for key in ('first', 'second', 'third')]
+        first = cache.get(snapshots[0])
+        cache.get(snapshots[1])
+        self.assertIs(cache.get(snapshots[0]), first)
+        cache.get(snapshots[2])
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get(snapshots[0]), first)
+
+    def test_built_patterns_are_answered_while_others_build(self):
+        cache = TransferPatternsCache()
+        built = SimpleNamespace(topology_key='built', network=self.network)
+        first = cache.get(built)
+        started = threading.Event()
+        release = threading.Event()
+
+        def build(network):
+            started.set()
+            release.wait(10)
+            return first
+
+        with mock.patch('services.transfer_patterns.TransferPatterns', side_effect=build):
+            thread = threading.Thread(target=cache.get, args=(SimpleNamespace(topology_key='slow', network=self.network),))
+            thread.start()
+            answered = []
+            reader = threading.Thread(target=lambda: answered.append(cache.get(built)))
+            try:
+                self.assertTrue(started.wait(10))
+                reader.start()
+                reader.join(5)
+                # answered while the other key is still building
+                self.assertEqual(answered, [first])
+            finally:
+                release.set()
+                thread.join()
+                reader.join()
+        self.assertEqual(len(cache), 2)
+
+    def test_patterns_are_shared(self):
+        self.assertIs(self.transfer_patterns, transfer_patterns_cache.get(get_railway_data('2021-12-31')))
+        # night time closes lines, its patterns are kept apart
+        self.assertEqual(len(set(self.transfer_patterns.open_sets)), 2)
+
+    def test_patterns_on_the_line_graph(self):
+        # the East West line meets the North South line at City Hall, Raffles Place and Jurong East
+        open_set = frozenset().union(*self.transfer_patterns.open_sets)
+        line_names = self.network.line_names
+        patterns = self.transfer_patterns.get_patterns(open_set, line_names.index('EW'), line_names.index('NS'))
+        interchanges = sorted(self.network.station_names[stations[0]]
+                              for _, _, _, lines, stations in patterns if len(lines) == 2)
+        self.assertEqual(interchanges, ['City Hall', 'Jurong East', 'Raffles Place'])
+        for _, _, _, lines, stations in patterns:
+            self.assertEqual((lines[0], lines[-1]), (line_names.index('EW'), line_names.index('NS')))
+            self.assertEqual(len(stations), len(lines) - 1)
+
+    def test_same_routes_as_dijkstra_in_peak_and_non_peak_time(self):
+        # Friday, the lines are open all day long, no search is needed
+        for minute in ('10:00', '13:00'):
+            self.assertEqual(self._compare(4 * 1440 + parse_minute(minute)), 0)
+
+    def test_routes_tied_across_time_types(self):
+        # a route arriving later at an interchange may catch up once the peak ends, dijkstra searches the time
+        # expanded graph then, the patterns are costed as a whole and keep both tied routes without searching
+        for minute in ('07:30', '17:50'):
+            self.assertEqual(self._compare(4 * 1440 + parse_minute(minute)), 0)
+        pattern_search = TransferPatternSearch(self.transfer_patterns, self.network, self.railway_data.time_type_table)
+        routes = pattern_search.search(self.network.station_ids['Tanjong Pagar'],
+                                       self.network.station_ids['Beauty World'], 4 * 1440 + parse_minute('07:30'))
+        self.assertEqual(len(routes), 2)
+        self.assertFalse(pattern_search.fallback)
+
+    def test_same_routes_as_dijkstra_in_night_time(self):
+        # the long routes may board lines after they open at 06:00, they are searched
+        self._compare(4 * 1440 + parse_minute('23:30'))
+        self._compare(4 * 1440 + parse_minute('21:50'))
+
+    def test_routes_until_lines_open_again(self):
+        # departing at 20:50, the lines closed at 22:00 only open again at 06:00, they are not waited for,
+        # only the patterns boarding them after 22:00 are searched
+        station_number = len(self.network.station_names)
+        queries = len(range(0, station_number, 17)) * (station_number - 1)
+        self.assertLess(self._compare(4 * 1440 + parse_minute('20:50'), stride=17), queries / 4)
+        response = self.client.get('/api/search?from=Bayfront&to=Changi Airport&order_by=time&engine=patterns'
+                                   '&time=2021-01-15 20:50')
+        self.assertEqual(response.get_json()['suggest_routes'], [])
+        reachable = self.client.get('/api/reachable?from=Bayfront&time=2021-01-15 20:50&within=1440').get_json()
+        self.assertNotIn('Changi Airport', [station['name'] for station in reachable['stations']])
+
+    def test_engine_selected_by_api(self):
+        response = self.client.get('/api/search?from=Boon Lay&to=Little India&order_by=time&engine=patterns'
+                                   '&time=2021-01-15 13:00')
+        expected = MetroLineSearch('Boon Lay', 'Little India', '2021-01-15 13:00', 'time', self.railway_data,
+                                   'dijkstra').generate_railway_routes()
+        self.assertEqual(response.get_json(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
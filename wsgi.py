@@ -0,0 +1,12 @@
+import os
+
+from app import create_app
+from services.snapshot import preload_railway_data, prepare_fork
+
+# entry point of threaded / preforking servers, eg. gunicorn --preload --workers 4 --threads 8 wsgi:app
+# the network snapshot of today is built here, before the workers are forked.
+# the tables are expected to exist, RAILWAY_CREATE_ALL=1 creates the missing ones
+create_all = (os.environ.get('RAILWAY_CREATE_ALL') or '').strip().lower() in ('1', 'true', 'yes', 'on')
+app = create_app(os.environ.get('RAILWAY_CONFIG') or 'default', create_all=create_all)
+preload_railway_data(app)
+prepare_fork(app)